@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Compare the one-pass image reference scanner with the old four-pass parser."""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from genrejinn.storage.images import scan_image_references
+
+
+WORDS = ("rocket", "slothrop", "pirate", "banana", "zone", "light", "the", "of", "and", "a",
+         "kenosha", "kid", "pointsman", "map", "v-2", "london", "1944", "paranoia")
+
+
+def four_pass_references(text: str) -> list:
+    """The parser as it was: four patterns compiled per call, list-based dedupe."""
+    image_references = []
+    patterns = [
+        r'https?://[^\s]+\.(?:jpg|jpeg|png|gif|webp|svg)(?:\?[^\s]*)?',
+        r'!\[[^\]]*\]\(([^\)]+\.(?:jpg|jpeg|png|gif|webp|svg)(?:\?[^\)]*)?)\)',
+        r'<img[^>]+src=["\']([^"\']+\.(?:jpg|jpeg|png|gif|webp|svg)(?:\?[^"\']*)?)["\'][^>]*>',
+        r'[^\s]+\.(?:jpg|jpeg|png|gif|webp|svg)'
+    ]
+    for pattern in patterns:
+        for match in re.finditer(pattern, text, re.IGNORECASE):
+            url = match.group(1) if match.groups() else match.group(0)
+            if url not in image_references:
+                image_references.append(url)
+    return image_references
+
+
+def make_note(rng: random.Random, image_rate: float, images: int) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(5, 80))]
+    if rng.random() < image_rate:
+        for _ in range(rng.randint(1, 3)):
+            n = rng.randrange(images)
+            reference = rng.choice((
+                f"https://example.com/img/{n}.jpg",
+                f"https://cdn.example.org/{n}.png?w=400",
+                f"![figure {n}](https://example.com/fig/{n}.png)",
+                f'<img alt="x" src="https://example.com/tag/{n}.gif">',
+                f"scans/page-{n}.jpeg",
+            ))
+            words.insert(rng.randrange(len(words) + 1), reference)
+    return " ".join(words)
+
+
+def bench(func, texts: list, repeat: int) -> tuple:
+    best = float('inf')
+    found = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = sum(len(func(text)) for text in texts)
+        best = min(best, time.perf_counter() - start)
+    return best, found
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--notes', type=int, default=20000, help='Notes in the corpus (default: 20000)')
+    parser.add_argument('--image-rate', type=float, default=0.2,
+                        help='Fraction of notes with images (default: 0.2)')
+    parser.add_argument('--images', type=int, default=5000, help='Distinct images (default: 5000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case, best is kept (default: 3)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    notes = [make_note(rng, args.image_rate, args.images) for _ in range(args.notes)]
+    corpus = ["\n".join(notes)]
+    size = sum(map(len, notes))
+    print(f"{len(notes)} notes, {size / 1024:.0f} KiB")
+
+    for label, texts in (("per note", notes), ("whole corpus", corpus)):
+        old_time, old_found = bench(four_pass_references, texts, args.repeat)
+        new_time, new_found = bench(scan_image_references, texts, args.repeat)
+        print(f"{label:>13}: four-pass {old_time * 1000:9.1f} ms ({old_found} refs)   "
+              f"one-pass {new_time * 1000:8.1f} ms ({new_found} refs)   "
+              f"{old_time / new_time:5.1f}x")
+
+    # The old parser also reports fragments where the bare-file pattern matched
+    # inside another reference, such as '![figure 1](https://...png' or a URL
+    # without its query string; everything else must be found
+    missing = 0
+    for note in notes:
+        new = scan_image_references(note)
+        missing += sum(1 for ref in four_pass_references(note)
+                       if not re.search(r'[()\[\]<>"]', ref) and not any(ref in found for found in new))
+    print(f"References the old parser found that the scanner misses: {missing}")
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Fetch note images from a slow local HTTP server, serially and through the pool."""
+
+import argparse
+import base64
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from genrejinn.storage.images import ImageManager
+
+
+# 1x1 transparent PNG
+PIXEL = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII='
+)
+
+
+class SlowImageServer(ThreadingHTTPServer):
+    """Serves the same PNG for every path after a delay, and records concurrency per host."""
+
+    daemon_threads = True
+
+    def __init__(self, delay: float):
+        super().__init__(('127.0.0.1', 0), SlowImageHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = Counter()
+        self.peak = Counter()
+        self.connections = {}  # {host: set of client ports}
+        self.requests = 0
+
+
+class SlowImageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        host = self.headers.get('Host', '')
+        with server.lock:
+            server.requests += 1
+            server.active[host] += 1
+            server.peak[host] = max(server.peak[host], server.active[host])
+            server.connections.setdefault(host, set()).add(self.client_address[1])
+        try:
+            time.sleep(server.delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(PIXEL)))
+            self.end_headers()
+            self.wfile.write(PIXEL)
+        finally:
+            with server.lock:
+                server.active[host] -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+def image_urls(port: int, count: int) -> list:
+    """URLs spread over two host names that both reach the local server."""
+    hosts = (f"127.0.0.1:{port}", f"localhost:{port}")
+    return [f"http://{hosts[i % 2]}/images/photo-{i}.png" for i in range(count)]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', type=int, default=12, help='Images to fetch (default: 12)')
+    parser.add_argument('--delay', type=float, default=0.2,
+                        help='Seconds the server waits before each response (default: 0.2)')
+    parser.add_argument('--workers', type=int, default=4, help='Download threads (default: 4)')
+    parser.add_argument('--per-host', type=int, default=2,
+                        help='Concurrent downloads per host (default: 2)')
+    args = parser.parse_args()
+
+    os.makedirs('data', exist_ok=True)
+    server = SlowImageServer(args.delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = image_urls(server.server_address[1], args.images)
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        serial = ImageManager(os.path.join(tmp, 'serial'), max_workers=1, per_host=1)
+        start = time.perf_counter()
+        for url in urls:
+            failures += serial.download_image(url) is None
+        serial_time = time.perf_counter() - start
+        serial.close()
+
+        server.peak.clear()
+        server.connections.clear()
+        pooled = ImageManager(os.path.join(tmp, 'pooled'), max_workers=args.workers, per_host=args.per_host)
+        done = threading.Event()
+        finished = []
+
+        def on_fetched(url, path):
+            finished.append(path)
+            if len(finished) == len(urls):
+                done.set()
+
+        start = time.perf_counter()
+        for url in urls:
+            pooled.fetch_image(url, on_fetched)
+        submit_time = time.perf_counter() - start
+        done.wait(timeout=60)
+        pooled_time = time.perf_counter() - start
+        failures += sum(path is None for path in finished) + len(urls) - len(finished)
+        pooled.close()
+
+    server.shutdown()
+    print(f"Serial:   {serial_time:6.2f}s for {len(urls)} images")
+    print(f"Pooled:   {pooled_time:6.2f}s ({submit_time * 1000:.1f} ms to queue them all)")
+    for host in sorted(server.peak):
+        print(f"  {host}: peak {server.peak[host]} concurrent, "
+              f"{len(server.connections[host])} connections")
+    over = [host for host, peak in server.peak.items() if peak > args.per_host]
+    if over:
+        print(f"FAIL: per-host limit exceeded on {', '.join(over)}")
+    if failures:
+        print(f"FAIL: {failures} downloads failed")
+    return 1 if over or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
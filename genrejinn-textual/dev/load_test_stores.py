@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Hammer one data directory from many writer processes and check nothing is lost."""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from genrejinn.storage import ConflictError, create_backend
+from genrejinn.storage.daemon import AnnotationDaemon
+
+
+SHARED_PAGE = 0
+
+
+def writer(args: tuple) -> dict:
+    """One process: add its own highlights and marks, and fight over a shared record."""
+    backend_name, data_dir, worker_id, records, policy, daemon_socket = args
+    os.makedirs('data', exist_ok=True)
+    backend = create_backend({'backend': 'daemon' if daemon_socket else backend_name,
+                              'data_dir': data_dir, 'daemon_socket': daemon_socket or '',
+                              'user_id': f"w{worker_id}",
+                              'conflict_policy': policy, 'namespaced': False})
+    rejected = 0
+    try:
+        for i in range(records):
+            page_num = 1 + (worker_id * records + i) % 50
+            row = worker_id * records + i
+            highlight = ((row, 0), (row, 10), f"[w{worker_id} r{i}]", f"note {i}", "yellow")
+            backend.upsert_highlight(page_num, highlight)
+            backend.upsert_mark((page_num, row, 0, "text", f"w{worker_id}-{i}", float(row)))
+
+            # Every writer edits the same record on the shared page
+            shared = ((0, 0), (0, 5), "[shared]", f"w{worker_id} edit {i}", "red")
+            for _ in range(3):
+                try:
+                    backend.upsert_highlight(SHARED_PAGE, shared)
+                    break
+                except ConflictError:
+                    rejected += 1
+                    backend.load_page_highlights(SHARED_PAGE)
+    finally:
+        backend.close()
+    return {'worker': worker_id, 'rejected': rejected}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--backend', default='binary', choices=['binary', 'sharded', 'sqlite'],
+                        help='Storage backend (default: binary)')
+    parser.add_argument('--writers', type=int, default=32,
+                        help='Concurrent writer processes (default: 32)')
+    parser.add_argument('--records', type=int, default=20,
+                        help='Highlights and marks per writer (default: 20)')
+    parser.add_argument('--policy', default='merge', choices=['merge', 'reject'],
+                        help='Conflict policy (default: merge)')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Write through an annotation daemon using --backend')
+    parser.add_argument('--data-dir', help='Data directory (default: a temporary directory)')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="genrejinn-load-")
+    daemon = AnnotationDaemon(data_dir, backend=args.backend) if args.daemon else None
+    if daemon:
+        daemon.start()
+    jobs = [(args.backend, data_dir, worker_id, args.records, args.policy,
+             str(daemon.socket_path) if daemon else None)
+            for worker_id in range(args.writers)]
+
+    start = time.perf_counter()
+    with multiprocessing.get_context('spawn').Pool(args.writers) as pool:
+        results = pool.map(writer, jobs)
+    if daemon:
+        daemon.stop()
+    elapsed = time.perf_counter() - start
+
+    backend = create_backend({'backend': args.backend, 'data_dir': data_dir, 'namespaced': False})
+    highlights = backend.load_highlights()
+    marks = backend.load_marks()
+    backend.close()
+
+    own = sum(len(items) for page, items in highlights.items() if page != SHARED_PAGE)
+    expected = args.writers * args.records
+    shared = highlights.get(SHARED_PAGE, [])
+    rejected = sum(result['rejected'] for result in results)
+
+    via = " via daemon" if args.daemon else ""
+    print(f"{args.writers} writers x {args.records} records on {args.backend}{via} "
+          f"({args.policy}) in {elapsed:.2f}s, data in {data_dir}")
+    print(f"  highlights: {own} / {expected}")
+    print(f"  marks:      {len(marks)} / {expected}")
+    print(f"  shared record: {len(shared)} copy, {rejected} writes rejected and retried")
+
+    ok = own == expected and len(marks) == expected and len(shared) == 1
+    print("OK: no lost updates" if ok else "FAILED: updates were lost")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,13 +3,11 @@
 
 import zipfile
 import re
-import pickle
 import os
-import urllib.request
 import urllib.parse
-import requests
 import argparse
 import time
+import sys
 from pathlib import Path
 from textual.app import App, ComposeResult
 from textual.containers import Horizontal, Vertical, Center, Middle
@@ -36,12 +34,32 @@ from textual.events import Click
 import webbrowser
 from syntax.manager import tree_sitter_language
 
+# Make the modular package importable when run as a script
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+from genrejinn.epub.pagination import EPUBPaginator
+from genrejinn.storage import binary
+from genrejinn.storage.backend import mark_key
+from genrejinn.storage.config import create_backend, get_storage_config
+from genrejinn.storage.decoded_images import decoded_images
+from genrejinn.storage.images import ImageManager
+from genrejinn.storage.legacy import load_legacy_pickle
+from genrejinn.storage.metrics import metrics
+from genrejinn.storage.namespace import open_namespace
+from genrejinn.storage.position import PositionStore, ReadingAnchor
+from genrejinn.storage.schema import LEGACY_VERSION, format_report, migrate, needs_upgrade
+from genrejinn.storage.worker import PersistenceWorker
+from genrejinn.ui.stats import StorageStatsScreen
+from genrejinn.utils.server import ServerManager
+
 # Try to import textual-serve for server mode
 try:
     from textual_serve.server import Server
     TEXTUAL_SERVE_AVAILABLE = True
 except ImportError:
     TEXTUAL_SERVE_AVAILABLE = False
+
+EPUB_PATH = 'bookshelf/gravitys-rainbow.epub'
+
 # Debug logging function
 def debug_log(message):
     with open('log.txt', 'a') as f:
@@ -57,9 +75,9 @@ class ClickableImage(Vertical):
         self.image_url = image_url
         self.image_path = image_path
         
-        # Create the actual image widget
+        # Create the actual image widget, from pixels decoded once per process
         if TEXTUAL_IMAGE_AVAILABLE:
-            self.image_widget = TextualImage(image_path)
+            self.image_widget = TextualImage(decoded_images.get(image_path) or image_path)
         elif IMAGEVIEW_AVAILABLE:
             self.image_widget = ImageViewer(image_path)
         else:
@@ -77,6 +95,26 @@ class ClickableImage(Vertical):
             webbrowser.open(self.image_url)
         except Exception as e:
             debug_log(f"Error opening URL: {e}")
+
+
+class PendingImage(Vertical):
+    """Placeholder for a note image that is still downloading."""
+
+    def __init__(self, image_url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.image_url = image_url
+        self.status = Static("Loading image...")
+
+    def compose(self) -> ComposeResult:
+        yield self.status
+
+    def resolve(self, image_path: str) -> None:
+        """Swap in the downloaded image, or show the URL if the download failed."""
+        if image_path:
+            self.status.remove()
+            self.mount(ClickableImage(image_path, self.image_url))
+        else:
+            self.status.update(f"Image unavailable: {self.image_url}")
     
 
 # Color management system
@@ -574,13 +612,32 @@ class EPUBReader(App):
     
     """
     
+    # Storage statistics panel
+    BINDINGS = [("f2", "show_storage_stats", "Storage stats")]
+    
     current_page = reactive(0)
     
     def __init__(self):
         super().__init__()
+        # With namespaces on (the default in server mode) each reader of each book
+        # keeps their stores in their own directory instead of the working directory
+        storage_config = get_storage_config()
+        self.namespace = open_namespace(storage_config, EPUB_PATH)
+        self.store_dir = self.namespace.user_dir if self.namespace else Path('.')
+        # Saves go through the configured backend, which locks each store and merges
+        # this session's edits with whatever other sessions saved in the meantime
+        self.storage = create_backend(self.namespace.backend_config(storage_config) if self.namespace
+                                      else dict(storage_config, data_dir=str(self.store_dir)))
+        self._saved_highlights = binary.HighlightPages()  # what the backend holds, as of the last save
+        self._saved_marks = []
+        self.paginator = EPUBPaginator()
         self.pages = self._load_epub_content()
-        # Store highlights as {page_number: [(start_pos, end_pos, text, note, color), ...]}
-        self.highlights = {}
+        # Exact place in the book (paragraph + offset + scroll), written on every move
+        self.position_store = PositionStore(self.store_dir / 'position.anchor')
+        self._resume_anchor = None
+        # Store highlights as {page_number: [(start_pos, end_pos, text, note, color), ...]},
+        # decoded from the binary store a page at a time
+        self.highlights = binary.HighlightPages()
         self.last_focused_textarea = None  # Track the last focused TextArea for save/delete operations
         self.last_clicked_mark = None  # Track the last clicked mark for delete operations
         self.last_interaction_type = None  # 'note' or 'mark' to track which was interacted with last
@@ -602,79 +659,22 @@ class EPUBReader(App):
         self.search_term = ""
         self.search_matches = []  # List of (page_number, match_position) tuples
         self.current_search_index = -1
+        # Saves run on a background thread, coalesced per file
+        self.persistence = PersistenceWorker(storage_config['save_window'])
+        # Storage metrics are dumped here from the stats panel, and on exit if a file is configured
+        self.metrics_file = storage_config['metrics_file']
+        self.metrics_dump_path = self.metrics_file or str(self.store_dir / "metrics.json")
+        # Note images download on a background pool and appear when ready
+        self.image_manager = ImageManager(self.store_dir / "images", max_bytes=storage_config['image_cache_bytes'],
+                                          max_download_bytes=storage_config['image_max_bytes'],
+                                          download_timeout=storage_config['image_timeout'])
+        self._pending_images = {}  # {url: [PendingImage, ...]} waiting on a download
+        decoded_images.max_bytes = storage_config['decoded_image_bytes']
+        # Images of notes this many pages either side of the current one are prefetched
+        self.image_prefetch_pages = storage_config['image_prefetch_pages']
         # Load existing highlights
         self.load_highlights()
     
-    def download_image(self, url: str) -> str:
-        """Download image from URL to images directory and return filepath."""
-        try:
-            # Create images directory if it doesn't exist
-            images_dir = Path("images")
-            images_dir.mkdir(exist_ok=True)
-            
-            # Get filename from URL
-            parsed_url = urllib.parse.urlparse(url)
-            filename = os.path.basename(parsed_url.path)
-            
-            # If no filename, generate one
-            if not filename or '.' not in filename:
-                filename = f"image_{hash(url) % 10000}.jpg"
-            
-            filepath = images_dir / filename
-            
-            # Check if already downloaded
-            if filepath.exists():
-                return str(filepath)
-            
-            # Download the image with proper headers
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Accept-Encoding': 'gzip, deflate',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            }
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            # Save to file
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            
-            return str(filepath)
-            
-        except Exception as e:
-            debug_log(f"Image download failed: {e}")
-            return None
-    
-    def process_note_for_images(self, note_text: str) -> tuple:
-        """Process note text to find and download image URLs, return (processed_text, image_data)."""
-        # Pattern to find URLs ending in .jpg or .png
-        image_pattern = r'https?://[^\s]+\.(?:jpg|png)(?:\?[^\s]*)?'
-        
-        image_urls = re.findall(image_pattern, note_text, re.IGNORECASE)
-        image_data = []  # List of (url, filepath) tuples
-        processed_text = note_text
-        
-        # Check if we're running in server mode (via environment variable)
-        is_server_mode = os.environ.get('GENREJINN_SERVER_MODE') == '1'
-        
-        for url in image_urls:
-            filepath = self.download_image(url)
-            if filepath:
-                image_data.append((url, filepath))
-                
-                # Hide URLs in both local and server mode now
-                debug_log(f"Hiding URL {url}")
-                processed_text = processed_text.replace(url, "")
-        
-        # Clean up extra whitespace after removing URLs
-        processed_text = re.sub(r'\s+', ' ', processed_text).strip()
-        
-        return processed_text, image_data
-    
-    
     def _reconstruct_note_with_urls(self, page_num: int, start_row: int, start_col: int, processed_text: str) -> str:
         """Reconstruct the original note with URLs from the existing highlight data."""
         # Find the existing highlight to get the original note text
@@ -684,22 +684,19 @@ class EPUBReader(App):
                 if start_pos == (start_row, start_col):
                     # Check if original note has URLs that were processed out
                     if original_note:
-                        _, original_image_data = self.process_note_for_images(original_note)
-                        if original_image_data:
-                            # The processed text might be missing URLs, keep the original URLs
-                            # But allow other text to be updated
-                            image_pattern = r'https?://[^\s]+\.(?:jpg|png)(?:\?[^\s]*)?'
-                            original_urls = re.findall(image_pattern, original_note, re.IGNORECASE)
-                            # If we have URLs in original but processed text is different, 
-                            # append URLs to the new text
-                            if original_urls and processed_text != original_note:
-                                return f"{processed_text} {' '.join(original_urls)}"
+                        # The processed text is missing the image URLs, keep the original URLs
+                        # But allow other text to be updated
+                        original_urls = self.image_manager.find_image_urls(original_note)
+                        # If we have URLs in original but processed text is different, 
+                        # append URLs to the new text
+                        if original_urls and processed_text != original_note:
+                            return f"{processed_text} {' '.join(original_urls)}"
                     break
         
         # No existing URLs found, return processed text as-is
         return processed_text
     
-    def _load_epub_paragraphs(self, epub_path: str = 'bookshelf/gravitys-rainbow.epub') -> list:
+    def _load_epub_paragraphs(self, epub_path: str = EPUB_PATH) -> list:
         """Load paragraphs from EPUB file."""
         debug_log("Starting EPUB loading...")
         
@@ -722,36 +719,14 @@ class EPUBReader(App):
         debug_log(f"Loaded {len(all_paragraphs)} paragraphs total")
         return all_paragraphs
     
-    def _create_pages(self, paragraphs: list, total_pages: int = 776) -> list:
-        """Group paragraphs into pages."""
-        if not paragraphs:
-            return []
-        
-        pages = []
-        total_paragraphs = len(paragraphs)
-        paragraphs_per_page = total_paragraphs // total_pages
-        extra_paragraphs = total_paragraphs % total_pages
-        
-        start_index = 0
-        for page_num in range(total_pages):
-            # Some pages get one extra paragraph to distribute the remainder
-            page_size = paragraphs_per_page + (1 if page_num < extra_paragraphs else 0)
-            
-            if start_index >= total_paragraphs:
-                # If we run out of paragraphs, create empty pages
-                pages.append("")
-            else:
-                end_index = min(start_index + page_size, total_paragraphs)
-                page_paragraphs = paragraphs[start_index:end_index]
-                pages.append('\n\n'.join(page_paragraphs))
-                start_index = end_index
-        
-        return pages
-    
     def _load_epub_content(self) -> list:
         """Load and process EPUB content into pages."""
-        paragraphs = self._load_epub_paragraphs()
-        pages = self._create_pages(paragraphs)
+        if self.namespace:
+            # Parsed once per book and shared by every reader
+            paragraphs = self.namespace.cached('paragraphs', self._load_epub_paragraphs)
+        else:
+            paragraphs = self._load_epub_paragraphs()
+        pages = self.paginator.create_pages(paragraphs)
         debug_log(f"Created {len(pages)} pages from paragraphs")
         return pages
     
@@ -1548,10 +1523,8 @@ class EPUBReader(App):
         highlight_part = f"[{hex_color}]{clean_text}[/{hex_color}]"
         display_text = f"{page_part} {highlight_part}"
         
-        # Process note text to hide image URLs but keep other text
-        processed_note_text = note if note else ""
-        if note:
-            processed_note_text, _ = self.process_note_for_images(note)
+        # Hide image URLs but keep other text; the images are shown above the note
+        processed_note_text = self.image_manager.strip_image_urls(note)
         
         # Create vertical layout with display text and editable textarea for note
         # Check if we're in server mode to enable link detection
@@ -1597,7 +1570,9 @@ class EPUBReader(App):
         """Process note text and return list of clickable image widgets."""
         image_widgets = []
         
-        if not note_text:
+        # Notes without images (most of them) cost one cache lookup
+        image_urls = self.image_manager.analyze_note(note_text).urls
+        if not image_urls:
             return image_widgets
         
         # Check if we're in server mode
@@ -1608,11 +1583,17 @@ class EPUBReader(App):
             debug_log("Server mode: creating image widgets while preserving URLs in text")
             
         debug_log(f"Processing images for note: {note_text[:100]}...")
-        processed_text, image_data = self.process_note_for_images(note_text)
-        debug_log(f"Found {len(image_data)} images: {image_data}")
         
-        # Create clickable image widgets for each downloaded image
-        for url, image_path in image_data:
+        # Images not downloaded yet get a placeholder that fills in when ready
+        for url in image_urls:
+            image_path = self.image_manager.display_image(url)
+            if not image_path:
+                pending = PendingImage(url)
+                pending.add_class("note-image")
+                self._pending_images.setdefault(url, []).append(pending)
+                self.image_manager.fetch_image(url, self._on_image_fetched)
+                image_widgets.append(pending)
+                continue
             try:
                 debug_log(f"Creating clickable image widget for: {image_path} -> {url}")
                 clickable_image = ClickableImage(image_path, url)
@@ -1628,14 +1609,70 @@ class EPUBReader(App):
                 
         return image_widgets
     
+    def _on_image_fetched(self, url: str, image_path: str) -> None:
+        """Called on a download thread when an image finishes."""
+        try:
+            self.call_from_thread(self._show_fetched_image, url, image_path)
+        except Exception as e:
+            debug_log(f"Could not hand image {url} to the UI: {e}")
+    
+    def _show_fetched_image(self, url: str, image_path: str) -> None:
+        """Fill in the placeholders waiting on an image."""
+        for pending in self._pending_images.pop(url, []):
+            if pending.is_attached:
+                pending.resolve(image_path)
+    
+    def _prefetch_nearby_images(self) -> None:
+        """Queue background downloads for images in notes the reader is likely to open next.
+
+        That is the notes on the pages around the current one (this page,
+        then those ahead, then those behind) and every note in the mark
+        sections that start on those pages, so expanding one finds its
+        images ready. Whatever was queued for the previous page is dropped.
+        """
+        if self.image_prefetch_pages < 0:
+            return
+        try:
+            highlights_list = self.query_one("#highlights-list", ListView)
+            if highlights_list.size.width > 4:
+                self.image_manager.display_width = highlights_list.size.width - 4
+        except Exception as e:
+            debug_log(f"Not prefetching images, notes panel not ready: {e}")
+            return
+        
+        # Nearest pages first
+        page = self.current_page
+        nearby = [page]
+        for distance in range(1, self.image_prefetch_pages + 1):
+            nearby.extend(p for p in (page + distance, page - distance) if 0 <= p < len(self.pages))
+        rank = {p: i for i, p in enumerate(nearby)}
+        
+        notes = [(page_num, start_row, start_col, note)
+                 for page_num, _, _, start_row, start_col, note, _ in self._collect_all_highlights() if note]
+        page_notes = sorted((item for item in notes if item[0] in rank), key=lambda item: rank[item[0]])
+        
+        # Sections run from a mark to the next one
+        marks = sorted(tuple(mark[:3]) for mark in self.marks if len(mark) >= 5)
+        section_notes = []
+        for i, mark_pos in enumerate(marks):
+            if mark_pos[0] not in rank:
+                continue
+            end_pos = marks[i + 1] if i + 1 < len(marks) else None
+            section_notes.extend(item for item in notes
+                                 if mark_pos < item[:3] and (end_pos is None or item[:3] < end_pos))
+        
+        queued = self.image_manager.prefetch_notes(item[3] for item in page_notes + section_notes)
+        if queued:
+            debug_log(f"Prefetching {queued} images near page {page + 1}")
+    
     def _create_image_markdown_links(self, note_text: str) -> Markdown:
         """Create a Markdown widget with clickable image links for server mode."""
         if not note_text:
             return None
             
-        # Find image URLs in the note
-        image_pattern = r'https?://[^\s]+\.(?:jpg|png)(?:\?[^\s]*)?'
-        image_urls = re.findall(image_pattern, note_text, re.IGNORECASE)
+        # Image URLs in the note (scanned once per note text)
+        analysis = self.image_manager.analyze_note(note_text)
+        image_urls = analysis.urls
         
         if not image_urls:
             return None
@@ -1657,7 +1694,7 @@ class EPUBReader(App):
             markdown_content += f"[{filename}]({url})"
         
         # Create and style the Markdown widget
-        markdown_widget = Markdown(markdown_content, id=f"image-links-{hash(note_text) % 10000}")
+        markdown_widget = Markdown(markdown_content, id=f"image-links-{analysis.digest[:12]}")
         return markdown_widget
     
     def update_highlights_list(self) -> None:
@@ -1665,7 +1702,11 @@ class EPUBReader(App):
         highlights_list = self.query_one("#highlights-list", ListView)
         highlights_list.clear()
         
-        # No need to clear separate image panel anymore
+        # Placeholders from the previous list are gone; downloads carry on
+        self._pending_images = {}
+        # Thumbnails are scaled to the panel, less its border and padding
+        if highlights_list.size.width > 4:
+            self.image_manager.display_width = highlights_list.size.width - 4
         
         # Collect all highlights and marks, then sort by position
         all_items = []
@@ -1832,74 +1873,122 @@ class EPUBReader(App):
         counter_widget.update(f"{self.current_page + 1} / {len(self.pages)}")
         progress_widget.update(progress=self.current_page + 1)
         
+        # Fetch images for the notes around the new page while the reader reads
+        self._prefetch_nearby_images()
+        
         debug_log(f"Progress updated to: {self.current_page + 1}/{len(self.pages)}")
     
     def save_highlights(self) -> None:
-        """Save highlights to a pickle file."""
-        try:
-            with open('highlights.pkl', 'wb') as f:
-                pickle.dump(self.highlights, f)
-            debug_log(f"Saved {len(self.highlights)} pages of highlights")
-        except Exception as e:
-            debug_log(f"Error saving highlights: {e}")
+        """Queue a background save of the highlights changed since the last one."""
+        # Copy the page lists so the worker never sees a half-edited page;
+        # pages never looked at are skipped without being decoded
+        self.persistence.schedule('highlights', self._sync_highlights, self.highlights.copy())
+
+    def _sync_highlights(self, snapshot) -> None:
+        """Send changed and deleted highlights to the backend (runs on the persistence worker).
+
+        Only those records are written, so highlights other sessions saved
+        since this one loaded survive. If a write fails, the next save
+        sends the same changes again.
+        """
+        upserts, deletes = snapshot.changes_since(self._saved_highlights)
+        if upserts:
+            self.storage.upsert_highlights(upserts)
+        for page_num, start_pos in deletes:
+            self.storage.delete_highlight(page_num, start_pos)
+        self._saved_highlights = snapshot
+        debug_log(f"Saved {len(upserts)} changed and {len(deletes)} deleted highlights")
     
     def load_highlights(self) -> None:
-        """Load highlights from a pickle file."""
+        """Load highlights through the backend, or from an old pickle file.
+
+        The binary store is read directly so pages decode one at a time.
+        Stores in an older schema are upgraded once and saved back.
+        """
         try:
-            if os.path.exists('highlights.pkl'):
-                with open('highlights.pkl', 'rb') as f:
-                    self.highlights = pickle.load(f)
-                debug_log(f"Loaded {len(self.highlights)} pages of highlights")
-                
-                # Convert old format highlights to new format with default yellow color
-                for page_num, page_highlights in self.highlights.items():
-                    updated_highlights = []
-                    for highlight in page_highlights:
-                        if len(highlight) == 4:
-                            # Old format: (start_pos, end_pos, text, note)
-                            start_pos, end_pos, text, note = highlight
-                            # Add yellow as default color, ensure text has yellow brackets
-                            if not (text.startswith('[[') and text.endswith(']]')):
-                                # Add yellow brackets if they're missing
-                                # Handle both old single and new double brackets
-                                clean_text = text
-                                if clean_text.startswith('[') and clean_text.endswith(']') and not (clean_text.startswith('[[') and clean_text.endswith(']]')):
-                                    clean_text = clean_text[1:-1]  # Remove single [ and ]
-                                else:
-                                    clean_text = clean_text.strip('[]{}()<>«»|')
-                                text = f"[[{clean_text}]]"
-                            updated_highlights.append((start_pos, end_pos, text, note, "yellow"))
-                        else:
-                            # New format: keep as-is
-                            updated_highlights.append(highlight)
-                    self.highlights[page_num] = updated_highlights
-                    
-                debug_log("Converted old highlight format to new format with colors")
+            version = None
+            store_path = self.store_dir / 'highlights.gjb'
+            if self.storage.name != 'binary':
+                self.highlights = binary.HighlightPages(pages={
+                    page_num: [self.storage.resolve_highlight(h) for h in items]
+                    for page_num, items in self.storage.load_highlights().items()
+                })
+                debug_log(f"Loaded {len(self.highlights)} pages of highlights from the "
+                          f"{self.storage.name} backend")
+            elif store_path.exists():
+                with open(store_path, 'rb') as f:
+                    table = binary.HighlightTable(f)
+                self.highlights, version = binary.HighlightPages(table), table.schema
+                debug_log(f"Opened {len(self.highlights)} pages of highlights")
             else:
-                debug_log("No highlights file found, starting fresh")
+                legacy = load_legacy_pickle(self.store_dir / 'highlights.pkl')
+                if legacy is not None:
+                    self.highlights, version = binary.HighlightPages(pages=legacy), LEGACY_VERSION
+                    debug_log(f"Loaded {len(self.highlights)} pages of highlights from highlights.pkl")
+                else:
+                    debug_log("No highlights file found, starting fresh")
+
+            if version is not None and (needs_upgrade('highlights', version)
+                                        or not store_path.exists()):
+                # This reader marks yellow with double brackets
+                migrated, steps = migrate('highlights', dict(self.highlights), version,
+                                          yellow_brackets=('[[', ']]'))
+                self.highlights = binary.HighlightPages(pages=migrated)
+                debug_log(format_report(steps))
+                # A one-off rewrite of the whole store, before any edit is queued
+                self.storage.save_highlights(migrated)
         except Exception as e:
             debug_log(f"Error loading highlights: {e}")
+        self._saved_highlights = self.highlights.copy()
             
         # Load marks
         self.load_marks()
         
-        # Store saved page to load after mount (avoid reactive issues during init)
+        # Store saved page to load after mount (avoid reactive issues during init);
+        # a reading anchor pins the exact paragraph, even after repagination
         self.saved_page_to_load = self._get_saved_page()
+        anchor = self.position_store.load()
+        if anchor is not None and anchor.paragraph_count == len(self.paginator.paragraphs):
+            self._resume_anchor = anchor
+            self.saved_page_to_load = self.paginator.paragraph_to_page(anchor.paragraph)
     
     def save_marks(self) -> None:
-        """Save marks to a pickle file."""
-        try:
-            with open('marks.pkl', 'wb') as f:
-                pickle.dump(self.marks, f)
-            debug_log(f"Saved {len(self.marks)} marks")
-        except Exception as e:
-            debug_log(f"Error saving marks: {e}")
+        """Queue a background save of the marks changed since the last one."""
+        self.persistence.schedule('marks', self._sync_marks, list(self.marks))
+
+    def _sync_marks(self, marks: list) -> None:
+        """Send changed and deleted marks to the backend (runs on the persistence worker)."""
+        before = {mark_key(mark): mark for mark in self._saved_marks}
+        after = {mark_key(mark): mark for mark in marks}
+        changed = [mark for key, mark in after.items() if before.get(key) != mark]
+        removed = [mark for key, mark in before.items() if key not in after]
+        for mark in changed:
+            self.storage.upsert_mark(mark)
+        for mark in removed:
+            self.storage.delete_mark(mark)
+        self._saved_marks = marks
+        debug_log(f"Saved {len(changed)} changed and {len(removed)} deleted marks")
     
     def load_marks(self) -> None:
-        """Load marks from a pickle file."""
+        """Load marks from the backend, or from an old pickle file."""
+        # Marks read from an old pickle file count as unsaved
+        self._saved_marks = []
         try:
-            with open('marks.pkl', 'rb') as f:
-                self.marks = pickle.load(f)
+            store_path = self.store_dir / 'marks.gjb'
+            if self.storage.name != 'binary':
+                self.marks = self.storage.load_marks()
+                self._saved_marks = list(self.marks)
+            elif store_path.exists():
+                with open(store_path, 'rb') as f:
+                    self.marks = binary.read_marks(f)
+                self._saved_marks = list(self.marks)
+            else:
+                self.marks = load_legacy_pickle(self.store_dir / 'marks.pkl')
+                if self.marks is None:
+                    raise FileNotFoundError('marks.pkl')
+                self.marks, _ = migrate('marks', self.marks, LEGACY_VERSION)
+                # Write back so the pickle is never read again
+                self.save_marks()
             debug_log(f"Loaded {len(self.marks)} marks")
         except FileNotFoundError:
             debug_log("No marks file found, starting fresh")
@@ -1908,39 +1997,6 @@ class EPUBReader(App):
             debug_log(f"Error loading marks: {e}")
             self.marks = []
     
-    def _parse_image_references(self, text: str) -> list:
-        """Parse text for image URLs or references and return list of found images."""
-        image_references = []
-        
-        # Regex patterns for different image reference formats
-        patterns = [
-            # URL patterns (http/https)
-            r'https?://[^\s]+\.(?:jpg|jpeg|png|gif|webp|svg)(?:\?[^\s]*)?',
-            # Markdown image syntax ![alt](url)
-            r'!\[[^\]]*\]\(([^\)]+\.(?:jpg|jpeg|png|gif|webp|svg)(?:\?[^\)]*)?)\)',
-            # HTML image tags <img src="url">
-            r'<img[^>]+src=["\']([^"\']+\.(?:jpg|jpeg|png|gif|webp|svg)(?:\?[^"\']*)?)["\'][^>]*>',
-            # Simple file references (local files)
-            r'[^\s]+\.(?:jpg|jpeg|png|gif|webp|svg)'
-        ]
-        
-        for pattern in patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
-                if match.groups():
-                    # Extract URL from capturing group (for markdown/html)
-                    url = match.group(1)
-                else:
-                    # Use the full match (for direct URLs)
-                    url = match.group(0)
-                
-                if url not in image_references:
-                    image_references.append(url)
-                    debug_log(f"Found image reference: {url}")
-        
-        return image_references
-
-
     def _create_image_widget(self, image_path: str):
         """Create a TextualImage widget for display."""
         if not TEXTUAL_IMAGE_AVAILABLE:
@@ -1953,27 +2009,68 @@ class EPUBReader(App):
             return Static(f"[Image Error: {image_path}]")
 
 
-    def save_current_page(self) -> None:
-        """Save the current page number to a file."""
+    def _record_position(self) -> None:
+        """Store the exact reading position; cheap enough for every cursor move."""
         try:
-            with open('current_page.pkl', 'wb') as f:
-                pickle.dump(self.current_page, f)
-            debug_log(f"Saved current page: {self.current_page}")
+            text_area = self.query_one("#text-area", TextArea)
+            row, col = text_area.cursor_location
+            paragraph, offset = self.paginator.locate(self.current_page, row, col)
+            self.position_store.save(ReadingAnchor(
+                page=self.current_page,
+                total_pages=len(self.pages),
+                paragraph=paragraph,
+                offset=offset,
+                paragraph_count=len(self.paginator.paragraphs),
+                scroll=max(0, int(text_area.scroll_offset.y)),
+            ))
         except Exception as e:
-            debug_log(f"Error saving current page: {e}")
+            debug_log(f"Error recording reading position: {e}")
+
+    def _restore_anchor(self) -> None:
+        """Put the cursor and scroll back where the reader left off."""
+        anchor, self._resume_anchor = self._resume_anchor, None
+        if anchor is None:
+            return
+        text_area = self.query_one("#text-area", TextArea)
+        page_num, row, col = self.paginator.position_of(anchor.paragraph, anchor.offset)
+        text_area.move_cursor((row, col))
+        if anchor.page == page_num and anchor.total_pages == len(self.pages):
+            # Same pagination, so the old scroll offset still lines up
+            text_area.scroll_to(y=anchor.scroll, animate=False)
+        else:
+            text_area.scroll_cursor_visible(center=True, animate=False)
+        debug_log(f"Restored reading anchor: paragraph {anchor.paragraph}, offset {anchor.offset}")
+
+    def on_text_area_selection_changed(self, event: TextArea.SelectionChanged) -> None:
+        """Keep the reading anchor on the cursor as the reader moves through a page."""
+        if event.text_area.id == "text-area" and self._resume_anchor is None:
+            self._record_position()
+
+    def save_current_page(self) -> None:
+        """Queue a background save of the current page number."""
+        self._record_position()
+        self.persistence.schedule('current_page', self.storage.save_current_page, self.current_page)
 
     def _get_saved_page(self) -> int:
         """Get the saved page number from a file without setting it."""
         try:
-            with open('current_page.pkl', 'rb') as f:
-                saved_page = pickle.load(f)
-                # Ensure the saved page is within valid bounds
-                if 0 <= saved_page < len(self.pages):
-                    debug_log(f"Found saved page: {saved_page}")
-                    return saved_page
-                else:
-                    debug_log(f"Saved page {saved_page} out of bounds, will start at page 0")
-                    return 0
+            store_path = self.store_dir / 'current_page.gjb'
+            if self.storage.name != 'binary':
+                saved_page = self.storage.load_current_page(len(self.pages))
+            elif store_path.exists():
+                with open(store_path, 'rb') as f:
+                    saved_page = binary.read_page_state(f)
+            else:
+                saved_page = load_legacy_pickle(self.store_dir / 'current_page.pkl')
+                if saved_page is None:
+                    raise FileNotFoundError('current_page.pkl')
+            # Ensure the saved page is within valid bounds
+            if 0 <= saved_page < len(self.pages):
+                debug_log(f"Found saved page: {saved_page}")
+                return saved_page
+            else:
+                debug_log(f"Saved page {saved_page} out of bounds, will start at page 0")
+                return 0
         except FileNotFoundError:
             debug_log("No current page file found, will start at page 0")
             return 0
@@ -1996,7 +2093,12 @@ class EPUBReader(App):
         # Update the highlights list to show marks and highlights
         self.update_highlights_list()
         
-        # Save current page on exit
+        # Cursor and scroll go back once the page text is laid out
+        self.call_after_refresh(self._restore_anchor)
+        # Thumbnails are sized to the notes panel, so prefetch once it has a width
+        self.call_after_refresh(self._prefetch_nearby_images)
+        
+        # Save current page on exit; the persistence worker flushes after this runs
         import atexit
         atexit.register(self.save_current_page)
         
@@ -2009,6 +2111,21 @@ class EPUBReader(App):
         except Exception as e:
             debug_log(f"Could not override ListView background: {e}")
 
+    def action_show_storage_stats(self) -> None:
+        """Show storage call counts, latencies and bytes written."""
+        self.push_screen(StorageStatsScreen(self.metrics_dump_path))
+
+    def on_unmount(self) -> None:
+        """Flush queued saves, stop image downloads and dump storage metrics when the app closes."""
+        self.persistence.stop()
+        self.storage.close()
+        self.image_manager.close()
+        if self.metrics_file:
+            try:
+                metrics.dump_json(self.metrics_file)
+            except Exception as e:
+                debug_log(f"Error dumping storage metrics: {e}")
+
     def perform_search(self, search_term: str) -> None:
         """Perform search across all pages and store results."""
         if not search_term.strip():
@@ -2102,16 +2219,20 @@ def parse_arguments():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(description='GenreJinn EPUB Reader')
     parser.add_argument('--server', action='store_true', 
-                       help='Run in server mode for web browser access')
+                       help='Run in server mode for web browser access; all sessions share one '
+                            "reader's annotations per book unless GENREJINN_USER_ID names another")
     parser.add_argument('--host', default='127.0.0.1',
                        help='Host address for server mode (default: 127.0.0.1)')
     parser.add_argument('--port', type=int, default=8000,
                        help='Port for server mode (default: 8000)')
     parser.add_argument('--public-url', 
                        help='Public URL for server mode (e.g., https://blakelawyer.dev/genrejinn)')
+    parser.add_argument('--daemon', action='store_true',
+                       help='Share one annotation daemon between server sessions; other tabs see '
+                            'an edit when they next load the book')
     return parser.parse_args()
 
-def run_server_mode(host, port, public_url=None):
+def run_server_mode(host, port, public_url=None, daemon=False):
     """Run the application in server mode using textual-serve."""
     if not TEXTUAL_SERVE_AVAILABLE:
         print("Error: textual-serve is not installed. Install it with: pip install textual-serve")
@@ -2120,10 +2241,20 @@ def run_server_mode(host, port, public_url=None):
     print(f"Starting GenreJinn server on {host}:{port}")
     if public_url:
         print(f"Public URL: {public_url}")
+    print(ServerManager().describe_readers())
     
     # Set environment variable that the subprocess can detect
     os.environ['GENREJINN_SERVER_MODE'] = '1'
     
+    # Sessions find the daemon through the environment it sets
+    annotation_daemon = None
+    if daemon:
+        try:
+            annotation_daemon = ServerManager().start_annotation_daemon()
+        except Exception as e:
+            debug_log(f"Could not start annotation daemon: {e}")
+            print(f"Annotation daemon not started ({e}); sessions will use the stores directly")
+    
     # Create server with current script as command
     import sys
     server = Server(
@@ -2132,14 +2263,18 @@ def run_server_mode(host, port, public_url=None):
         port=port,
         public_url=public_url
     )
-    server.serve()
+    try:
+        server.serve()
+    finally:
+        if annotation_daemon is not None:
+            annotation_daemon.stop()
 
 if __name__ == "__main__":
     args = parse_arguments()
     
     if args.server:
         # Run in server mode
-        run_server_mode(args.host, args.port, args.public_url)
+        run_server_mode(args.host, args.port, args.public_url, args.daemon)
     else:
         # Run locally
         app = EPUBReader()
@@ -5,6 +5,7 @@
 
 import sys
 import os
+import threading
 from pathlib import Path
 from textual.app import App, ComposeResult
 from textual.containers import Horizontal, Vertical
@@ -17,8 +18,9 @@ import webbrowser
 # Import all the modular components
 from .epub import EPUBParser, EPUBPaginator
 from .highlighting import HighlightManager, ColorManager, TreeSitterHighlighter
-from .ui import ClickableImage, AkiraTheme, MainLayout
-from .storage import HighlightStorage, MarkStorage, ImageManager, PageStateManager
+from .ui import ClickableImage, AkiraTheme, MainLayout, StorageStatsScreen
+from .storage import (ImageManager, PersistenceWorker, create_backend, decoded_images,
+                      get_storage_config, metrics, open_namespace, PositionStore, ReadingAnchor)
 from .utils import SearchEngine, ServerManager, debug_log
 
 # Try to import tree-sitter language from syntax module
@@ -36,6 +38,9 @@ class EPUBReader(App):
     # Use AkiraTheme for styling
     CSS = AkiraTheme.get_main_css()
 
+    # Storage statistics panel
+    BINDINGS = [("f2", "show_storage_stats", "Storage stats")]
+
     # Reactive attributes for state management
     current_page = reactive(0)
 
@@ -50,11 +55,28 @@ class EPUBReader(App):
         self.color_manager = ColorManager()
         self.tree_sitter_highlighter = TreeSitterHighlighter()
 
-        # Initialize storage modules
-        self.highlight_storage = HighlightStorage()
-        self.mark_storage = MarkStorage()
-        self.image_manager = ImageManager()
-        self.page_state_manager = PageStateManager()
+        # Initialize storage modules (backend chosen by GENREJINN_STORAGE_BACKEND).
+        # With namespaces on, each reader of each book gets their own directory
+        storage_config = get_storage_config()
+        self.epub_path = self._find_epub()
+        self.namespace = open_namespace(storage_config, self.epub_path)
+        if self.namespace:
+            storage_config = self.namespace.backend_config(storage_config)
+            debug_log(f"Using storage namespace {self.namespace.get_storage_info()}")
+        self.storage = create_backend(storage_config)
+        self.metrics_file = storage_config['metrics_file']
+        self.metrics_dump_path = self.metrics_file or os.path.join(storage_config['data_dir'], "metrics.json")
+        self.image_manager = ImageManager(os.path.join(storage_config['data_dir'], "images"),
+                                          max_bytes=storage_config['image_cache_bytes'],
+                                          max_download_bytes=storage_config['image_max_bytes'],
+                                          download_timeout=storage_config['image_timeout'])
+        decoded_images.max_bytes = storage_config['decoded_image_bytes']
+        self.position_store = PositionStore(os.path.join(storage_config['data_dir'], "position.anchor"))
+
+        # Saves run on a background thread, coalesced per store
+        self.persistence = PersistenceWorker(storage_config['save_window'])
+        self._dirty_highlights = {}
+        self._dirty_lock = threading.Lock()
 
         # Initialize utility modules
         self.search_engine = SearchEngine()
@@ -62,11 +84,17 @@ class EPUBReader(App):
 
         # Load EPUB content and restore state
         self.pages = self._load_epub_content()
-        self.highlight_manager.highlights = self.highlight_storage.load_highlights()
-        self.marks = self.mark_storage.load_marks()
-
-        # Restore page state
-        self.saved_page_to_load = self.page_state_manager.load_current_page(len(self.pages))
+        self.marks = self.storage.load_marks()
+
+        # Restore page state and load only that page's highlights; other pages
+        # are loaded from storage the first time they are shown. The anchor
+        # pins the exact paragraph, so it wins over the saved page number
+        self.saved_page_to_load = self.storage.load_current_page(len(self.pages))
+        self._resume_anchor = self._load_anchor()
+        if self._resume_anchor:
+            self.saved_page_to_load = self.epub_paginator.paragraph_to_page(self._resume_anchor.paragraph)
+        self._loaded_pages = set()
+        self._ensure_page_loaded(self.saved_page_to_load)
 
         # UI state tracking
         self.last_focused_textarea = None
@@ -86,22 +114,80 @@ class EPUBReader(App):
 
         debug_log("EPUBReader initialized with modular architecture")
 
+    @property
+    def highlights(self) -> dict:
+        """Highlights loaded so far, keyed by page."""
+        return self.highlight_manager.highlights
+
+    def _ensure_page_loaded(self, page_num: int) -> None:
+        """Load a page's highlights from storage if not already in memory."""
+        if page_num in self._loaded_pages:
+            return
+        page_highlights = self.storage.load_page_highlights(page_num)
+        if page_highlights:
+            self.highlights[page_num] = page_highlights
+        self._loaded_pages.add(page_num)
+
+    def _find_epub(self) -> str:
+        """Path of the first EPUB file in the current directory, or None."""
+        epub_files = sorted(Path(".").glob("*.epub"))
+        return str(epub_files[0]) if epub_files else None
+
+    def _load_anchor(self):
+        """The saved reading anchor, if it fits the loaded book."""
+        anchor = self.position_store.load()
+        if anchor is None or anchor.paragraph_count != len(self.epub_paginator.paragraphs):
+            return None
+        return anchor
+
+    def _record_position(self) -> None:
+        """Store the exact reading position; cheap enough for every cursor move."""
+        try:
+            text_area = self.query_one("#text-area", TextArea)
+            row, col = text_area.cursor_location
+            paragraph, offset = self.epub_paginator.locate(self.current_page, row, col)
+            self.position_store.save(ReadingAnchor(
+                page=self.current_page,
+                total_pages=len(self.pages),
+                paragraph=paragraph,
+                offset=offset,
+                paragraph_count=len(self.epub_paginator.paragraphs),
+                scroll=max(0, int(text_area.scroll_offset.y)),
+            ))
+        except Exception as e:
+            debug_log(f"Error recording reading position: {e}")
+
+    def _restore_anchor(self) -> None:
+        """Put the cursor and scroll back where the reader left off."""
+        anchor = self._resume_anchor
+        self._resume_anchor = None
+        if anchor is None:
+            return
+        text_area = self.query_one("#text-area", TextArea)
+        page_num, row, col = self.epub_paginator.position_of(anchor.paragraph, anchor.offset)
+        text_area.move_cursor((row, col))
+        if anchor.page == page_num and anchor.total_pages == len(self.pages):
+            # Same pagination, so the old scroll offset still lines up
+            text_area.scroll_to(y=anchor.scroll, animate=False)
+        else:
+            text_area.scroll_cursor_visible(center=True, animate=False)
+        debug_log(f"Restored reading anchor: paragraph {anchor.paragraph}, offset {anchor.offset}")
+
     def _load_epub_content(self) -> list:
         """Load EPUB content using the EPUBParser module."""
         try:
-            # Look for EPUB files in the current directory
-            epub_files = list(Path(".").glob("*.epub"))
-            if not epub_files:
+            if not self.epub_path:
                 debug_log("No EPUB files found in current directory")
                 return ["No EPUB files found. Please place an EPUB file in the current directory."]
 
-            # Use the first EPUB file found
-            epub_file = epub_files[0]
-            debug_log(f"Loading EPUB file: {epub_file}")
+            debug_log(f"Loading EPUB file: {self.epub_path}")
 
-            # Parse EPUB content
-            self.epub_parser.epub_path = str(epub_file)
-            paragraphs = self.epub_parser.load_paragraphs()
+            # Parse EPUB content; the paragraphs are shared by every reader of the book
+            self.epub_parser.epub_path = self.epub_path
+            if self.namespace:
+                paragraphs = self.namespace.cached('paragraphs', self.epub_parser.load_paragraphs)
+            else:
+                paragraphs = self.epub_parser.load_paragraphs()
             if not paragraphs:
                 debug_log("Failed to parse EPUB content")
                 return ["Failed to parse EPUB content."]
@@ -156,11 +242,43 @@ class EPUBReader(App):
         # Update the highlights list
         self._update_highlights_list()
 
-        # Schedule periodic state saving
-        self.set_interval(30.0, self._save_current_state)
+        if self.saved_page_to_load < len(self.pages):
+            self.query_one("#text-area", TextArea).text = self.pages[self.saved_page_to_load]
+        self.call_after_refresh(self._restore_anchor)
+
+        # Sessions sharing an annotation daemon see each other's edits
+        if hasattr(self.storage, 'subscribe'):
+            try:
+                self.storage.subscribe(self._on_storage_event)
+            except Exception as e:
+                debug_log(f"Error subscribing to annotation changes: {e}")
 
         debug_log("EPUBReader mounted successfully")
 
+    def _on_storage_event(self, event: dict) -> None:
+        """Storage change made by another session (called from the subscription thread)."""
+        self.call_from_thread(self._reload_shared_annotations, event)
+
+    def _reload_shared_annotations(self, event: dict) -> None:
+        """Drop cached annotations another session changed and reload what is shown."""
+        if event.get('event') == 'marks':
+            self.marks = self.storage.load_marks()
+            return
+        pages = event.get('pages')
+        with self._dirty_lock:
+            pending = {page_num for page_num, _ in self._dirty_highlights}
+        for page_num in list(self._loaded_pages if pages is None else pages):
+            # Our own unsaved edits on a page are written over it shortly anyway
+            if page_num in pending:
+                continue
+            self._loaded_pages.discard(page_num)
+            self.highlights.pop(page_num, None)
+        if self.current_page not in self._loaded_pages:
+            self._ensure_page_loaded(self.current_page)
+            self._apply_highlights()
+            self._update_highlights_list()
+        debug_log(f"Reloaded annotations changed by session {event.get('session')}")
+
     def on_button_pressed(self, event: Button.Pressed) -> None:
         """Handle button press events."""
         button_id = event.button.id
@@ -197,6 +315,8 @@ class EPUBReader(App):
 
     def _update_page_display(self) -> None:
         """Update the text area and UI elements for the current page."""
+        self._ensure_page_loaded(self.current_page)
+
         text_area = self.query_one("#text-area", TextArea)
         text_area.text = self.pages[self.current_page]
 
@@ -207,12 +327,21 @@ class EPUBReader(App):
         progress_bar = self.query_one("#progress", ProgressBar)
         progress_bar.update(progress=self.current_page + 1)
 
+        # Persist the new position: the anchor right away, the page number in the background
+        self._record_position()
+        self._save_current_state()
+
         # Apply highlights for current page
         self._apply_highlights()
 
         # Update highlights list
         self._update_highlights_list()
 
+    def on_text_area_selection_changed(self, event: TextArea.SelectionChanged) -> None:
+        """Keep the reading anchor on the cursor as the reader moves through a page."""
+        if event.text_area.id == "text-area" and self._resume_anchor is None:
+            self._record_position()
+
     def _toggle_highlight(self) -> None:
         """Toggle highlighting using the HighlightManager."""
         text_area = self.query_one("#text-area", TextArea)
@@ -235,8 +364,8 @@ class EPUBReader(App):
                     self.highlights[self.current_page] = []
                 self.highlights[self.current_page].append(highlight)
 
-                # Save to storage
-                self.highlight_storage.save_highlights(self.highlights)
+                # Queue just this highlight for saving
+                self._queue_highlight_save(self.current_page, highlight)
 
                 # Apply visual highlighting
                 self._apply_highlights()
@@ -300,15 +429,40 @@ class EPUBReader(App):
         highlight_button = self.query_one("#highlight-button", Button)
         highlight_button.label = f"Highlight ({color_name})"
 
+    def action_show_storage_stats(self) -> None:
+        """Show storage call counts, latencies and bytes written."""
+        self.push_screen(StorageStatsScreen(self.metrics_dump_path))
+
+    def _queue_highlight_save(self, page_num: int, highlight: tuple) -> None:
+        """Mark a highlight dirty; the worker writes all dirty highlights in one batch."""
+        with self._dirty_lock:
+            self._dirty_highlights[(page_num, tuple(highlight[0]))] = (page_num, highlight)
+        self.persistence.schedule('highlights', self._flush_dirty_highlights)
+
+    def _flush_dirty_highlights(self) -> None:
+        """Write queued highlights to storage (runs on the persistence worker)."""
+        with self._dirty_lock:
+            dirty, self._dirty_highlights = self._dirty_highlights, {}
+        if dirty:
+            self.storage.upsert_highlights(list(dirty.values()))
+
     def _save_current_state(self) -> None:
-        """Save current application state."""
-        self.page_state_manager.save_current_page(self.current_page)
+        """Queue a save of the current reading position."""
+        self.persistence.schedule('current_page', self.storage.save_current_page, self.current_page)
 
     def on_unmount(self) -> None:
-        """Save state when app is closing."""
+        """Flush queued saves when app is closing."""
+        self._record_position()
         self._save_current_state()
-        self.highlight_storage.save_highlights(self.highlights)
-        self.mark_storage.save_marks(self.marks)
+        self.persistence.stop()
+        self.storage.close()
+        self.position_store.close()
+        self.image_manager.close()
+        if self.metrics_file:
+            try:
+                metrics.dump_json(self.metrics_file)
+            except Exception as e:
+                debug_log(f"Error dumping storage metrics: {e}")
         debug_log("EPUBReader unmounted and state saved")
 
 
@@ -2,5 +2,6 @@
 
 from .parser import EPUBParser
 from .pagination import EPUBPaginator
+from .cfi import CFIError, CFIIndex, load_cfi_index
 
-__all__ = ["EPUBParser", "EPUBPaginator"]
\ No newline at end of file
+__all__ = ["EPUBParser", "EPUBPaginator", "CFIError", "CFIIndex", "load_cfi_index"]
\ No newline at end of file
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""EPUB CFI <-> paragraph position index."""
+
+import bisect
+import posixpath
+import re
+import zipfile
+from collections import namedtuple
+
+from ..utils.debug import debug_log
+
+
+INDEX_VERSION = 1
+
+TOKEN = re.compile(
+    r'<!--.*?-->|<\?.*?\?>|<!\[CDATA\[.*?\]\]>|<![^>]*>'
+    r'|<(/?)([A-Za-z][\w:.-]*)([^>]*?)(/?)>|[^<]+|<',
+    re.DOTALL
+)
+ID_ATTRIBUTE = re.compile(r'(?<![\w:-])id\s*=\s*["\']([^"\']*)["\']')
+SPECIAL = re.compile(r'\s+|&(?:#\d+|#[xX][0-9a-fA-F]+|[A-Za-z]\w*);')
+CFI_STEP = re.compile(r'/(\d+)(?:\[[^\]]*\])?(?::(\d+))?')
+
+# One text node (or the part of it inside a paragraph). ``doms``/``norms``
+# are breakpoints of a piecewise map from DOM offsets in the node to
+# offsets in the paragraph text: between breakpoints both advance together
+Segment = namedtuple('Segment', 'spine steps labels node paragraph norm_start doms norms caps')
+
+
+class CFIError(ValueError):
+    """A CFI that is malformed or does not point into the book's text."""
+
+
+# Building
+
+def _spine_map(epub_file) -> dict:
+    """Map each spine document's zip path to its spine index."""
+    container = epub_file.read('META-INF/container.xml').decode('utf-8', errors='ignore')
+    opf_path = re.search(r'full-path\s*=\s*["\']([^"\']+)["\']', container).group(1)
+    opf = epub_file.read(opf_path).decode('utf-8', errors='ignore')
+    base = posixpath.dirname(opf_path)
+
+    hrefs = {}
+    for item in re.findall(r'<item\b[^>]*>', opf):
+        item_id = re.search(r'\bid\s*=\s*["\']([^"\']+)["\']', item)
+        href = re.search(r'\bhref\s*=\s*["\']([^"\']+)["\']', item)
+        if item_id and href:
+            hrefs[item_id.group(1)] = posixpath.normpath(posixpath.join(base, href.group(1)))
+    idrefs = re.findall(r'<itemref\b[^>]*\bidref\s*=\s*["\']([^"\']+)["\']', opf)
+    return {hrefs[idref]: index for index, idref in enumerate(idrefs) if idref in hrefs}
+
+
+def _scan_paragraphs(content: str):
+    """Yield each <p> as a list of (labels, node, raw text) runs.
+
+    Labels are the CFI steps of the run's parent element below the root,
+    with id assertions; node is the run's odd text-node index. Raw text
+    still has its entities and whitespace, as EPUBParser sees it.
+    """
+    # Each open element: [labels, child element count]
+    stack = []
+    paragraph = None  # (stack depth of the <p>, [runs])
+    for m in TOKEN.finditer(content):
+        closing, tag, attributes, self_closing = m.group(1, 2, 3, 4)
+        if tag is None:
+            text = m.group()
+            if paragraph is not None and stack and not text.startswith(('<!', '<?')):
+                parent = stack[-1]
+                paragraph[1].append((parent[0], parent[1] * 2 + 1, text))
+            continue
+
+        if closing:
+            if paragraph is not None and len(stack) == paragraph[0] and tag.lower() == 'p':
+                yield paragraph[1]
+                paragraph = None
+            if stack:
+                stack.pop()
+            continue
+
+        if not stack:
+            # The root element; CFI steps start at its children
+            child = [(), 0]
+        else:
+            parent = stack[-1]
+            parent[1] += 1
+            step = parent[1] * 2
+            element_id = ID_ATTRIBUTE.search(attributes)
+            child = [parent[0] + (f"{step}[{element_id.group(1)}]" if element_id else str(step),), 0]
+        if self_closing:
+            continue
+        stack.append(child)
+        if tag.lower() == 'p' and paragraph is None:
+            paragraph = (len(stack), [])
+
+
+def _paragraph_pieces(runs: list) -> tuple:
+    """Map each run's DOM offsets to offsets in the paragraph text EPUBParser builds.
+
+    EPUBParser collapses each whitespace run to one space, strips both
+    ends and keeps entities undecoded, so a DOM offset is not a paragraph
+    offset. Returns the paragraph length and, per run, breakpoint lists
+    (doms, norms, caps): from ``doms[i]`` the paragraph offset is
+    ``norms[i] + (dom - doms[i])``, never above ``caps[i]`` when set.
+    """
+    content_end = len(''.join(text for _, _, text in runs).rstrip())
+    norm = 0
+    started = False   # seen any non-whitespace yet
+    after_space = False  # the previous character was whitespace
+    raw_start = 0
+    maps = []
+    for _, _, text in runs:
+        doms, norms, caps = [], [], []
+
+        def piece(dom, value, cap=None):
+            if (doms and caps[-1] is None and cap is None
+                    and norms[-1] + (dom - doms[-1]) == value):
+                return
+            if doms and doms[-1] == dom:
+                doms.pop(), norms.pop(), caps.pop()
+            doms.append(dom)
+            norms.append(value)
+            caps.append(cap)
+
+        piece(0, norm)
+        dom = 0
+        position = 0
+        for m in SPECIAL.finditer(text):
+            plain = m.start() - position
+            if plain:
+                piece(dom, norm)
+                norm += plain
+                dom += plain
+                started, after_space = True, False
+            token = m.group()
+            if token[0] == '&':
+                piece(dom, norm)
+                norm += len(token)
+                dom += 1
+                piece(dom, norm)
+                started, after_space = True, False
+            else:
+                counted = started and not after_space and raw_start + m.start() < content_end
+                if counted and len(token) == 1:
+                    # A lone space stays a lone space
+                    piece(dom, norm)
+                    norm += 1
+                    dom += 1
+                else:
+                    piece(dom, norm, norm + 1 if counted else norm)
+                    norm += 1 if counted else 0
+                    dom += len(token)
+                    piece(dom, norm)
+                after_space = True
+            position = m.end()
+        plain = len(text) - position
+        if plain:
+            piece(dom, norm)
+            norm += plain
+            started, after_space = True, False
+        maps.append((doms, norms, caps))
+        raw_start += len(text)
+    return norm, maps
+
+
+def _label_step(label: str) -> int:
+    return int(label.split('[', 1)[0])
+
+
+class CFIIndex:
+    """Translate between EPUB CFIs and (paragraph index, character offset).
+
+    Paragraphs are found exactly as ``EPUBParser.load_paragraphs`` finds
+    them, so paragraph indexes line up with the Textual reader's. Every
+    text node inside a paragraph becomes a segment holding its CFI path
+    and a breakpoint map from its DOM offsets (decoded characters) to
+    offsets in the whitespace-collapsed paragraph.
+
+    Building reads the whole EPUB; the result is plain JSON
+    (``to_data``/``from_data``), meant for the shared book cache. Lookups
+    are a dict hit or a bisect over segments, then a bisect over one
+    segment's breakpoints.
+    """
+
+    def __init__(self, segments: list, paragraph_lengths: list):
+        self.segments = segments
+        self.paragraph_lengths = paragraph_lengths
+        # (paragraph, norm_start) of each segment, in order, for position -> segment
+        self._segment_starts = [(s.paragraph, s.norm_start) for s in segments]
+        # Text node -> first segment, and each spine document's segments in document order
+        self._nodes = {}
+        self._spine_keys = {}
+        self._spine_segments = {}
+        for index, segment in enumerate(segments):
+            key = segment.steps + (segment.node,)
+            self._nodes.setdefault((segment.spine, key), index)
+            self._spine_keys.setdefault(segment.spine, []).append(key)
+            self._spine_segments.setdefault(segment.spine, []).append(index)
+
+    @property
+    def paragraph_count(self) -> int:
+        return len(self.paragraph_lengths)
+
+    @classmethod
+    def build(cls, epub_path: str) -> "CFIIndex":
+        """Index an EPUB file."""
+        segments, paragraph_lengths = [], []
+        with zipfile.ZipFile(epub_path, 'r') as epub_file:
+            spine = _spine_map(epub_file)
+            # Same files, same order as EPUBParser.load_paragraphs
+            html_files = sorted(f for f in epub_file.namelist() if f.endswith('.html') and 'text' in f)
+            for filename in html_files:
+                content = epub_file.read(filename).decode('utf-8', errors='ignore')
+                for runs in _scan_paragraphs(content):
+                    length, maps = _paragraph_pieces(runs)
+                    if not length:
+                        continue
+                    paragraph = len(paragraph_lengths)
+                    paragraph_lengths.append(length)
+                    for (labels, node, _), (doms, norms, caps) in zip(runs, maps):
+                        segments.append(Segment(spine.get(filename), tuple(map(_label_step, labels)),
+                                                labels, node, paragraph, norms[0], doms, norms, caps))
+        return cls(segments, paragraph_lengths)
+
+    def to_data(self) -> dict:
+        return {
+            'version': INDEX_VERSION,
+            'paragraph_lengths': self.paragraph_lengths,
+            'segments': [[s.spine, list(s.labels), s.node, s.paragraph, s.doms, s.norms, s.caps]
+                         for s in self.segments],
+        }
+
+    @classmethod
+    def from_data(cls, data: dict) -> "CFIIndex":
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError(f"CFI index version {data.get('version')} is not {INDEX_VERSION}")
+        segments = [Segment(spine, tuple(map(_label_step, labels)), tuple(labels), node,
+                            paragraph, norms[0], doms, norms, caps)
+                    for spine, labels, node, paragraph, doms, norms, caps in data['segments']]
+        return cls(segments, data['paragraph_lengths'])
+
+    # Positions -> CFI
+
+    def _segment_for(self, paragraph_index: int, offset: int) -> Segment:
+        index = bisect.bisect_right(self._segment_starts, (paragraph_index, offset)) - 1
+        return self.segments[index]
+
+    def point(self, paragraph_index: int, offset: int) -> tuple:
+        """(spine index, element labels, text node, DOM offset) of a paragraph position."""
+        if not 0 <= paragraph_index < len(self.paragraph_lengths):
+            raise CFIError(f"No paragraph {paragraph_index}")
+        offset = max(0, min(offset, self.paragraph_lengths[paragraph_index]))
+        segment = self._segment_for(paragraph_index, offset)
+        if segment.spine is None:
+            raise CFIError(f"Paragraph {paragraph_index} is not in the spine")
+        index = bisect.bisect_right(segment.norms, offset) - 1
+        dom_offset = segment.doms[index] + (offset - segment.norms[index])
+        if index + 1 < len(segment.doms):
+            # Inside an undecoded entity: the character after it
+            dom_offset = min(dom_offset, segment.doms[index + 1])
+        return segment.spine, segment.labels, segment.node, dom_offset
+
+    def to_cfi(self, paragraph_index: int, offset: int = 0) -> str:
+        """CFI of a single position."""
+        spine, labels, node, dom_offset = self.point(paragraph_index, offset)
+        steps = ''.join(f"/{label}" for label in labels)
+        return f"epubcfi(/6/{(spine + 1) * 2}!{steps}/{node}:{dom_offset})"
+
+    def to_range_cfi(self, start: tuple, end: tuple) -> str:
+        """CFI range from (paragraph, offset) start to end."""
+        start_spine, start_labels, start_node, start_offset = self.point(*start)
+        end_spine, end_labels, end_node, end_offset = self.point(*end)
+        if start_spine != end_spine:
+            # A range cannot cross documents; stop at the end of the first one
+            end_spine, end_labels, end_node, end_offset = self.point(*self._document_end(start_spine))
+        start_steps = list(start_labels) + [f"{start_node}:{start_offset}"]
+        end_steps = list(end_labels) + [f"{end_node}:{end_offset}"]
+        common = 0
+        while (common < min(len(start_steps), len(end_steps)) - 1
+               and start_steps[common] == end_steps[common]):
+            common += 1
+        parent = ''.join(f"/{step}" for step in start_steps[:common])
+        start_rest = ''.join(f"/{step}" for step in start_steps[common:])
+        end_rest = ''.join(f"/{step}" for step in end_steps[common:])
+        return f"epubcfi(/6/{(start_spine + 1) * 2}!{parent},{start_rest},{end_rest})"
+
+    def _document_end(self, spine: int) -> tuple:
+        last = self.segments[self._spine_segments[spine][-1]].paragraph
+        return last, self.paragraph_lengths[last]
+
+    # CFI -> positions
+
+    def _parse_point(self, cfi: str) -> tuple:
+        if '!' not in cfi:
+            raise CFIError(f"Not a content CFI: {cfi}")
+        package, content = cfi.split('!', 1)
+        package_steps = CFI_STEP.findall(package)
+        if len(package_steps) < 2:
+            raise CFIError(f"No spine step in {cfi}")
+        spine = int(package_steps[-1][0]) // 2 - 1
+        steps = CFI_STEP.findall(content)
+        if not steps:
+            raise CFIError(f"No content steps in {cfi}")
+        path = tuple(int(step) for step, _ in steps)
+        offset = steps[-1][1]
+        return spine, path, int(offset) if offset else 0
+
+    def _locate(self, spine: int, path: tuple, dom_offset: int) -> tuple:
+        """First paragraph position at or after a point in a spine document."""
+        index = self._nodes.get((spine, path)) if path[-1] % 2 else None
+        if index is not None:
+            segment = self.segments[index]
+            piece = bisect.bisect_right(segment.doms, dom_offset) - 1
+            offset = segment.norms[piece] + (dom_offset - segment.doms[piece])
+            if segment.caps[piece] is not None:
+                offset = min(offset, segment.caps[piece])
+            return segment.paragraph, min(offset, self.paragraph_lengths[segment.paragraph])
+
+        # An element, or text outside any paragraph: the next paragraph text
+        keys = self._spine_keys.get(spine)
+        if not keys:
+            raise CFIError(f"Spine item {spine} has no indexed text")
+        position = bisect.bisect_left(keys, path)
+        if position == len(keys):
+            raise CFIError(f"No text at or after {path} in spine item {spine}")
+        segment = self.segments[self._spine_segments[spine][position]]
+        return segment.paragraph, segment.norm_start
+
+    def to_position(self, cfi: str) -> tuple:
+        """(paragraph, offset) of a CFI; a range gives its start."""
+        return self.range_positions(cfi)[0]
+
+    def range_positions(self, cfi: str) -> tuple:
+        """((paragraph, offset), (paragraph, offset)) of a CFI range or point."""
+        body = cfi.strip()
+        if body.startswith('epubcfi(') and body.endswith(')'):
+            body = body[len('epubcfi('):-1]
+        parts = body.split(',')
+        if len(parts) == 3:
+            start = self._locate(*self._parse_point(parts[0] + parts[1]))
+            end = self._locate(*self._parse_point(parts[0] + parts[2]))
+            return start, end
+        if len(parts) == 1:
+            position = self._locate(*self._parse_point(parts[0]))
+            return position, position
+        raise CFIError(f"Malformed CFI: {cfi}")
+
+
+def load_cfi_index(epub_path: str, namespace=None) -> CFIIndex:
+    """The book's CFI index, from the namespace's book cache when there is one."""
+    if namespace is None:
+        return CFIIndex.build(epub_path)
+    data = namespace.cached(f"cfi-index-v{INDEX_VERSION}", lambda: CFIIndex.build(epub_path).to_data())
+    try:
+        return CFIIndex.from_data(data)
+    except Exception as e:
+        debug_log(f"Rebuilding unreadable CFI index: {e}")
+        return CFIIndex.build(epub_path)
@@ -3,15 +3,24 @@
 
 """EPUB content pagination logic."""
 
+import bisect
+
+# Paragraphs on a page are joined with a blank line between them
+PARAGRAPH_SEPARATOR = '\n\n'
+
 
 class EPUBPaginator:
     """Handle pagination of EPUB content."""
 
     def __init__(self, total_pages: int = 776):
         self.total_pages = total_pages
+        self.paragraphs = []
+        self.page_starts = []  # index of the first paragraph of each page
 
     def create_pages(self, paragraphs: list) -> list:
         """Group paragraphs into pages."""
+        self.paragraphs = paragraphs
+        self.page_starts = []
         if not paragraphs:
             return []
 
@@ -24,6 +33,7 @@ class EPUBPaginator:
         for page_num in range(self.total_pages):
             # Some pages get one extra paragraph to distribute the remainder
             page_size = paragraphs_per_page + (1 if page_num < extra_paragraphs else 0)
+            self.page_starts.append(min(start_index, total_paragraphs))
 
             if start_index >= total_paragraphs:
                 # If we run out of paragraphs, create empty pages
@@ -36,6 +46,69 @@ class EPUBPaginator:
 
         return pages
 
+    # Paragraph <-> page positions. Paragraph indexes do not depend on the page
+    # count, so a position kept as (paragraph, offset) survives repagination.
+
+    def page_to_paragraph(self, page_num: int) -> int:
+        """Index of the first paragraph on a page."""
+        return self.page_starts[page_num]
+
+    def paragraph_to_page(self, paragraph_index: int) -> int:
+        """Page holding a paragraph."""
+        if not self.page_starts:
+            return 0
+        paragraph_index = max(0, min(paragraph_index, len(self.paragraphs) - 1))
+        return bisect.bisect_right(self.page_starts, paragraph_index) - 1
+
+    def _page_paragraphs(self, page_num: int) -> range:
+        end = self.page_starts[page_num + 1] if page_num + 1 < len(self.page_starts) else len(self.paragraphs)
+        return range(self.page_starts[page_num], end)
+
+    def page_end(self, page_num: int) -> tuple:
+        """(paragraph index, offset) just past the last character of a page."""
+        paragraph_range = self._page_paragraphs(page_num)
+        if not paragraph_range:
+            return (max(0, self.page_starts[page_num] - 1), 0)
+        last = paragraph_range[-1]
+        return (last, len(self.paragraphs[last]))
+
+    def locate(self, page_num: int, row: int, col: int) -> tuple:
+        """Turn a (row, col) location in a page into (paragraph index, character offset).
+
+        A location on a blank separator line belongs to the paragraph after it.
+        """
+        if not self.page_starts:
+            return (0, 0)
+        paragraph_range = self._page_paragraphs(page_num)
+        if not paragraph_range:
+            return (max(0, min(self.page_starts[page_num], len(self.paragraphs) - 1)), 0)
+        first_row = 0
+        for paragraph_index in paragraph_range:
+            lines = self.paragraphs[paragraph_index].split('\n')
+            last_row = first_row + len(lines) - 1
+            if row <= last_row:
+                if row < first_row:
+                    return (paragraph_index, 0)
+                offset = sum(len(line) + 1 for line in lines[:row - first_row])
+                return (paragraph_index, offset + min(col, len(lines[row - first_row])))
+            first_row = last_row + PARAGRAPH_SEPARATOR.count('\n')
+        last = paragraph_range[-1]
+        return (last, len(self.paragraphs[last]))
+
+    def position_of(self, paragraph_index: int, offset: int = 0) -> tuple:
+        """Turn (paragraph index, character offset) into (page, row, col)."""
+        page_num = self.paragraph_to_page(paragraph_index)
+        if not self.paragraphs:
+            return (page_num, 0, 0)
+        paragraph_index = max(0, min(paragraph_index, len(self.paragraphs) - 1))
+        row = 0
+        for index in self._page_paragraphs(page_num):
+            if index == paragraph_index:
+                break
+            row += self.paragraphs[index].count('\n') + PARAGRAPH_SEPARATOR.count('\n')
+        text = self.paragraphs[paragraph_index][:max(0, offset)]
+        return (page_num, row + text.count('\n'), len(text) - (text.rfind('\n') + 1))
+
     def get_page_info(self, current_page: int) -> dict:
         """Get information about a specific page."""
         return {
@@ -0,0 +1,6 @@
+"""Streaming annotation export to Markdown, JSONL and CSV."""
+
+from .annotations import iter_annotations
+from .formats import FORMATS, write_export
+
+__all__ = ["iter_annotations", "FORMATS", "write_export"]
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Book-order iteration over highlights and marks for export."""
+
+import heapq
+from ..highlighting.colors import ColorManager, parse_highlight_tuple
+
+
+def clean_highlight_text(text: str, color: str) -> str:
+    """Strip color brackets from highlight text, including doubled yellow brackets."""
+    previous = None
+    while text and text != previous:
+        previous = text
+        text = ColorManager.strip_brackets(text, color)
+    return text
+
+
+def iter_page_highlights(highlights: dict):
+    """Yield (page_num, highlight) pairs from a highlights dict in book order."""
+    for page_num in sorted(highlights):
+        for highlight in sorted(highlights[page_num], key=lambda h: h[0]):
+            yield page_num, highlight
+
+
+def _iter_highlight_records(pairs):
+    """Yield highlight records from (page_num, highlight) pairs in book order."""
+    for page_num, highlight in pairs:
+        start_pos, end_pos, text, note, color = parse_highlight_tuple(highlight)
+        start_row, start_col = start_pos
+        end_row, end_col = end_pos
+        yield (page_num, start_row, start_col, 1), {
+            'type': 'highlight',
+            'page': page_num,
+            'start_row': start_row,
+            'start_col': start_col,
+            'end_row': end_row,
+            'end_col': end_col,
+            'text': clean_highlight_text(text, color),
+            'note': note or "",
+            'color': color,
+        }
+
+
+def _iter_mark_records(marks: list):
+    """Yield mark records sorted by position."""
+    for mark in sorted(marks, key=lambda m: (m[0], m[1], m[2])):
+        if len(mark) >= 6:
+            page_num, start_row, start_col, selected_text, mark_name, timestamp = mark[:6]
+        elif len(mark) == 5:
+            page_num, start_row, start_col, selected_text, mark_name = mark
+            timestamp = 0
+        else:
+            continue
+        # Marks sort before highlights at the same position so they open their section
+        yield (page_num, start_row, start_col, 0), {
+            'type': 'mark',
+            'page': page_num,
+            'start_row': start_row,
+            'start_col': start_col,
+            'text': selected_text,
+            'name': str(mark_name),
+            'timestamp': timestamp,
+        }
+
+
+def iter_annotations(highlights, marks: list):
+    """Yield highlight and mark records in book order.
+
+    ``highlights`` is either a ``{page: [highlight, ...]}`` dict or an iterable
+    of (page_num, highlight) pairs already in book order, such as
+    ``StorageBackend.iter_highlights()``. Each highlight record carries the name
+    of the mark section it falls under, so consumers can group output without
+    looking ahead.
+    """
+    if isinstance(highlights, dict):
+        highlights = iter_page_highlights(highlights)
+
+    section = None
+    merged = heapq.merge(
+        _iter_mark_records(marks or []),
+        _iter_highlight_records(highlights or ()),
+        key=lambda item: item[0]
+    )
+    for _, record in merged:
+        if record['type'] == 'mark':
+            section = record['name']
+        else:
+            record['section'] = section
+        yield record
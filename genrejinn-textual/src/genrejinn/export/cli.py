@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Headless command line entry point for exporting annotations."""
+
+import argparse
+import sys
+
+from ..storage.config import BACKENDS, create_backend, get_storage_config
+from .annotations import iter_annotations
+from .formats import FORMATS, write_export
+
+
+def parse_export_arguments(argv: list = None) -> argparse.Namespace:
+    """Parse command line arguments for annotation export."""
+    config = get_storage_config()
+    parser = argparse.ArgumentParser(description='Export GenreJinn highlights and notes')
+    parser.add_argument('format', choices=sorted(FORMATS),
+                        help='Output format')
+    parser.add_argument('-o', '--output',
+                        help='Output file (default: stdout)')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default=config['backend'],
+                        help=f"Storage backend to read (default: {config['backend']})")
+    parser.add_argument('--data-dir', default=config['data_dir'],
+                        help=f"Data directory (default: {config['data_dir']})")
+    parser.add_argument('--book-id', default=config['book_id'],
+                        help=f"Book identifier (default: {config['book_id']})")
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> int:
+    """Export annotations without starting the Textual UI."""
+    args = parse_export_arguments(argv)
+
+    backend = create_backend({
+        'backend': args.backend,
+        'data_dir': args.data_dir,
+        'book_id': args.book_id,
+    })
+    try:
+        pairs = ((page_num, backend.resolve_highlight(highlight))
+                 for page_num, highlight in backend.iter_highlights())
+        records = iter_annotations(pairs, backend.load_marks())
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8', newline='') as f:
+                write_export(records, args.format, f)
+        else:
+            write_export(records, args.format, sys.stdout)
+    finally:
+        backend.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Streaming Markdown, JSONL and CSV writers for annotation records."""
+
+import csv
+import io
+import json
+
+
+CSV_FIELDS = [
+    'type', 'page', 'start_row', 'start_col', 'end_row', 'end_col',
+    'section', 'name', 'color', 'text', 'note'
+]
+
+
+def iter_markdown(records, title: str = "Highlights & Notes"):
+    """Yield Markdown chunks, one section heading per mark."""
+    yield f"# {title}\n"
+    for record in records:
+        if record['type'] == 'mark':
+            yield f"\n## {record['name']}\n"
+            yield f"\n*Page {record['page'] + 1}*\n"
+            continue
+
+        yield f"\n**Page {record['page'] + 1}** ({record['color']})\n\n"
+        for line in record['text'].splitlines() or [""]:
+            yield f"> {line}\n"
+        if record['note']:
+            yield f"\n{record['note']}\n"
+
+
+def iter_jsonl(records):
+    """Yield one JSON document per line for each record."""
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def iter_csv(records):
+    """Yield CSV rows, reusing one small buffer for quoting."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction='ignore')
+
+    writer.writeheader()
+    yield buffer.getvalue()
+
+    for record in records:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(record)
+        yield buffer.getvalue()
+
+
+FORMATS = {
+    'markdown': iter_markdown,
+    'jsonl': iter_jsonl,
+    'csv': iter_csv,
+}
+
+
+def write_export(records, fmt: str, stream) -> int:
+    """Stream records to a text stream in the given format, return chunks written."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    count = 0
+    for chunk in FORMATS[fmt](records):
+        stream.write(chunk)
+        count += 1
+    return count
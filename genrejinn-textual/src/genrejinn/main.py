@@ -20,7 +20,7 @@ def main():
 
     if args.server:
         # Run in server mode
-        server_manager.run_server_mode(args.host, args.port, args.public_url)
+        server_manager.run_server_mode(args.host, args.port, args.public_url, args.daemon)
     else:
         # Run locally
         app = EPUBReader()
@@ -3,6 +3,31 @@
 from .highlights import HighlightStorage
 from .marks import MarkStorage
 from .images import ImageManager
+from .fetcher import ImageFetcher
 from .page_state import PageStateManager
+from .backend import StorageBackend
+from .binary_backend import BinaryBackend
+from .sqlite_backend import SQLiteBackend
+from .journal_backend import JournalBackend
+from .sharded import ShardedBackend
+from .blobs import NoteBlobStore, NoteRef
+from .snapshots import SnapshotStore
+from .metrics import StorageMetrics, metrics
+from .decoded_images import DecodedImageCache, decoded_images
+from .namespace import StorageNamespace, book_id_for, open_namespace
+from .position import PositionStore, ReadingAnchor
+from .locking import ConflictError, FileLock, LockTimeout
+from .daemon_backend import DaemonBackend
+from .protocol import DaemonError
+from .config import create_backend, get_storage_config, reader_id
+from .worker import PersistenceWorker
 
-__all__ = ["HighlightStorage", "MarkStorage", "ImageManager", "PageStateManager"]
\ No newline at end of file
+__all__ = [
+    "HighlightStorage", "MarkStorage", "ImageManager", "ImageFetcher", "PageStateManager",
+    "StorageBackend", "BinaryBackend", "SQLiteBackend", "JournalBackend",
+    "ShardedBackend", "DaemonBackend", "DaemonError",
+    "NoteBlobStore", "NoteRef", "SnapshotStore",
+    "StorageMetrics", "metrics", "DecodedImageCache", "decoded_images", "StorageNamespace", "book_id_for", "open_namespace",
+    "PositionStore", "ReadingAnchor", "ConflictError", "FileLock", "LockTimeout",
+    "create_backend", "get_storage_config", "reader_id", "PersistenceWorker",
+]
\ No newline at end of file
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Crash-safe file writes."""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Write bytes to path via a temp file and rename, so readers never see a partial file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_json_dump(obj, path: str) -> int:
+    """Write an object to path as compact JSON atomically, return bytes written."""
+    data = json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    atomic_write(path, data)
+    return len(data)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Common interface for annotation storage backends."""
+
+import functools
+import threading
+
+from .metrics import metrics
+
+
+# Interface methods timed on every backend, as ``<backend name>.<method>``
+INSTRUMENTED_METHODS = (
+    'load_highlights', 'load_page_highlights', 'save_highlights',
+    'upsert_highlight', 'upsert_highlights', 'delete_highlight',
+    'load_marks', 'save_marks', 'upsert_mark', 'delete_mark',
+    'load_current_page', 'save_current_page',
+)
+
+_calls = threading.local()
+
+
+def highlight_key(page_num: int, highlight: tuple) -> tuple:
+    """Identity of a highlight: its page and start position."""
+    return (page_num, tuple(highlight[0]))
+
+
+def mark_key(mark: tuple) -> tuple:
+    """Identity of a mark: its position and creation timestamp."""
+    timestamp = mark[5] if len(mark) >= 6 else 0
+    return (mark[0], mark[1], mark[2], timestamp)
+
+
+def _instrumented(method_name: str, func):
+    """Time a backend method, counting only the outermost backend call.
+
+    Backends implement one method with another (``upsert_highlight`` via
+    ``upsert_highlights``, a subclass via ``super()``); only the call the
+    caller made is recorded.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if getattr(_calls, 'active', False):
+            return func(self, *args, **kwargs)
+        _calls.active = True
+        try:
+            with metrics.timed(f"{self.name}.{method_name}"):
+                return func(self, *args, **kwargs)
+        finally:
+            _calls.active = False
+    wrapper.instrumented = True
+    return wrapper
+
+
+def _instrument_class(cls) -> None:
+    for method_name in INSTRUMENTED_METHODS:
+        func = cls.__dict__.get(method_name)
+        if func is not None and not getattr(func, 'instrumented', False):
+            setattr(cls, method_name, _instrumented(method_name, func))
+
+
+class StorageBackend:
+    """Base class for highlight, mark and reading-position persistence.
+
+    Highlights use the in-memory layout of the reader,
+    ``{page_number: [(start_pos, end_pos, text, note, color), ...]}``, and are
+    identified by page and start position. Marks are
+    ``(page_num, start_row, start_col, selected_text, mark_name, timestamp)``
+    tuples identified by position and timestamp.
+    """
+
+    name = "base"
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _instrument_class(cls)
+
+    # Highlights
+
+    def load_highlights(self) -> dict:
+        """Load every highlight, keyed by page."""
+        raise NotImplementedError
+
+    def load_page_highlights(self, page_num: int) -> list:
+        """Load the highlights for a single page."""
+        raise NotImplementedError
+
+    def iter_highlights(self):
+        """Yield (page_num, highlight) pairs in book order."""
+        raise NotImplementedError
+
+    def save_highlights(self, highlights: dict) -> None:
+        """Replace all stored highlights."""
+        raise NotImplementedError
+
+    def upsert_highlight(self, page_num: int, highlight: tuple) -> None:
+        """Insert or update one highlight."""
+        raise NotImplementedError
+
+    def upsert_highlights(self, items) -> None:
+        """Insert or update several (page_num, highlight) pairs in one go."""
+        for page_num, highlight in items:
+            self.upsert_highlight(page_num, highlight)
+
+    def delete_highlight(self, page_num: int, start_pos: tuple) -> bool:
+        """Delete one highlight, return True if it existed."""
+        raise NotImplementedError
+
+    # Note bodies
+
+    def resolve_note(self, note) -> str:
+        """Return the text of a note as found in a loaded highlight.
+
+        Backends that keep bodies out of the highlight index hand out a
+        ``NoteRef`` in the note slot; this reads the body behind it.
+        """
+        return note or ""
+
+    def resolve_highlight(self, highlight: tuple) -> tuple:
+        """Return a highlight with its note body filled in."""
+        note = highlight[3]
+        if isinstance(note, str):
+            return highlight
+        return highlight[:3] + (self.resolve_note(note),) + tuple(highlight[4:])
+
+    # Marks
+
+    def load_marks(self) -> list:
+        """Load all marks."""
+        raise NotImplementedError
+
+    def save_marks(self, marks: list) -> None:
+        """Replace all stored marks."""
+        raise NotImplementedError
+
+    def upsert_mark(self, mark: tuple) -> None:
+        """Insert or update one mark."""
+        raise NotImplementedError
+
+    def delete_mark(self, mark: tuple) -> bool:
+        """Delete one mark, return True if it existed."""
+        raise NotImplementedError
+
+    # Reading position
+
+    def load_current_page(self, total_pages: int) -> int:
+        """Load the saved page, clamped to the book."""
+        raise NotImplementedError
+
+    def save_current_page(self, current_page: int) -> None:
+        """Save the current page."""
+        raise NotImplementedError
+
+    def get_storage_info(self) -> dict:
+        """Describe the underlying storage."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resources held by the backend."""
+
+
+_instrument_class(StorageBackend)
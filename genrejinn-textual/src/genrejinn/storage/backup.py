@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Command line entry point for annotation snapshots."""
+
+import argparse
+import os
+import sys
+import time
+
+from .config import BACKENDS, create_backend, get_storage_config
+from .snapshots import SnapshotStore
+
+
+def parse_backup_arguments(argv: list = None) -> argparse.Namespace:
+    """Parse command line arguments for snapshot management."""
+    config = get_storage_config()
+    parser = argparse.ArgumentParser(description='Snapshot, restore and prune GenreJinn annotations')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default=config['backend'],
+                        help=f"Storage backend (default: {config['backend']})")
+    parser.add_argument('--data-dir', default=config['data_dir'],
+                        help=f"Data directory (default: {config['data_dir']})")
+    parser.add_argument('--book-id', default=config['book_id'],
+                        help=f"Book identifier (default: {config['book_id']})")
+    parser.add_argument('--backup-dir',
+                        help='Snapshot directory (default: <data-dir>/backups)')
+
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help='Snapshot the current annotations')
+    create.add_argument('--label', help='Label stored with the snapshot')
+    commands.add_parser('list', help='List snapshots')
+    restore = commands.add_parser('restore', help='Replace the annotations with a snapshot')
+    restore.add_argument('snapshot_id')
+    prune = commands.add_parser('prune', help='Delete old snapshots and unused blocks')
+    prune.add_argument('--keep-last', type=int, help='Keep this many newest snapshots')
+    prune.add_argument('--older-than-days', type=float, help='Delete snapshots older than this')
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> int:
+    """Manage annotation snapshots from the command line."""
+    args = parse_backup_arguments(argv)
+    store = SnapshotStore(args.backup_dir or os.path.join(args.data_dir, "backups"))
+
+    if args.command == 'list':
+        for manifest in store.list_snapshots():
+            created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(manifest['created']))
+            stores = ", ".join(f"{name} {info['size']} B" for name, info in manifest['stores'].items())
+            label = f" [{manifest['label']}]" if manifest.get('label') else ""
+            print(f"{manifest['id']}  {created}{label}  {stores}; {manifest['written']} B new")
+        return 0
+
+    if args.command == 'prune':
+        if args.keep_last is None and args.older_than_days is None:
+            print("Error: give --keep-last and/or --older-than-days")
+            return 1
+        older_than = args.older_than_days * 86400 if args.older_than_days is not None else None
+        result = store.prune(keep_last=args.keep_last, older_than=older_than)
+        print(f"Removed {len(result['removed'])} snapshots, freed {result['freed']} bytes")
+        return 0
+
+    backend = create_backend({
+        'backend': args.backend,
+        'data_dir': args.data_dir,
+        'book_id': args.book_id,
+    })
+    try:
+        if args.command == 'create':
+            highlights = {}
+            for page_num, highlight in backend.iter_highlights():
+                highlights.setdefault(page_num, []).append(backend.resolve_highlight(highlight))
+            manifest = store.create_snapshot(
+                highlights=highlights,
+                marks=backend.load_marks(),
+                current_page=backend.load_current_page(sys.maxsize),
+                label=args.label,
+            )
+            print(f"Created snapshot {manifest['id']} ({manifest['written']} new bytes)")
+        elif args.command == 'restore':
+            restored = store.restore_snapshot(args.snapshot_id)
+            if 'highlights' in restored:
+                backend.save_highlights(restored['highlights'])
+            if 'marks' in restored:
+                backend.save_marks(restored['marks'])
+            if 'current_page' in restored:
+                backend.save_current_page(restored['current_page'])
+            print(f"Restored snapshot {args.snapshot_id}: {', '.join(restored)}")
+    finally:
+        backend.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
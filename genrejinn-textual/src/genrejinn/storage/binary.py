@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Versioned columnar binary format for highlights, marks and page state.
+
+A file is a header followed by blocks of up to ``BLOCK_SIZE`` records::
+
+    header  <4s magic "GJNB"><H format version><B kind><B schema version>
+    block   <I record count><H column count> column*
+    column  <B column type><I byte length> payload
+
+Numbers are little-endian arrays, so a column decodes with one
+``array.frombytes`` call. String columns are UTF-8 joined by NUL and split
+in one pass; a column whose strings contain NUL stores character lengths
+instead. Reading never executes code, unlike ``pickle.load``.
+
+The format version describes this layout; the schema version describes
+the records inside it and is managed by ``schema.py``.
+"""
+
+import gc
+import io
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, MutableMapping
+from contextlib import contextmanager
+from itertools import chain, groupby, repeat
+
+from ..highlighting.colors import parse_highlight_tuple
+from .schema import CURRENT_VERSIONS, stamped_version
+
+
+MAGIC = b"GJNB"
+FORMAT_VERSION = 1
+
+KIND_HIGHLIGHTS = 1
+KIND_MARKS = 2
+KIND_PAGE_STATE = 3
+
+KIND_NAMES = {KIND_HIGHLIGHTS: 'highlights', KIND_MARKS: 'marks', KIND_PAGE_STATE: 'current_page'}
+
+FILE_HEADER = struct.Struct("<4sHBB")
+BLOCK_HEADER = struct.Struct("<IH")
+COLUMN_HEADER = struct.Struct("<BI")
+COUNT = struct.Struct("<I")
+
+COL_INT32 = 1
+COL_UINT16 = 2
+COL_FLOAT64 = 3
+COL_STR_JOINED = 4
+COL_STR_SIZED = 5
+
+ARRAY_TYPES = {COL_INT32: 'i', COL_UINT16: 'H', COL_FLOAT64: 'd'}
+
+SEPARATOR = "\x00"
+
+BLOCK_SIZE = 16384
+
+
+class BinaryFormatError(ValueError):
+    """Raised when a file is not a valid GenreJinn binary store."""
+
+
+def _pack_numbers(column_type: int, values) -> bytes:
+    numbers = array(ARRAY_TYPES[column_type], values)
+    if sys.byteorder == 'big':
+        numbers.byteswap()
+    return COLUMN_HEADER.pack(column_type, len(numbers) * numbers.itemsize) + numbers.tobytes()
+
+
+def _pack_strings(values: list) -> bytes:
+    joined = SEPARATOR.join(values)
+    # A lone empty string would join to an empty payload, which reads back as no strings
+    if not values or (joined and joined.count(SEPARATOR) == len(values) - 1):
+        payload = joined.encode('utf-8')
+        return COLUMN_HEADER.pack(COL_STR_JOINED, len(payload)) + payload
+    # Some string contains the separator: prefix the count and character lengths
+    lengths = array('I', map(len, values))
+    if sys.byteorder == 'big':
+        lengths.byteswap()
+    payload = COUNT.pack(len(values)) + lengths.tobytes() + "".join(values).encode('utf-8')
+    return COLUMN_HEADER.pack(COL_STR_SIZED, len(payload)) + payload
+
+
+def _pack_categories(values: list) -> tuple:
+    """Dictionary-encode a low-cardinality string column as a table and an index column."""
+    table = {}
+    indices = [table.setdefault(value, len(table)) for value in values]
+    return _pack_strings(list(table)), _pack_numbers(COL_UINT16, indices)
+
+
+class StringColumn:
+    """A string column kept as bytes until its values are first needed."""
+
+    __slots__ = ('column_type', 'payload', '_values')
+
+    def __init__(self, column_type: int, payload: bytes):
+        self.column_type = column_type
+        self.payload = payload
+        self._values = None
+
+    @property
+    def values(self) -> list:
+        if self._values is None:
+            # Another thread may decode it first; it sets _values before dropping payload
+            payload = self.payload
+            if payload is not None:
+                self._values = _unpack_column(self.column_type, payload)
+                self.payload = None
+        return self._values
+
+
+def _unpack_column(column_type: int, payload: bytes, decode_strings: bool = True):
+    if not decode_strings and column_type in (COL_STR_JOINED, COL_STR_SIZED):
+        return StringColumn(column_type, payload)
+    if column_type in ARRAY_TYPES:
+        numbers = array(ARRAY_TYPES[column_type])
+        if len(payload) % numbers.itemsize:
+            raise BinaryFormatError("Truncated numeric column")
+        numbers.frombytes(payload)
+        if sys.byteorder == 'big':
+            numbers.byteswap()
+        return numbers
+    if column_type == COL_STR_JOINED:
+        # An empty payload is ambiguous; writers only emit empty columns for empty tables
+        return payload.decode('utf-8').split(SEPARATOR) if payload else []
+    if column_type == COL_STR_SIZED:
+        if len(payload) < COUNT.size:
+            raise BinaryFormatError("Truncated string column")
+        count, = COUNT.unpack_from(payload)
+        lengths = array('I')
+        lengths_end = COUNT.size + count * lengths.itemsize
+        if len(payload) < lengths_end:
+            raise BinaryFormatError("Truncated string column")
+        lengths.frombytes(payload[COUNT.size:lengths_end])
+        if sys.byteorder == 'big':
+            lengths.byteswap()
+        text = payload[lengths_end:].decode('utf-8')
+        strings, offset = [], 0
+        for length in lengths:
+            strings.append(text[offset:offset + length])
+            offset += length
+        return strings
+    raise BinaryFormatError(f"Unknown column type {column_type}")
+
+
+class BinaryWriter:
+    """Write blocks of columns to a binary stream, stamped with the current schema."""
+
+    def __init__(self, stream, kind: int):
+        self.stream = stream
+        schema = CURRENT_VERSIONS[KIND_NAMES[kind]]
+        self.stream.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, kind, schema))
+
+    def write_block(self, count: int, columns: list) -> None:
+        """Write one block; columns are already packed with the _pack_* helpers."""
+        self.stream.write(BLOCK_HEADER.pack(count, len(columns)))
+        for column in columns:
+            self.stream.write(column)
+
+
+def _read_header(stream, kind: int) -> tuple:
+    """Validate a file header, return (format version, schema version)."""
+    header = stream.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size:
+        raise BinaryFormatError("File too short for a header")
+    magic, version, file_kind, schema = FILE_HEADER.unpack(header)
+    if magic != MAGIC:
+        raise BinaryFormatError("Not a GenreJinn binary store")
+    if version > FORMAT_VERSION:
+        raise BinaryFormatError(f"Format version {version} is newer than {FORMAT_VERSION}")
+    if file_kind != kind:
+        raise BinaryFormatError(f"Expected store kind {kind}, found {file_kind}")
+    return version, stamped_version(KIND_NAMES[kind], schema)
+
+
+def read_schema(path: str, kind: int) -> int:
+    """Schema version of a binary store, read from its header alone."""
+    with open(path, 'rb') as f:
+        return _read_header(f, kind)[1]
+
+
+class BinaryReader:
+    """Read blocks of columns from a binary stream, one block at a time.
+
+    With ``decode_strings=False`` string columns come back as StringColumn
+    objects and are only decoded when their values are used.
+    """
+
+    def __init__(self, stream, kind: int, decode_strings: bool = True):
+        self.stream = stream
+        self.decode_strings = decode_strings
+        self.version, self.schema = _read_header(stream, kind)
+
+    def _read_exactly(self, size: int) -> bytes:
+        data = self.stream.read(size)
+        if len(data) != size:
+            raise BinaryFormatError("Unexpected end of file")
+        return data
+
+    def __iter__(self):
+        """Yield (count, [column, ...]) per block."""
+        while True:
+            header = self.stream.read(BLOCK_HEADER.size)
+            if not header:
+                return
+            if len(header) < BLOCK_HEADER.size:
+                raise BinaryFormatError("Truncated block header")
+            count, column_count = BLOCK_HEADER.unpack(header)
+            columns = []
+            for _ in range(column_count):
+                column_type, size = COLUMN_HEADER.unpack(self._read_exactly(COLUMN_HEADER.size))
+                column = _unpack_column(column_type, self._read_exactly(size),
+                                        self.decode_strings)
+                columns.append(column)
+            yield count, columns
+
+
+@contextmanager
+def _gc_paused():
+    """Pause the cyclic collector while building many tuples that form no cycles."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _check_lengths(count: int, columns: list, expected: int) -> None:
+    if len(columns) != expected or any(len(column) != count for column in columns):
+        raise BinaryFormatError("Column lengths do not match the block record count")
+
+
+def _iter_chunks(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Highlights
+
+def _highlight_pairs(highlights):
+    if isinstance(highlights, Mapping):
+        for page_num in sorted(highlights):
+            for highlight in highlights[page_num]:
+                yield page_num, highlight
+    else:
+        yield from highlights
+
+
+def write_highlights(stream, highlights, block_size: int = BLOCK_SIZE) -> None:
+    """Write a highlights dict, or (page_num, highlight) pairs in page order.
+
+    Pages are run-length encoded, and positions and colors are stored once
+    per block in a table with per-record indices, so the reader can share
+    those objects instead of building one per highlight.
+    """
+    writer = BinaryWriter(stream, KIND_HIGHLIGHTS)
+    for chunk in _iter_chunks(_highlight_pairs(highlights), block_size):
+        run_pages, run_counts = [], []
+        for page_num, run in groupby(page_num for page_num, _ in chunk):
+            run_pages.append(page_num)
+            run_counts.append(len(list(run)))
+
+        positions = {}
+        start_ids, end_ids, texts, notes, colors = [], [], [], [], []
+        for _, highlight in chunk:
+            start_pos, end_pos, text, note, color = parse_highlight_tuple(highlight)
+            start_ids.append(positions.setdefault(tuple(start_pos), len(positions)))
+            end_ids.append(positions.setdefault(tuple(end_pos), len(positions)))
+            texts.append(text)
+            notes.append(note or "")
+            colors.append(color)
+
+        writer.write_block(len(chunk), [
+            _pack_numbers(COL_INT32, run_pages),
+            _pack_numbers(COL_INT32, run_counts),
+            _pack_numbers(COL_INT32, [pos[0] for pos in positions]),
+            _pack_numbers(COL_INT32, [pos[1] for pos in positions]),
+            _pack_numbers(COL_UINT16, start_ids),
+            _pack_numbers(COL_UINT16, end_ids),
+            _pack_strings(texts),
+            _pack_strings(notes),
+            *_pack_categories(colors),
+        ])
+
+
+def _check_highlight_block(count: int, columns: list) -> None:
+    if len(columns) != 10:
+        raise BinaryFormatError("Unexpected highlight column count")
+    run_pages, run_counts, pos_rows, pos_cols, start_ids, end_ids, texts, notes, _, color_ids = columns
+    _check_lengths(count, [start_ids, end_ids, color_ids], 3)
+    if len(run_pages) != len(run_counts) or sum(run_counts) != count:
+        raise BinaryFormatError("Page runs do not match the block record count")
+    if len(pos_rows) != len(pos_cols):
+        raise BinaryFormatError("Position table columns differ in length")
+
+
+class _HighlightBlock:
+    """One decoded block; tables and strings are built on first use."""
+
+    def __init__(self, count: int, columns: list):
+        self.count = count
+        self.columns = columns
+        self._tables = None
+
+    def tables(self) -> tuple:
+        if self._tables is None:
+            _, _, pos_rows, pos_cols, _, _, texts, notes, color_table, _ = self.columns
+            texts, notes = _strings(texts), _strings(notes)
+            _check_lengths(self.count, [texts, notes], 2)
+            self._tables = (list(zip(pos_rows, pos_cols)), texts, notes, _strings(color_table))
+        return self._tables
+
+    def items(self, start: int = 0, stop: int = None) -> list:
+        """Build highlight tuples for records start..stop of this block."""
+        positions, texts, notes, color_table = self.tables()
+        start_ids, end_ids, color_ids = (self.columns[4][start:stop], self.columns[5][start:stop],
+                                         self.columns[9][start:stop])
+        try:
+            starts = map(positions.__getitem__, start_ids)
+            ends = map(positions.__getitem__, end_ids)
+            colors = map(color_table.__getitem__, color_ids)
+            return list(zip(starts, ends, texts[start:stop], notes[start:stop], colors))
+        except IndexError:
+            raise BinaryFormatError("Table index out of range")
+
+
+def _strings(column) -> list:
+    return column.values if isinstance(column, StringColumn) else column
+
+
+class HighlightTable:
+    """Highlights from a binary store, built into tuples a page at a time.
+
+    Opening a store decodes only the numeric columns and the page runs. A
+    block's strings are decoded, and its tuples built, the first time one
+    of its pages is asked for, so showing one page of a large store costs
+    about one block rather than the whole file.
+    """
+
+    def __init__(self, stream):
+        self._blocks = []
+        self._pages = {}  # {page_num: [(block_index, offset, size), ...]}
+        self.count = 0
+        reader = BinaryReader(stream, KIND_HIGHLIGHTS, decode_strings=False)
+        self.schema = reader.schema
+        for count, columns in reader:
+            _check_highlight_block(count, columns)
+            index = len(self._blocks)
+            self._blocks.append(_HighlightBlock(count, columns))
+            offset = 0
+            for page_num, size in zip(columns[0], columns[1]):
+                self._pages.setdefault(page_num, []).append((index, offset, size))
+                offset += size
+            self.count += count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def pages(self) -> list:
+        """Page numbers that have highlights, in order."""
+        return sorted(self._pages)
+
+    def page(self, page_num: int) -> list:
+        """Highlight tuples for one page."""
+        items = []
+        for index, offset, size in self._pages.get(page_num, []):
+            items.extend(self._blocks[index].items(offset, offset + size))
+        return items
+
+    def to_dict(self) -> dict:
+        """Every highlight in the reader's page dict layout."""
+        highlights = {}
+        with _gc_paused():
+            for block in self._blocks:
+                self._add_block(highlights, block)
+        return highlights
+
+    @staticmethod
+    def _add_block(highlights: dict, block) -> None:
+        items = block.items()
+        offset = 0
+        for page_num, size in zip(block.columns[0], block.columns[1]):
+            page_items = items[offset:offset + size]
+            if page_num in highlights:
+                highlights[page_num].extend(page_items)
+            else:
+                highlights[page_num] = page_items
+            offset += size
+
+    def __iter__(self):
+        """Yield (page_num, highlight) pairs in file order."""
+        for block in self._blocks:
+            runs = zip(block.columns[0], block.columns[1])
+            pages = chain.from_iterable(repeat(page_num, size) for page_num, size in runs)
+            yield from zip(pages, block.items())
+
+
+class HighlightPages(MutableMapping):
+    """The reader's ``{page_num: [highlight, ...]}`` dict, decoded a page at a time.
+
+    Pages still in ``table`` are decoded the first time they are looked up
+    and kept as plain lists from then on, so edits work as on a dict.
+    Membership and ``len`` never decode anything. ``copy`` shares the
+    table, so a save can decode the untouched pages on another thread.
+    """
+
+    def __init__(self, table: HighlightTable = None, pages: dict = None):
+        self._table = table
+        self._pages = dict(pages or {})
+        self._unloaded = set(table.pages()).difference(self._pages) if table else set()
+
+    def __getitem__(self, page_num: int) -> list:
+        if page_num in self._unloaded:
+            self._pages[page_num] = self._table.page(page_num)
+            self._unloaded.discard(page_num)
+        return self._pages[page_num]
+
+    def __setitem__(self, page_num: int, items: list) -> None:
+        self._unloaded.discard(page_num)
+        self._pages[page_num] = items
+
+    def __delitem__(self, page_num: int) -> None:
+        if page_num in self._unloaded:
+            self._unloaded.discard(page_num)
+        else:
+            del self._pages[page_num]
+
+    def __contains__(self, page_num) -> bool:
+        return page_num in self._pages or page_num in self._unloaded
+
+    def __iter__(self):
+        # A snapshot, since looking pages up moves them out of _unloaded
+        return iter(sorted(self._unloaded.union(self._pages)))
+
+    def __len__(self) -> int:
+        return len(self._pages) + len(self._unloaded)
+
+    def copy(self) -> 'HighlightPages':
+        """A copy whose page lists can be edited without touching this one."""
+        copied = HighlightPages(pages={page_num: list(items) for page_num, items in self._pages.items()})
+        copied._table = self._table
+        copied._unloaded = set(self._unloaded)
+        return copied
+
+    def changes_since(self, older: 'HighlightPages') -> tuple:
+        """What turns ``older`` into this mapping, as (upserts, deletes).
+
+        Upserts are (page_num, highlight) pairs and deletes are
+        (page_num, start_pos) pairs. Pages that both still hold undecoded
+        from the same table are skipped without decoding them.
+        """
+        upserts, deletes = [], []
+        for page_num in sorted(self._unloaded.union(self._pages, older._unloaded, older._pages)):
+            if (page_num in self._unloaded and page_num in older._unloaded
+                    and self._table is older._table):
+                continue
+            before = {tuple(h[0]): h for h in older.get(page_num, [])}
+            after = {tuple(h[0]): h for h in self.get(page_num, [])}
+            upserts.extend((page_num, h) for start, h in after.items() if before.get(start) != h)
+            deletes.extend((page_num, start) for start in before if start not in after)
+        return upserts, deletes
+
+
+def iter_highlights(stream):
+    """Yield (page_num, highlight) pairs block by block."""
+    for count, columns in BinaryReader(stream, KIND_HIGHLIGHTS):
+        _check_highlight_block(count, columns)
+        block = _HighlightBlock(count, columns)
+        runs = zip(columns[0], columns[1])
+        pages = chain.from_iterable(repeat(page_num, size) for page_num, size in runs)
+        yield from zip(pages, block.items())
+
+
+def read_highlights(stream) -> dict:
+    """Read a whole highlights store into the reader's page dict."""
+    return HighlightTable(stream).to_dict()
+
+
+# Marks
+
+def write_marks(stream, marks, block_size: int = BLOCK_SIZE) -> None:
+    """Write mark tuples; marks without a timestamp get 0."""
+    writer = BinaryWriter(stream, KIND_MARKS)
+    for chunk in _iter_chunks(marks, block_size):
+        writer.write_block(len(chunk), [
+            _pack_numbers(COL_INT32, [mark[0] for mark in chunk]),
+            _pack_numbers(COL_INT32, [mark[1] for mark in chunk]),
+            _pack_numbers(COL_INT32, [mark[2] for mark in chunk]),
+            _pack_strings([mark[3] for mark in chunk]),
+            _pack_strings([str(mark[4]) for mark in chunk]),
+            _pack_numbers(COL_FLOAT64, [mark[5] if len(mark) >= 6 else 0 for mark in chunk]),
+        ])
+
+
+def _mark_records(reader: BinaryReader):
+    for count, columns in reader:
+        _check_lengths(count, columns, 6)
+        yield from zip(*columns)
+
+
+def iter_marks(stream):
+    """Yield mark tuples block by block."""
+    yield from _mark_records(BinaryReader(stream, KIND_MARKS))
+
+
+def read_marks_with_schema(stream) -> tuple:
+    """Read a whole marks store, return (marks, schema version) from one pass over the file."""
+    reader = BinaryReader(stream, KIND_MARKS)
+    with _gc_paused():
+        return list(_mark_records(reader)), reader.schema
+
+
+def read_marks(stream) -> list:
+    """Read a whole marks store."""
+    return read_marks_with_schema(stream)[0]
+
+
+# Page state
+
+def write_page_state(stream, current_page: int) -> None:
+    """Write the current page number."""
+    BinaryWriter(stream, KIND_PAGE_STATE).write_block(1, [_pack_numbers(COL_INT32, [current_page])])
+
+
+def read_page_state(stream) -> int:
+    """Read the current page number."""
+    for count, columns in BinaryReader(stream, KIND_PAGE_STATE):
+        _check_lengths(count, columns, 1)
+        return columns[0][0]
+    raise BinaryFormatError("Page state file has no record")
+
+
+def dumps(write_func, data) -> bytes:
+    """Serialise with one of the write_* functions into bytes, for atomic_write."""
+    buffer = io.BytesIO()
+    write_func(buffer, data)
+    return buffer.getvalue()
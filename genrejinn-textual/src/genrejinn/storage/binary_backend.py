@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Storage backend built on the original single-file stores."""
+
+import os
+import threading
+from contextlib import contextmanager
+
+from .backend import StorageBackend, highlight_key, mark_key
+from .highlights import HighlightStorage
+from .locking import CONFLICT_POLICIES, ConflictError, FileLock, file_version
+from .marks import MarkStorage
+from .metrics import metrics
+from .page_state import PageStateManager
+from ..utils.debug import debug_log
+
+
+class BinaryBackend(StorageBackend):
+    """Keep each store as one file, as GenreJinn always has.
+
+    The files use the binary format in ``binary.py``; old ``.pkl`` files are
+    still read until the first save. Single-record edits rewrite the whole
+    file. Until something is edited, pages are built from the highlight
+    store one at a time instead of decoding every highlight up front.
+
+    Several processes may share a data directory. Each write takes an
+    advisory lock on its store and first checks whether the file was
+    replaced since this process read it; if so the cache is reloaded and
+    the edit applied on top, so concurrent edits to different records all
+    survive. Editing a record the other process also changed is a
+    conflict: under the ``merge`` policy the later write wins for that
+    record, under ``reject`` a ConflictError is raised and nothing is
+    written (the cache is left fresh, so the caller can look again).
+    """
+
+    name = "binary"
+
+    STORES = ('highlights', 'marks', 'current_page')
+
+    def __init__(self, data_dir: str = "data", conflict_policy: str = "merge"):
+        if conflict_policy not in CONFLICT_POLICIES:
+            raise ValueError(f"Unknown conflict policy: {conflict_policy}")
+        self.data_dir = data_dir
+        self.conflict_policy = conflict_policy
+        self.highlight_storage = HighlightStorage(os.path.join(data_dir, "highlights.gjb"))
+        self.mark_storage = MarkStorage(os.path.join(data_dir, "marks.gjb"))
+        self.page_state_manager = PageStateManager(os.path.join(data_dir, "current_page.gjb"))
+        self._highlights = None
+        self._table = None
+        self._marks = None
+        self._lock = threading.RLock()
+        self._store_locks = {
+            store: FileLock(os.path.join(data_dir, f".{store}.lock")) for store in self.STORES
+        }
+        self._versions = {}  # {store: file_version when the cache was read}
+
+    # Cross-process consistency
+
+    def _store_path(self, store: str) -> str:
+        return {
+            'highlights': self.highlight_storage.storage_path,
+            'marks': self.mark_storage.storage_path,
+            'current_page': self.page_state_manager.storage_path,
+        }[store]
+
+    def _forget(self, store: str):
+        """Drop the cached copy of a store, return what it held."""
+        if store == 'highlights':
+            old = self._highlights if self._highlights is not None else self._table
+            self._highlights = self._table = None
+            return old
+        if store == 'marks':
+            old, self._marks = self._marks, None
+            return old
+        return None
+
+    def _refresh(self, store: str):
+        """Drop a store's cache if another process replaced the file since it was read.
+
+        Returns the stale cache, or None if it was still current.
+        """
+        with self._lock:
+            if store not in self._versions:
+                return None
+            if file_version(self._store_path(store)) == self._versions[store]:
+                return None
+            del self._versions[store]
+            metrics.increment(f"{self.name}.reloads")
+            return self._forget(store)
+
+    @contextmanager
+    def _writing(self, store: str):
+        """Hold a store's process lock around a read-modify-write; yields the stale cache."""
+        with self._lock, self._store_locks[store]:
+            stale = self._refresh(store)
+            yield stale
+            self._versions[store] = file_version(self._store_path(store))
+
+    def _check_conflicts(self, store: str, changes: list) -> None:
+        """Handle records changed elsewhere; changes are (key, seen_here, on_disk) triples."""
+        keys = [key for key, seen, current in changes if seen != current]
+        if not keys:
+            return
+        metrics.increment(f"{self.name}.conflicts", len(keys))
+        if self.conflict_policy == 'reject':
+            raise ConflictError(store, keys)
+        debug_log(f"Overwrote {len(keys)} {store} record(s) changed by another process")
+
+    def _old_page(self, view, page_num: int):
+        """A page as a stale cache held it, or None if it was never read."""
+        if view is None:
+            return None
+        if isinstance(view, dict):
+            return view.get(page_num, [])
+        return view.page(page_num)
+
+    def _highlight_changes(self, stale, items, current: dict) -> list:
+        changes = []
+        for page_num, start_pos in items:
+            seen = self._old_page(stale, page_num)
+            if seen is None:
+                continue
+            key = (page_num, tuple(start_pos))
+            changes.append((key, _find_highlight(seen, start_pos),
+                            _find_highlight(current.get(page_num, []), start_pos)))
+        return changes
+
+    # Caches
+
+    def _all_highlights(self) -> dict:
+        with self._lock:
+            if self._highlights is None:
+                if self._table is not None:
+                    self._highlights = self._table.to_dict()
+                    self._table = None
+                else:
+                    self._versions['highlights'] = file_version(self._store_path('highlights'))
+                    self._highlights = self.highlight_storage.load_highlights()
+            return self._highlights
+
+    def _all_marks(self) -> list:
+        with self._lock:
+            if self._marks is None:
+                self._versions['marks'] = file_version(self._store_path('marks'))
+                self._marks = self.mark_storage.load_marks()
+            return self._marks
+
+    def load_highlights(self) -> dict:
+        with self._lock:
+            self._refresh('highlights')
+            return {page: list(items) for page, items in self._all_highlights().items()}
+
+    def load_page_highlights(self, page_num: int) -> list:
+        with self._lock:
+            self._refresh('highlights')
+            if self._highlights is None:
+                if self._table is None:
+                    self._versions['highlights'] = file_version(self._store_path('highlights'))
+                    self._table = self.highlight_storage.load_table()
+                if self._table is not None:
+                    return self._table.page(page_num)
+            return list(self._all_highlights().get(page_num, []))
+
+    def iter_highlights(self):
+        highlights = self.load_highlights()
+        for page_num in sorted(highlights):
+            for highlight in sorted(highlights[page_num], key=lambda h: h[0]):
+                yield page_num, highlight
+
+    def save_highlights(self, highlights: dict) -> None:
+        with self._writing('highlights') as stale:
+            if stale is not None:
+                self._check_conflicts('highlights', [('all', 'seen', 'replaced')])
+            self._highlights = {page: list(items) for page, items in highlights.items()}
+            self._table = None
+            self.highlight_storage.save_highlights(self._highlights)
+
+    def _put_highlight(self, page_num: int, highlight: tuple) -> None:
+        highlights = self._all_highlights()
+        key = highlight_key(page_num, highlight)
+        page_highlights = [
+            h for h in highlights.get(page_num, []) if highlight_key(page_num, h) != key
+        ]
+        page_highlights.append(highlight)
+        highlights[page_num] = page_highlights
+
+    def upsert_highlight(self, page_num: int, highlight: tuple) -> None:
+        self.upsert_highlights([(page_num, highlight)])
+
+    def upsert_highlights(self, items) -> None:
+        # One file rewrite for the whole batch
+        items = list(items)
+        with self._writing('highlights') as stale:
+            highlights = self._all_highlights()
+            self._check_conflicts('highlights', self._highlight_changes(
+                stale, [(page_num, highlight[0]) for page_num, highlight in items], highlights))
+            for page_num, highlight in items:
+                self._put_highlight(page_num, highlight)
+            self.highlight_storage.save_highlights(highlights)
+
+    def delete_highlight(self, page_num: int, start_pos: tuple) -> bool:
+        with self._writing('highlights') as stale:
+            highlights = self._all_highlights()
+            self._check_conflicts('highlights',
+                                  self._highlight_changes(stale, [(page_num, start_pos)], highlights))
+            page_highlights = highlights.get(page_num, [])
+            remaining = [h for h in page_highlights if tuple(h[0]) != tuple(start_pos)]
+            if len(remaining) == len(page_highlights):
+                return False
+            if remaining:
+                highlights[page_num] = remaining
+            else:
+                del highlights[page_num]
+            self.highlight_storage.save_highlights(highlights)
+            return True
+
+    def load_marks(self) -> list:
+        with self._lock:
+            self._refresh('marks')
+            return list(self._all_marks())
+
+    def _write_marks(self, marks: list) -> None:
+        self._marks = list(marks)
+        self.mark_storage.save_marks(self._marks)
+
+    def _mark_changes(self, stale, key: tuple, current: list) -> list:
+        if stale is None:
+            return []
+        return [(key, _find_mark(stale, key), _find_mark(current, key))]
+
+    def save_marks(self, marks: list) -> None:
+        with self._writing('marks') as stale:
+            if stale is not None:
+                self._check_conflicts('marks', [('all', 'seen', 'replaced')])
+            self._write_marks(marks)
+
+    def upsert_mark(self, mark: tuple) -> None:
+        with self._writing('marks') as stale:
+            key = mark_key(mark)
+            current = self._all_marks()
+            self._check_conflicts('marks', self._mark_changes(stale, key, current))
+            marks = [m for m in current if mark_key(m) != key]
+            marks.append(mark)
+            self._write_marks(marks)
+
+    def delete_mark(self, mark: tuple) -> bool:
+        with self._writing('marks') as stale:
+            key = mark_key(mark)
+            marks = self._all_marks()
+            self._check_conflicts('marks', self._mark_changes(stale, key, marks))
+            remaining = [m for m in marks if mark_key(m) != key]
+            if len(remaining) == len(marks):
+                return False
+            self._write_marks(remaining)
+            return True
+
+    def load_current_page(self, total_pages: int) -> int:
+        return self.page_state_manager.load_current_page(total_pages)
+
+    def save_current_page(self, current_page: int) -> None:
+        # The reading position has no merge; the last writer wins
+        with self._writing('current_page'):
+            self.page_state_manager.save_current_page(current_page)
+
+    def get_storage_info(self) -> dict:
+        return {
+            'backend': self.name,
+            'highlights': self.highlight_storage.get_storage_info(),
+            'marks': self.mark_storage.get_storage_info(),
+            'page_state': self.page_state_manager.get_storage_info(),
+        }
+
+
+def _find_highlight(page_highlights: list, start_pos: tuple):
+    start_pos = tuple(start_pos)
+    for highlight in page_highlights:
+        if tuple(highlight[0]) == start_pos:
+            return highlight
+    return None
+
+
+def _find_mark(marks: list, key: tuple):
+    for mark in marks:
+        if mark_key(mark) == key:
+            return mark
+    return None
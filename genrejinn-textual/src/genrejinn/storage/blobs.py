@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Append-only blob store for note bodies."""
+
+import json
+import os
+import re
+import struct
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from .atomic import atomic_json_dump
+from .metrics import metrics
+from ..utils.debug import debug_log
+
+
+# Each record is <key length><body length><key utf-8><body utf-8>
+RECORD_HEADER = struct.Struct("<HI")
+
+# NoteRef.flags bits
+NOTE_HAS_IMAGES = 1
+
+IMAGE_URL_PATTERN = re.compile(r'https?://[^\s]+\.(?:jpg|jpeg|png|gif|webp)', re.IGNORECASE)
+
+
+class NoteRef(namedtuple('NoteRef', 'key length flags')):
+    """Stand-in for a note body kept in a NoteBlobStore.
+
+    Carries just enough to render a list without the body: its length and
+    flags such as ``NOTE_HAS_IMAGES``. It is falsy for empty notes, like
+    the empty string it replaces.
+    """
+
+    __slots__ = ()
+
+    def __bool__(self) -> bool:
+        return self.length > 0
+
+    @property
+    def has_images(self) -> bool:
+        return bool(self.flags & NOTE_HAS_IMAGES)
+
+
+def note_flags(text: str) -> int:
+    """Compute NoteRef flags for a note body."""
+    return NOTE_HAS_IMAGES if IMAGE_URL_PATTERN.search(text) else 0
+
+
+class NoteBlobStore:
+    """Store note bodies in one append-only file with an offset index.
+
+    Writing a note appends a record and points the index at it. The index
+    is checkpointed to ``<path>.idx`` (JSON) now and then; on open the
+    checkpoint is loaded and only records appended after it are scanned.
+    A checkpoint that cannot be read, such as a pickled one from an earlier
+    version, just means a full scan. ``compact`` drops superseded records
+    once they outweigh live ones.
+    """
+
+    def __init__(self, path: str, checkpoint_every: int = 256):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self.checkpoint_every = checkpoint_every
+
+        self.index = {}  # {key: (offset, length)} of the body bytes
+        self._garbage = 0
+        self._since_checkpoint = 0
+        self._lock = threading.Lock()
+        self._end = 0  # bytes of the file indexed so far
+        self._load_index()
+        self._file = open(self.path, 'a+b')
+
+    def _load_index(self) -> None:
+        scanned_from = 0
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, 'rb') as f:
+                    checkpoint = json.load(f)
+                self.index = {key: tuple(location) for key, location in checkpoint['index'].items()}
+                self._garbage = checkpoint.get('garbage', 0)
+                scanned_from = checkpoint['end']
+            except Exception as e:
+                debug_log(f"Error loading note index, rescanning {self.path}: {e}")
+                self.index, self._garbage = {}, 0
+
+        if not self.path.exists():
+            return
+        file_size = self.path.stat().st_size
+        if scanned_from > file_size:
+            # Checkpoint is newer than the data file; trust only the data
+            self.index, self._garbage, scanned_from = {}, 0, 0
+        with open(self.path, 'rb') as f:
+            f.seek(scanned_from)
+            good_offset = self._scan(f, scanned_from)
+        self._end = good_offset
+        if good_offset < file_size:
+            debug_log(f"Truncating torn note record in {self.path} at byte {good_offset}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_offset)
+
+    def _scan(self, f, offset: int) -> int:
+        """Index records from offset to the end of a file, return the last good offset."""
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return offset
+            key_length, body_length = RECORD_HEADER.unpack(header)
+            key_bytes = f.read(key_length)
+            body_offset = offset + RECORD_HEADER.size + key_length
+            f.seek(body_length, os.SEEK_CUR)
+            if len(key_bytes) < key_length or f.tell() > os.fstat(f.fileno()).st_size:
+                return offset
+            key = key_bytes.decode('utf-8')
+            if key in self.index:
+                self._garbage += self.index[key][1]
+            self.index[key] = (body_offset, body_length)
+            offset = body_offset + body_length
+
+    def put(self, key: str, text: str) -> NoteRef:
+        """Store a note body and return its reference."""
+        body = text.encode('utf-8')
+        key_bytes = key.encode('utf-8')
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(RECORD_HEADER.pack(len(key_bytes), len(body)) + key_bytes + body)
+            self._file.flush()
+            metrics.add_bytes('notes', RECORD_HEADER.size + len(key_bytes) + len(body))
+            if key in self.index:
+                self._garbage += self.index[key][1]
+            self.index[key] = (offset + RECORD_HEADER.size + len(key_bytes), len(body))
+            self._end = self.index[key][0] + len(body)
+            self._since_checkpoint += 1
+            if self._since_checkpoint >= self.checkpoint_every:
+                self._checkpoint()
+        return NoteRef(key, len(text), note_flags(text))
+
+    def refresh(self) -> None:
+        """Index records other processes appended, or reload if they compacted the file.
+
+        Writers must hold a lock shared by every process using the file.
+        """
+        with self._lock:
+            try:
+                replaced = os.fstat(self._file.fileno()).st_ino != self.path.stat().st_ino
+            except FileNotFoundError:
+                return
+            if replaced:
+                self._file.close()
+                self.index, self._garbage, self._end = {}, 0, 0
+                self._load_index()
+                self._file = open(self.path, 'a+b')
+            else:
+                self._file.seek(self._end)
+                self._end = self._scan(self._file, self._end)
+
+    def get(self, key: str) -> str:
+        """Read a note body, or return "" if it is unknown."""
+        with self._lock:
+            location = self.index.get(key)
+            if location is None:
+                return ""
+            offset, length = location
+            self._file.seek(offset)
+            return self._file.read(length).decode('utf-8')
+
+    def delete(self, key: str) -> None:
+        """Forget a note body; its bytes are reclaimed by the next compaction."""
+        with self._lock:
+            location = self.index.pop(key, None)
+            if location is not None:
+                self._garbage += location[1]
+
+    def _checkpoint(self) -> None:
+        os.fsync(self._file.fileno())
+        atomic_json_dump({
+            'end': self._file.seek(0, os.SEEK_END),
+            'index': self.index,
+            'garbage': self._garbage,
+        }, self.index_path)
+        self._since_checkpoint = 0
+
+    def compact(self, min_garbage: int = 1024 * 1024) -> bool:
+        """Rewrite the store without superseded bodies if enough space is wasted."""
+        with self._lock:
+            live = sum(length for _, length in self.index.values())
+            if self._garbage < min_garbage or self._garbage < live:
+                return False
+
+            temp_path = self.path.with_name(self.path.name + ".compact")
+            new_index = {}
+            with open(temp_path, 'wb') as out:
+                for key, (offset, length) in self.index.items():
+                    self._file.seek(offset)
+                    body = self._file.read(length)
+                    key_bytes = key.encode('utf-8')
+                    out.write(RECORD_HEADER.pack(len(key_bytes), length) + key_bytes)
+                    new_index[key] = (out.tell(), length)
+                    out.write(body)
+                out.flush()
+                os.fsync(out.fileno())
+
+            self._file.close()
+            os.replace(temp_path, self.path)
+            self._file = open(self.path, 'a+b')
+            self.index = new_index
+            self._garbage = 0
+            self._end = self._file.seek(0, os.SEEK_END)
+            self._checkpoint()
+        debug_log(f"Compacted note store {self.path}")
+        return True
+
+    def get_storage_info(self) -> dict:
+        with self._lock:
+            exists = self.path.exists()
+            return {
+                'exists': exists,
+                'notes': len(self.index),
+                'size': self.path.stat().st_size if exists else 0,
+                'garbage': self._garbage,
+                'path': str(self.path),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            self._checkpoint()
+            self._file.close()
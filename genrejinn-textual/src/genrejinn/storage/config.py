@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Storage configuration and backend selection."""
+
+import os
+
+from .binary_backend import BinaryBackend
+from .daemon_backend import DaemonBackend
+from .journal_backend import JournalBackend
+from .namespace import StorageNamespace
+from .sharded import ShardedBackend
+from .sqlite_backend import SQLiteBackend
+
+
+BACKENDS = {
+    'binary': BinaryBackend,
+    'sqlite': SQLiteBackend,
+    'journal': JournalBackend,
+    'sharded': ShardedBackend,
+    'daemon': DaemonBackend,
+}
+
+# Older names still accepted in GENREJINN_STORAGE_BACKEND. 'binary' was called
+# 'pickle' back when it wrote pickle files.
+BACKEND_ALIASES = {
+    'pickle': 'binary',
+}
+
+
+def backend_name(name: str) -> str:
+    """Resolve a configured backend name, following old aliases."""
+    name = name.lower()
+    return BACKEND_ALIASES.get(name, name)
+
+
+def reader_id() -> str:
+    """Whose annotations this process reads and writes.
+
+    GENREJINN_USER_ID (or GENREJINN_SESSION_ID) names a reader. Without
+    one every session, local or served, is the shared reader 'local', so
+    annotations survive reloads and show up in every browser tab; stores
+    are still kept apart per book. Separate readers need separate ids, for
+    example one server per reader with GENREJINN_USER_ID set.
+    """
+    return os.environ.get('GENREJINN_USER_ID') or os.environ.get('GENREJINN_SESSION_ID') or 'local'
+
+
+def get_storage_config() -> dict:
+    """Get storage configuration from environment or defaults."""
+    server_mode = os.environ.get('GENREJINN_SERVER_MODE') == '1'
+    return {
+        'backend': backend_name(os.environ.get('GENREJINN_STORAGE_BACKEND', 'binary')),
+        'data_dir': os.environ.get('GENREJINN_DATA_DIR', 'data'),
+        'book_id': os.environ.get('GENREJINN_BOOK_ID', 'default'),
+        'user_id': reader_id(),
+        # Per-book, per-reader directories; on by default when serving many readers
+        'namespaced': os.environ.get('GENREJINN_NAMESPACES', '1' if server_mode else '0') != '0',
+        'journal_compact_bytes': int(os.environ.get('GENREJINN_JOURNAL_COMPACT_BYTES', 1024 * 1024)),
+        'journal_fsync_interval': float(os.environ.get('GENREJINN_JOURNAL_FSYNC_INTERVAL', 1.0)),
+        'save_window': float(os.environ.get('GENREJINN_SAVE_WINDOW', 0.5)),
+        'pages_per_shard': int(os.environ.get('GENREJINN_PAGES_PER_SHARD', 1)),
+        'lazy_notes': os.environ.get('GENREJINN_LAZY_NOTES', '1') != '0',
+        'metrics_file': os.environ.get('GENREJINN_METRICS_FILE', ''),
+        'conflict_policy': os.environ.get('GENREJINN_CONFLICT_POLICY', 'merge').lower(),
+        # Empty means <data_dir>/annotations.sock
+        'daemon_socket': os.environ.get('GENREJINN_DAEMON_SOCKET', ''),
+        'image_cache_bytes': int(float(os.environ.get('GENREJINN_IMAGE_CACHE_MB', 256)) * 1024 * 1024),
+        'image_max_bytes': int(float(os.environ.get('GENREJINN_IMAGE_MAX_MB', 20)) * 1024 * 1024),
+        'image_timeout': float(os.environ.get('GENREJINN_IMAGE_TIMEOUT', 60)),
+        'decoded_image_bytes': int(float(os.environ.get('GENREJINN_DECODED_IMAGE_MB', 64)) * 1024 * 1024),
+        'image_prefetch_pages': int(os.environ.get('GENREJINN_IMAGE_PREFETCH_PAGES', 2)),
+    }
+
+
+def create_backend(config: dict = None):
+    """Create the storage backend named in the configuration."""
+    config = dict(get_storage_config(), **(config or {}))
+    # The daemon listens in the data root, not in a reader's namespace
+    config['daemon_socket'] = config['daemon_socket'] or os.path.join(config['data_dir'], "annotations.sock")
+    if config['namespaced']:
+        config = StorageNamespace.from_config(config).backend_config(config)
+    backend = backend_name(config['backend'])
+
+    if backend == 'binary':
+        return BinaryBackend(config['data_dir'], config['conflict_policy'])
+    if backend == 'sqlite':
+        return SQLiteBackend(os.path.join(config['data_dir'], "annotations.db"), config['book_id'])
+    if backend == 'journal':
+        return JournalBackend(
+            config['data_dir'],
+            compact_bytes=config['journal_compact_bytes'],
+            fsync_interval=config['journal_fsync_interval']
+        )
+    if backend == 'sharded':
+        return ShardedBackend(config['data_dir'], config['pages_per_shard'],
+                              lazy_notes=config['lazy_notes'],
+                              conflict_policy=config['conflict_policy'])
+    if backend == 'daemon':
+        # Not the reader id: one reader's sessions (two tabs) must see each other's edits
+        return DaemonBackend(config['daemon_socket'], config['data_dir'], config['book_id'])
+
+    raise ValueError(f"Unknown storage backend: {backend} (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Convert old pickle stores to the binary format."""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from .config import get_storage_config
+from .highlights import HighlightStorage
+from .legacy import load_legacy_pickle
+from .marks import MarkStorage
+from .page_state import PageStateManager
+from .schema import LEGACY_VERSION, format_report, migrate
+
+
+STORE_KINDS = ('highlights', 'marks', 'current_page')
+
+
+def detect_kind(path: str, data) -> str:
+    """Work out which store a pickle file holds from its name, then its contents."""
+    stem = Path(path).stem
+    if stem in STORE_KINDS:
+        return stem
+    if isinstance(data, dict):
+        return 'highlights'
+    if isinstance(data, list):
+        return 'marks'
+    if isinstance(data, int):
+        return 'current_page'
+    raise ValueError(f"Cannot tell what kind of store {path} is")
+
+
+def convert_pickle_file(path: str, output: str = None, **options) -> dict:
+    """Convert one .pkl store to a .gjb file next to it (or at output).
+
+    The data is brought up to the current schema on the way; options are
+    passed to the upgraders.
+    """
+    data = load_legacy_pickle(path, force=True)
+    if data is None:
+        raise FileNotFoundError(path)
+    kind = detect_kind(path, data)
+    output = output or str(Path(path).with_suffix('.gjb'))
+    data, steps = migrate(kind, data, LEGACY_VERSION, **options)
+
+    if kind == 'highlights':
+        HighlightStorage(output).save_highlights(data)
+        records = sum(len(items) for items in data.values())
+    elif kind == 'marks':
+        MarkStorage(output).save_marks(data)
+        records = len(data)
+    else:
+        PageStateManager(output).save_current_page(data)
+        records = 1
+
+    return {
+        'kind': kind,
+        'records': records,
+        'source': path,
+        'output': output,
+        'source_size': Path(path).stat().st_size,
+        'output_size': Path(output).stat().st_size,
+        'migrations': steps,
+    }
+
+
+def parse_convert_arguments(argv: list = None) -> argparse.Namespace:
+    """Parse command line arguments for store conversion."""
+    config = get_storage_config()
+    parser = argparse.ArgumentParser(description='Convert GenreJinn pickle stores to the binary format')
+    parser.add_argument('files', nargs='*',
+                        help='Pickle files to convert (default: the stores in --data-dir)')
+    parser.add_argument('--data-dir', default=config['data_dir'],
+                        help=f"Data directory (default: {config['data_dir']})")
+    parser.add_argument('--double-brackets', action='store_true',
+                        help='Files come from epub_parser.py, which marks yellow with [[ ]]')
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> int:
+    """Convert pickle stores from the command line."""
+    args = parse_convert_arguments(argv)
+    files = args.files or [
+        str(path) for path in (Path(args.data_dir) / f"{kind}.pkl" for kind in STORE_KINDS)
+        if path.exists()
+    ]
+    if not files:
+        print("Nothing to convert")
+        return 0
+
+    options = {'yellow_brackets': ('[[', ']]')} if args.double_brackets else {}
+    for path in files:
+        start = time.perf_counter()
+        try:
+            summary = convert_pickle_file(path, **options)
+        except Exception as e:
+            print(f"Error converting {path}: {e}")
+            return 1
+        print(f"Converted {summary['records']} {summary['kind']} records: "
+              f"{summary['source']} ({summary['source_size']} bytes) -> "
+              f"{summary['output']} ({summary['output_size']} bytes) "
+              f"in {time.perf_counter() - start:.3f}s")
+        print(format_report(summary['migrations']))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
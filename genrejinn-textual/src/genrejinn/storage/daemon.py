@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Annotation daemon: one process owns the stores, sessions talk to it over a Unix socket."""
+
+import argparse
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from pathlib import Path
+
+from .backend import highlight_key, mark_key
+from .config import BACKENDS, create_backend, get_storage_config
+from .metrics import metrics
+from .protocol import (DaemonError, ProtocolError, decode_highlight, decode_highlights,
+                       decode_mark, encode_highlight, encode_highlights, recv_message,
+                       send_message)
+from .worker import PersistenceWorker
+from ..utils.debug import debug_log
+
+
+SOCKET_NAME = "annotations.sock"
+
+
+class SharedStore:
+    """The in-memory annotations of one data directory, shared by every session.
+
+    Pages are read from the disk backend the first time a session asks for
+    them. Edits change memory at once and are written back in batches by
+    the daemon's persistence worker, so a burst of edits from many
+    sessions costs one write per store per save window.
+    """
+
+    def __init__(self, store_dir: str, backend, worker: PersistenceWorker):
+        self.store_dir = store_dir
+        self.backend = backend
+        self.worker = worker
+        self.lock = threading.RLock()
+        # Held while highlights are written to the backend; taken before ``lock``
+        self.write_lock = threading.Lock()
+        self.pages = {}  # {page_num: [highlight, ...]} for pages read so far
+        self.all_loaded = False
+        self.marks = None
+        self.current_page = None
+        self._dirty_highlights = {}
+        self._deleted_highlights = set()
+
+    # Highlights
+
+    def _page(self, page_num: int) -> list:
+        if page_num not in self.pages:
+            self.pages[page_num] = [self.backend.resolve_highlight(h)
+                                    for h in self.backend.load_page_highlights(page_num)]
+        return self.pages[page_num]
+
+    def get_page(self, page_num: int) -> list:
+        with self.lock:
+            return list(self._page(page_num))
+
+    def get_all(self) -> dict:
+        with self.lock:
+            if not self.all_loaded:
+                # Pages already in memory may hold edits not yet on disk
+                stored = {}
+                for page_num, highlight in self.backend.iter_highlights():
+                    if page_num not in self.pages:
+                        stored.setdefault(page_num, []).append(self.backend.resolve_highlight(highlight))
+                self.pages.update(stored)
+                self.all_loaded = True
+            return {page_num: list(items) for page_num, items in self.pages.items() if items}
+
+    def upsert(self, items: list) -> None:
+        with self.lock:
+            for page_num, highlight in items:
+                key = highlight_key(page_num, highlight)
+                page = [h for h in self._page(page_num) if highlight_key(page_num, h) != key]
+                page.append(highlight)
+                self.pages[page_num] = page
+                self._dirty_highlights[key] = (page_num, highlight)
+                self._deleted_highlights.discard(key)
+        self.worker.schedule(f"{self.store_dir}:highlights", self._flush_highlights)
+
+    def delete(self, page_num: int, start_pos: tuple) -> bool:
+        with self.lock:
+            page = self._page(page_num)
+            remaining = [h for h in page if tuple(h[0]) != tuple(start_pos)]
+            if len(remaining) == len(page):
+                return False
+            self.pages[page_num] = remaining
+            key = (page_num, tuple(start_pos))
+            self._dirty_highlights.pop(key, None)
+            self._deleted_highlights.add(key)
+        self.worker.schedule(f"{self.store_dir}:highlights", self._flush_highlights)
+        return True
+
+    def replace_all(self, highlights: dict) -> None:
+        # Never wait on the worker here: its flush may be queued behind this lock.
+        # The write lock lets a flush already writing finish first, and edits
+        # not yet written are dropped, since the new highlights replace them
+        with self.write_lock, self.lock:
+            self._dirty_highlights = {}
+            self._deleted_highlights = set()
+            self.backend.save_highlights(highlights)
+            self.pages = {page_num: list(items) for page_num, items in highlights.items()}
+            self.all_loaded = True
+
+    def _flush_highlights(self) -> None:
+        with self.write_lock:
+            with self.lock:
+                dirty, self._dirty_highlights = self._dirty_highlights, {}
+                deleted, self._deleted_highlights = self._deleted_highlights, set()
+            if dirty:
+                self.backend.upsert_highlights(list(dirty.values()))
+            for page_num, start_pos in deleted:
+                self.backend.delete_highlight(page_num, start_pos)
+        metrics.increment('daemon.flushed_records', len(dirty) + len(deleted))
+
+    # Marks
+
+    def _marks(self) -> list:
+        if self.marks is None:
+            self.marks = list(self.backend.load_marks())
+        return self.marks
+
+    def get_marks(self) -> list:
+        with self.lock:
+            return list(self._marks())
+
+    def set_marks(self, marks: list) -> None:
+        with self.lock:
+            self.marks = list(marks)
+        self.worker.schedule(f"{self.store_dir}:marks", self._flush_marks)
+
+    def upsert_mark(self, mark: tuple) -> None:
+        with self.lock:
+            key = mark_key(mark)
+            self.marks = [m for m in self._marks() if mark_key(m) != key] + [mark]
+        self.worker.schedule(f"{self.store_dir}:marks", self._flush_marks)
+
+    def delete_mark(self, mark: tuple) -> bool:
+        with self.lock:
+            key = mark_key(mark)
+            marks = self._marks()
+            remaining = [m for m in marks if mark_key(m) != key]
+            if len(remaining) == len(marks):
+                return False
+            self.marks = remaining
+        self.worker.schedule(f"{self.store_dir}:marks", self._flush_marks)
+        return True
+
+    def _flush_marks(self) -> None:
+        with self.lock:
+            marks = list(self.marks)
+        self.backend.save_marks(marks)
+
+    # Reading position
+
+    def get_current_page(self, total_pages: int) -> int:
+        with self.lock:
+            if self.current_page is None:
+                self.current_page = self.backend.load_current_page(sys.maxsize)
+            page = self.current_page
+        return page if 0 <= page < total_pages else 0
+
+    def set_current_page(self, page: int) -> None:
+        with self.lock:
+            self.current_page = page
+        self.worker.schedule(f"{self.store_dir}:current_page", self.backend.save_current_page, page)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """One client connection: requests in, replies (and events, once subscribed) out."""
+
+    def setup(self):
+        self.store = None
+        self.session = None
+        self.send_lock = threading.Lock()
+
+    def send(self, message: dict) -> None:
+        with self.send_lock:
+            send_message(self.request, message)
+
+    def handle(self):
+        daemon = self.server.daemon
+        try:
+            while True:
+                try:
+                    request = recv_message(self.request)
+                except EOFError:
+                    return
+                reply = {'id': request.get('id')}
+                try:
+                    with metrics.timed(f"daemon.{request.get('op')}"):
+                        reply['result'] = self.dispatch(daemon, request)
+                    reply['ok'] = True
+                except Exception as e:
+                    reply.update(ok=False, error=str(e), type=type(e).__name__)
+                self.send(reply)
+        except (ProtocolError, OSError) as e:
+            debug_log(f"Annotation daemon dropped a client: {e}")
+        finally:
+            daemon.unsubscribe(self)
+
+    def dispatch(self, daemon, request: dict):
+        op = request.get('op')
+        if op == 'open':
+            self.store = daemon.open_store(request['store'], request.get('book_id', 'default'))
+            self.session = request.get('session')
+            return {'store': self.store.store_dir}
+        if op == 'ping':
+            return 'pong'
+        if self.store is None:
+            raise DaemonError("Send 'open' before other requests")
+
+        store = self.store
+        if op == 'get_page':
+            return [encode_highlight(h) for h in store.get_page(request['page'])]
+        if op == 'get_all':
+            return encode_highlights(store.get_all())
+        if op == 'upsert':
+            items = [(page_num, decode_highlight(h)) for page_num, h in request['items']]
+            store.upsert(items)
+            daemon.publish(self, {'event': 'highlights',
+                                  'pages': sorted({page_num for page_num, _ in items})})
+            return len(items)
+        if op == 'delete':
+            deleted = store.delete(request['page'], tuple(request['start']))
+            if deleted:
+                daemon.publish(self, {'event': 'highlights', 'pages': [request['page']]})
+            return deleted
+        if op == 'replace_highlights':
+            store.replace_all(decode_highlights(request['highlights']))
+            daemon.publish(self, {'event': 'highlights', 'pages': None})
+            return True
+        if op == 'get_marks':
+            return store.get_marks()
+        if op == 'upsert_mark':
+            store.upsert_mark(decode_mark(request['mark']))
+            daemon.publish(self, {'event': 'marks'})
+            return True
+        if op == 'delete_mark':
+            deleted = store.delete_mark(decode_mark(request['mark']))
+            if deleted:
+                daemon.publish(self, {'event': 'marks'})
+            return deleted
+        if op == 'replace_marks':
+            store.set_marks([decode_mark(m) for m in request['marks']])
+            daemon.publish(self, {'event': 'marks'})
+            return True
+        if op == 'get_current_page':
+            return store.get_current_page(request['total_pages'])
+        if op == 'set_current_page':
+            store.set_current_page(request['page'])
+            return True
+        if op == 'subscribe':
+            daemon.subscribe(self)
+            return True
+        if op == 'info':
+            return daemon.get_storage_info()
+        raise DaemonError(f"Unknown request: {op}")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class AnnotationDaemon:
+    """Serve the annotation stores under one data directory over a Unix socket.
+
+    Each client names its store directory (a reader's namespace, or the data
+    directory itself) when it connects; clients naming the same directory
+    share one SharedStore. Directories outside ``data_dir`` are refused.
+    """
+
+    def __init__(self, data_dir: str = "data", socket_path: str = None,
+                 backend: str = "binary", save_window: float = 0.5):
+        self.data_dir = Path(data_dir).resolve()
+        self.socket_path = Path(socket_path or self.data_dir / SOCKET_NAME)
+        self.backend_name = backend
+        self.worker = PersistenceWorker(save_window)
+        self.stores = {}
+        self.subscribers = {}  # {store_dir: set of handlers}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def open_store(self, store_dir: str, book_id: str = "default") -> SharedStore:
+        path = Path(store_dir).resolve()
+        if path != self.data_dir and self.data_dir not in path.parents:
+            raise DaemonError(f"{store_dir} is outside {self.data_dir}")
+        key = str(path)
+        with self._lock:
+            if key not in self.stores:
+                backend = create_backend({'backend': self.backend_name, 'data_dir': key,
+                                          'book_id': book_id, 'namespaced': False})
+                self.stores[key] = SharedStore(key, backend, self.worker)
+                debug_log(f"Annotation daemon opened store {key}")
+            return self.stores[key]
+
+    def subscribe(self, handler) -> None:
+        with self._lock:
+            self.subscribers.setdefault(handler.store.store_dir, set()).add(handler)
+
+    def unsubscribe(self, handler) -> None:
+        with self._lock:
+            if handler.store is not None:
+                self.subscribers.get(handler.store.store_dir, set()).discard(handler)
+
+    def publish(self, origin, event: dict) -> None:
+        """Tell the other sessions on a store that it changed."""
+        event['session'] = origin.session
+        with self._lock:
+            handlers = list(self.subscribers.get(origin.store.store_dir, ()))
+        for handler in handlers:
+            # A session subscribes on a second connection, so skip it by its session id
+            if handler.session == origin.session:
+                continue
+            try:
+                handler.send(event)
+            except OSError:
+                self.unsubscribe(handler)
+
+    def _remove_stale_socket(self) -> None:
+        if not self.socket_path.exists():
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.socket_path))
+        except OSError:
+            self.socket_path.unlink()
+        else:
+            raise DaemonError(f"An annotation daemon is already listening on {self.socket_path}")
+        finally:
+            probe.close()
+
+    def start(self) -> None:
+        """Listen in a background thread."""
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self._remove_stale_socket()
+        self._server = _Server(str(self.socket_path), _Handler)
+        self._server.daemon = self
+        os.chmod(self.socket_path, 0o600)
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="annotation-daemon", daemon=True)
+        self._thread.start()
+        debug_log(f"Annotation daemon listening on {self.socket_path}")
+
+    def stop(self) -> None:
+        """Stop listening, write everything pending and close the stores."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.worker.stop()
+        with self._lock:
+            for store in self.stores.values():
+                store.backend.close()
+            self.stores.clear()
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        debug_log("Annotation daemon stopped")
+
+    def get_storage_info(self) -> dict:
+        with self._lock:
+            return {
+                'socket': str(self.socket_path),
+                'backend': self.backend_name,
+                'stores': sorted(self.stores),
+                'subscribers': sum(len(handlers) for handlers in self.subscribers.values()),
+            }
+
+
+def parse_daemon_arguments(argv: list = None) -> argparse.Namespace:
+    """Parse command line arguments for the annotation daemon."""
+    config = get_storage_config()
+    # The daemon itself writes to disk, so it cannot use the daemon backend
+    disk_backends = sorted(name for name in BACKENDS if name != 'daemon')
+    default_backend = config['backend'] if config['backend'] in disk_backends else 'binary'
+    parser = argparse.ArgumentParser(description='Serve GenreJinn annotations over a Unix socket')
+    parser.add_argument('--data-dir', default=config['data_dir'],
+                        help=f"Data directory (default: {config['data_dir']})")
+    parser.add_argument('--socket', help=f'Socket path (default: <data-dir>/{SOCKET_NAME})')
+    parser.add_argument('--backend', choices=disk_backends, default=default_backend,
+                        help=f"Backend the daemon writes with (default: {default_backend})")
+    parser.add_argument('--save-window', type=float, default=config['save_window'],
+                        help=f"Seconds to batch writes (default: {config['save_window']})")
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> int:
+    """Run the annotation daemon until interrupted."""
+    args = parse_daemon_arguments(argv)
+    daemon = AnnotationDaemon(args.data_dir, args.socket, args.backend, args.save_window)
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    daemon.start()
+    print(f"Annotation daemon listening on {daemon.socket_path}")
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    daemon.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Storage backend that keeps annotations in the annotation daemon."""
+
+import itertools
+import os
+import secrets
+import socket
+import threading
+
+from .backend import StorageBackend
+from .protocol import (DaemonError, decode_highlight, decode_highlights, encode_highlight,
+                       encode_highlights, recv_message, send_message)
+from ..utils.debug import debug_log
+
+
+class DaemonBackend(StorageBackend):
+    """Read and write annotations through a running annotation daemon.
+
+    The session holds no copy of the store; every call is one request on a
+    Unix socket, and the daemon batches the disk writes for all sessions.
+    A dropped connection is reopened once before the call fails.
+    """
+
+    name = "daemon"
+
+    def __init__(self, socket_path: str, store_dir: str = "data",
+                 book_id: str = "default", session: str = None):
+        self.socket_path = str(socket_path)
+        self.store_dir = os.path.abspath(store_dir)
+        self.book_id = book_id
+        # Events are not echoed to the session that caused them, so every
+        # backend needs its own name, even two in one process
+        self.session = session or f"{os.getpid()}-{secrets.token_hex(4)}"
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._sock = None
+        self._subscriber = None
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+            self._exchange(sock, {'op': 'open', 'store': self.store_dir,
+                                  'book_id': self.book_id, 'session': self.session})
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def _exchange(self, sock, request: dict):
+        request['id'] = next(self._ids)
+        send_message(sock, request)
+        reply = recv_message(sock)
+        if not reply.get('ok'):
+            raise DaemonError(f"{reply.get('type')}: {reply.get('error')}")
+        return reply.get('result')
+
+    def _call(self, op: str, **fields):
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._sock = self._connect()
+                    return self._exchange(self._sock, dict(fields, op=op))
+                except (OSError, EOFError) as e:
+                    if self._sock is not None:
+                        self._sock.close()
+                        self._sock = None
+                    if attempt == 2:
+                        raise DaemonError(f"Annotation daemon at {self.socket_path} "
+                                          f"is unreachable: {e}") from e
+
+    # Highlights
+
+    def load_highlights(self) -> dict:
+        return decode_highlights(self._call('get_all'))
+
+    def load_page_highlights(self, page_num: int) -> list:
+        return [decode_highlight(h) for h in self._call('get_page', page=page_num)]
+
+    def iter_highlights(self):
+        highlights = self.load_highlights()
+        for page_num in sorted(highlights):
+            for highlight in sorted(highlights[page_num], key=lambda h: tuple(h[0])):
+                yield page_num, highlight
+
+    def save_highlights(self, highlights: dict) -> None:
+        self._call('replace_highlights', highlights=encode_highlights(highlights))
+
+    def upsert_highlight(self, page_num: int, highlight: tuple) -> None:
+        self.upsert_highlights([(page_num, highlight)])
+
+    def upsert_highlights(self, items) -> None:
+        items = [[page_num, encode_highlight(h)] for page_num, h in items]
+        if items:
+            self._call('upsert', items=items)
+
+    def delete_highlight(self, page_num: int, start_pos: tuple) -> bool:
+        return self._call('delete', page=page_num, start=list(start_pos))
+
+    # Marks
+
+    def load_marks(self) -> list:
+        return [tuple(mark) for mark in self._call('get_marks')]
+
+    def save_marks(self, marks: list) -> None:
+        self._call('replace_marks', marks=[list(mark) for mark in marks])
+
+    def upsert_mark(self, mark: tuple) -> None:
+        self._call('upsert_mark', mark=list(mark))
+
+    def delete_mark(self, mark: tuple) -> bool:
+        return self._call('delete_mark', mark=list(mark))
+
+    # Reading position
+
+    def load_current_page(self, total_pages: int) -> int:
+        return self._call('get_current_page', total_pages=total_pages)
+
+    def save_current_page(self, current_page: int) -> None:
+        self._call('set_current_page', page=current_page)
+
+    # Change notifications
+
+    def subscribe(self, callback) -> None:
+        """Call ``callback(event)`` from a background thread when another session edits.
+
+        Events are ``{'event': 'highlights', 'pages': [...]}`` (``pages`` is
+        None when everything was replaced) or ``{'event': 'marks'}``.
+        """
+        sock = self._connect()
+        self._exchange(sock, {'op': 'subscribe'})
+        self._subscriber = sock
+
+        def listen():
+            try:
+                while True:
+                    message = recv_message(sock)
+                    if 'event' in message:
+                        callback(message)
+            except (OSError, EOFError):
+                pass
+            except Exception as e:
+                debug_log(f"Error in annotation daemon subscription: {e}")
+
+        threading.Thread(target=listen, name="daemon-events", daemon=True).start()
+
+    def get_storage_info(self) -> dict:
+        info = self._call('info')
+        info.update(store=self.store_dir, session=self.session, subscribed=self._subscriber is not None)
+        return info
+
+    def close(self) -> None:
+        with self._lock:
+            for sock in (self._sock, self._subscriber):
+                if sock is not None:
+                    try:
+                        sock.shutdown(socket.SHUT_RDWR)
+                        sock.close()
+                    except OSError as e:
+                        debug_log(f"Error closing daemon connection: {e}")
+            self._sock = self._subscriber = None
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Process-wide cache of decoded note images."""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from .metrics import metrics
+from ..utils.debug import debug_log
+
+# Pillow is optional; without it widgets load images from their paths
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+# Cached images and thumbnails are named after their content, so the name
+# alone identifies the pixels: <sha256>.<ext> or <sha256>-<width>-<protocol>.png
+CONTENT_NAME = re.compile(r'[0-9a-f]{64}(?:-\d+-\w+)?\.\w+')
+
+
+def image_key(image_path: str) -> str:
+    """Key for the pixels of an image file."""
+    name = Path(image_path).name
+    if CONTENT_NAME.fullmatch(name):
+        return name
+    stat = os.stat(image_path)
+    return f"{os.path.abspath(image_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class DecodedImageCache:
+    """Decoded ``PIL.Image`` objects by (file, target size), within a memory budget.
+
+    The notes list is rebuilt from scratch on every edit, and a widget
+    given a path decodes the file again each time. Widgets take their
+    image from ``get`` instead, which decodes a file once and then hands
+    out the same pixels until it is pushed out by newer images. The size of
+    an entry is its pixel buffer (width x height x bands); the least
+    recently used are dropped once the total passes ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._images = OrderedDict()  # {(key, size): (image, bytes)}, least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, image_path: str, size: tuple = None):
+        """The decoded image, scaled to fit ``size`` if given; None if it cannot be decoded."""
+        if not PIL_AVAILABLE:
+            return None
+        try:
+            key = (image_key(image_path), size)
+        except OSError as e:
+            debug_log(f"Cannot read image {image_path}: {e}")
+            return None
+        with self._lock:
+            entry = self._images.get(key)
+            if entry is not None:
+                self._images.move_to_end(key)
+                metrics.increment('images.decoded.hits')
+                return entry[0]
+
+        # Decode outside the lock; two threads decoding one file just race to insert
+        metrics.increment('images.decoded.misses')
+        try:
+            with metrics.timed('images.decode'):
+                with Image.open(image_path) as opened:
+                    opened.load()
+                    image = opened.copy()
+                if size:
+                    image.thumbnail(size)
+        except Exception as e:
+            debug_log(f"Could not decode image {image_path}: {e}")
+            return None
+
+        cost = image.width * image.height * len(image.getbands())
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = (image, cost)
+                self.total_bytes += cost
+                self._evict(keep=key)
+            return self._images[key][0]
+
+    def _evict(self, keep) -> None:
+        while self.total_bytes > self.max_bytes and len(self._images) > 1:
+            key = next(iter(self._images))
+            if key == keep:
+                break
+            _, cost = self._images.pop(key)
+            self.total_bytes -= cost
+            metrics.increment('images.decoded.evictions')
+
+    def clear(self) -> None:
+        with self._lock:
+            self._images.clear()
+            self.total_bytes = 0
+
+    def get_storage_info(self) -> dict:
+        with self._lock:
+            return {
+                'decoded_images': len(self._images),
+                'decoded_bytes': self.total_bytes,
+                'decoded_max_bytes': self.max_bytes,
+            }
+
+
+# Shared by every widget in the process
+decoded_images = DecodedImageCache()
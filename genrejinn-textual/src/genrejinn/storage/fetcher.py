@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Background image fetching with a shared connection pool."""
+
+import hashlib
+import socket
+import threading
+import urllib.parse
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .image_cache import SNIFF_BYTES, sniff_image_type
+from .metrics import metrics
+from ..utils.debug import debug_log
+
+
+# Headers sent with every image request
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+
+class DownloadError(Exception):
+    """A response that is not an image we will keep (too large, or not an image)."""
+
+
+def _response_socket(response):
+    """The socket a streamed response is read from, if it can be found."""
+    sock = getattr(getattr(response.raw, '_connection', None), 'sock', None)
+    if sock is None:
+        # Bodies that end when the server closes are read through http.client's
+        # file object, after urllib3 has let go of the connection
+        fp = getattr(getattr(response.raw, '_fp', None), 'fp', None)
+        sock = getattr(getattr(fp, 'raw', None), '_sock', None)
+    return sock
+
+
+def stream_download(session: requests.Session, url: str, out, max_bytes: int,
+                    timeout: float, chunk_size: int = 64 * 1024) -> tuple:
+    """Write the body of ``url`` to the open file ``out``, return (sha256, size, extension).
+
+    At most ``chunk_size`` bytes are held in memory. Raises ``DownloadError``
+    once the body passes ``max_bytes`` or if its first bytes are not a known
+    image format, and ``requests.Timeout`` if the whole download takes longer
+    than ``timeout`` seconds.
+    """
+    with session.get(url, stream=True, timeout=min(timeout, 30)) as response:
+        response.raise_for_status()
+        length = response.headers.get('Content-Length', '')
+        if length.isdigit() and int(length) > max_bytes:
+            raise DownloadError(f"image is {int(length)} bytes, over the {max_bytes} byte limit")
+
+        # A server that trickles bytes never trips the per-read timeout, and a
+        # read waits for a whole chunk, so cut the connection at the deadline
+        expired = threading.Event()
+
+        def expire():
+            expired.set()
+            # Closing the response does not wake a read blocked in another
+            # thread; shutting the socket down does
+            sock = _response_socket(response)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            response.close()
+
+        watchdog = threading.Timer(timeout, expire)
+        watchdog.daemon = True
+        watchdog.start()
+        digest = hashlib.sha256()
+        size = 0
+        head = b''
+        ext = None
+        try:
+            for chunk in response.iter_content(chunk_size):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise DownloadError(f"image is over the {max_bytes} byte limit")
+                if ext is None:
+                    head += chunk
+                    if len(head) >= SNIFF_BYTES:
+                        ext = sniff_image_type(head)
+                        if ext is None:
+                            raise DownloadError(f"not an image ({response.headers.get('Content-Type', 'unknown type')})")
+                        head = b''
+                digest.update(chunk)
+                out.write(chunk)
+        except Exception:
+            # Reads fail once the watchdog has closed the response
+            if not expired.is_set():
+                raise
+        finally:
+            watchdog.cancel()
+        if expired.is_set():
+            # The body may look complete after the close; it is not
+            raise requests.Timeout(f"download took longer than {timeout:g}s")
+
+    if ext is None:
+        # Bodies shorter than SNIFF_BYTES
+        ext = sniff_image_type(head)
+        if ext is None:
+            raise DownloadError("not an image (too short)")
+    return digest.hexdigest(), size, ext
+
+
+def create_session(per_host: int = 2, hosts: int = 10) -> requests.Session:
+    """A ``requests`` session that keeps up to ``per_host`` connections open per host."""
+    session = requests.Session()
+    session.headers.update(REQUEST_HEADERS)
+    adapter = HTTPAdapter(pool_connections=hosts, pool_maxsize=per_host)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def host_of(url: str) -> str:
+    """Host and port a URL connects to; downloads are limited per host."""
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+class ImageFetcher:
+    """Run blocking image downloads on a small thread pool.
+
+    ``submit(url, callback)`` returns a Future right away; ``fetch(url)``
+    runs on a worker thread and its result (a path, or None on failure) is
+    passed to ``callback(url, result)`` from that thread. At most
+    ``max_workers`` downloads run at once and at most ``per_host`` against
+    any one host; the rest wait in a per-host queue, so a slow host does
+    not hold up images from other hosts. A URL already queued or running
+    shares the pending Future instead of being fetched twice.
+
+    ``submit(url, background=True)`` queues a prefetch, run with
+    ``prefetch(url)`` (``fetch`` by default) only when a worker and a host
+    slot are free and no foreground download is waiting for them. One
+    worker is always left for foreground downloads. Asking for a queued
+    prefetch in the foreground moves it to the front, and
+    ``cancel_background`` drops every prefetch that has not started.
+    """
+
+    def __init__(self, fetch, max_workers: int = 4, per_host: int = 2, prefetch=None):
+        self.fetch = fetch
+        self.prefetch = prefetch or fetch
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-fetch")
+        self._lock = threading.Lock()
+        self._pending = {}  # {url: Future}
+        self._callbacks = {}  # {url: [callback, ...]}
+        self._active = {}  # {host: running downloads}
+        self._waiting = {}  # {host: deque of urls}
+        self._background = OrderedDict()  # {url: host} prefetches not started, first to run first
+        self._closed = False
+
+    def submit(self, url: str, callback=None, background: bool = False) -> Future:
+        """Queue a download of ``url`` and return its Future."""
+        with self._lock:
+            future = self._pending.get(url)
+            if future is None:
+                future = Future()
+                if self._closed:
+                    future.set_result(None)
+                    return future
+                self._pending[url] = future
+                self._callbacks[url] = []
+                host = host_of(url)
+                if background:
+                    self._background[url] = host
+                    metrics.increment('images.prefetch.queued')
+                    self._start_background()
+                elif self._active.get(host, 0) < self.per_host:
+                    self._start(host, url)
+                else:
+                    self._waiting.setdefault(host, deque()).append(url)
+                    metrics.increment('images.fetch.queued')
+            elif not background and url in self._background:
+                # Wanted now: run it as a normal download
+                host = self._background.pop(url)
+                metrics.increment('images.prefetch.promoted')
+                if self._active.get(host, 0) < self.per_host:
+                    self._start(host, url)
+                else:
+                    self._waiting.setdefault(host, deque()).appendleft(url)
+            if callback is not None:
+                self._callbacks[url].append(callback)
+        return future
+
+    def _start(self, host: str, url: str, background: bool = False) -> None:
+        """Hand a download to the pool (called with the lock held)."""
+        self._active[host] = self._active.get(host, 0) + 1
+        self._executor.submit(self._run, host, url, background)
+
+    def _start_background(self) -> None:
+        """Start queued prefetches that fit in the idle capacity (called with the lock held)."""
+        if not self._background or self._closed:
+            return
+        for url, host in list(self._background.items()):
+            if sum(self._active.values()) >= max(1, self.max_workers - 1):
+                break
+            if self._active.get(host, 0) < self.per_host and not self._waiting.get(host):
+                del self._background[url]
+                self._start(host, url, background=True)
+
+    def _run(self, host: str, url: str, background: bool = False) -> None:
+        result = None
+        try:
+            result = (self.prefetch if background else self.fetch)(url)
+        except Exception as e:
+            debug_log(f"Image fetch failed for {url}: {e}")
+        finally:
+            with self._lock:
+                future = self._pending.pop(url)
+                callbacks = self._callbacks.pop(url)
+                self._active[host] -= 1
+                waiting = self._waiting.get(host)
+                if waiting and not self._closed:
+                    self._start(host, waiting.popleft())
+                if not waiting:
+                    self._waiting.pop(host, None)
+                if not self._active[host]:
+                    del self._active[host]
+                self._start_background()
+            future.set_result(result)
+            for callback in callbacks:
+                try:
+                    callback(url, result)
+                except Exception as e:
+                    debug_log(f"Error in image fetch callback for {url}: {e}")
+
+    def cancel_background(self) -> int:
+        """Drop the prefetches that have not started; return how many."""
+        with self._lock:
+            dropped = [(self._pending.pop(url), self._callbacks.pop(url)) for url in self._background]
+            self._background.clear()
+        for future, _ in dropped:
+            future.cancel()
+        if dropped:
+            metrics.increment('images.prefetch.cancelled', len(dropped))
+        return len(dropped)
+
+    def pending(self) -> int:
+        """Downloads queued or running."""
+        with self._lock:
+            return len(self._pending)
+
+    def close(self, wait: bool = False) -> None:
+        """Stop starting downloads; queued ones finish with None."""
+        self.cancel_background()
+        with self._lock:
+            self._closed = True
+            dropped = [url for waiting in self._waiting.values() for url in waiting]
+            self._waiting.clear()
+            abandoned = [(self._pending.pop(url), self._callbacks.pop(url)) for url in dropped]
+        for future, _ in abandoned:
+            future.set_result(None)
+        self._executor.shutdown(wait=wait)
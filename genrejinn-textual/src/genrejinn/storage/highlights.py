@@ -3,91 +3,107 @@
 
 """Highlight persistence and storage management."""
 
-import pickle
 import os
 from pathlib import Path
+from . import binary
+from .atomic import atomic_write
+from .legacy import load_legacy_pickle
+from .metrics import metrics
+from .schema import LEGACY_VERSION, format_report, migrate, needs_upgrade
+from .snapshots import SnapshotStore
 from ..highlighting.colors import parse_highlight_tuple
-
-
-def debug_log(message):
-    """Debug logging function."""
-    with open('data/log.txt', 'a') as f:
-        f.write(f"{message}\n")
-        f.flush()
+from ..utils.debug import debug_log
 
 
 class HighlightStorage:
     """Manage saving and loading of highlights."""
 
     def __init__(self, storage_path: str = None):
-        self.storage_path = storage_path or "data/highlights.pkl"
+        self.storage_path = storage_path or "data/highlights.gjb"
+        self.legacy_path = str(Path(self.storage_path).with_suffix('.pkl'))
         self.storage_dir = Path(self.storage_path).parent
         self.storage_dir.mkdir(parents=True, exist_ok=True)
 
+    @metrics.instrument('highlights.save')
     def save_highlights(self, highlights: dict) -> None:
-        """Save highlights to a pickle file."""
+        """Save highlights to a binary store."""
         try:
-            with open(self.storage_path, 'wb') as f:
-                pickle.dump(highlights, f)
+            data = binary.dumps(binary.write_highlights, highlights)
+            atomic_write(self.storage_path, data)
+            metrics.add_bytes('highlights', len(data))
             debug_log(f"Saved {len(highlights)} pages of highlights")
         except Exception as e:
+            metrics.increment('highlights.save.errors')
             debug_log(f"Error saving highlights: {e}")
 
+    @metrics.instrument('highlights.load_table')
+    def load_table(self):
+        """Open the binary store for page-at-a-time reads.
+
+        Returns None if there is no binary store or it needs a schema
+        upgrade, in which case load_highlights does the work.
+        """
+        try:
+            if os.path.exists(self.storage_path):
+                with open(self.storage_path, 'rb') as f:
+                    table = binary.HighlightTable(f)
+                if needs_upgrade('highlights', table.schema):
+                    return None
+                debug_log(f"Opened highlight store with {len(table)} highlights")
+                return table
+        except Exception as e:
+            metrics.increment('highlights.load_table.errors')
+            debug_log(f"Error loading highlights: {e}")
+        return None
+
+    @metrics.instrument('highlights.load')
     def load_highlights(self) -> dict:
-        """Load highlights from a pickle file."""
+        """Load highlights from the binary store, or from an old pickle file.
+
+        Stores in an older schema are upgraded once and written back.
+        """
         highlights = {}
         try:
+            version = None
             if os.path.exists(self.storage_path):
                 with open(self.storage_path, 'rb') as f:
-                    highlights = pickle.load(f)
+                    table = binary.HighlightTable(f)
+                highlights, version = table.to_dict(), table.schema
                 debug_log(f"Loaded {len(highlights)} pages of highlights")
-
-                # Convert old format highlights to new format with default yellow color
-                highlights = self._convert_old_format(highlights)
-                debug_log("Converted old highlight format to new format with colors")
             else:
-                debug_log("No highlights file found, starting fresh")
+                legacy = load_legacy_pickle(self.legacy_path)
+                if legacy is not None:
+                    highlights, version = legacy, LEGACY_VERSION
+                    debug_log(f"Loaded {len(highlights)} pages of highlights from {self.legacy_path}")
+                else:
+                    debug_log("No highlights file found, starting fresh")
+
+            if version is not None and (needs_upgrade('highlights', version)
+                                        or not os.path.exists(self.storage_path)):
+                highlights, steps = migrate('highlights', highlights, version)
+                debug_log(format_report(steps))
+                self.save_highlights(highlights)
         except Exception as e:
+            metrics.increment('highlights.load.errors')
             debug_log(f"Error loading highlights: {e}")
 
         return highlights
 
-    def _convert_old_format(self, highlights: dict) -> dict:
-        """Convert old 4-element highlight format to new 5-element format."""
-        for page_num, page_highlights in highlights.items():
-            updated_highlights = []
-            for highlight in page_highlights:
-                if len(highlight) == 4:
-                    # Old format: (start_pos, end_pos, text, note)
-                    start_pos, end_pos, text, note = highlight
-                    # Add yellow as default color, ensure text has yellow brackets
-                    if not (text.startswith('[') and text.endswith(']')):
-                        # Add yellow brackets if they're missing
-                        clean_text = text.strip('[]{}()<>«»⟨⟩|')
-                        text = f"[{clean_text}]"
-                    updated_highlights.append((start_pos, end_pos, text, note, "yellow"))
-                else:
-                    # New format: keep as-is
-                    updated_highlights.append(highlight)
-            highlights[page_num] = updated_highlights
-
-        return highlights
-
-    def backup_highlights(self, highlights: dict, backup_name: str = None) -> None:
-        """Create a backup of current highlights."""
-        if backup_name is None:
-            import time
-            backup_name = f"highlights_backup_{int(time.time())}.pkl"
-
-        backup_path = self.storage_dir / "backups" / backup_name
-        backup_path.parent.mkdir(parents=True, exist_ok=True)
+    def backup_highlights(self, highlights: dict, backup_name: str = None) -> dict:
+        """Snapshot highlights into the deduplicated backup store, return the manifest.
 
+        Only pages that changed since an earlier snapshot take new
+        space; see SnapshotStore for listing, restoring and pruning.
+        """
         try:
-            with open(backup_path, 'wb') as f:
-                pickle.dump(highlights, f)
-            debug_log(f"Created highlight backup: {backup_path}")
+            manifest = SnapshotStore(self.storage_dir / "backups").create_snapshot(
+                highlights=highlights, label=backup_name
+            )
+            debug_log(f"Created highlight backup: {manifest['id']}")
+            return manifest
         except Exception as e:
             debug_log(f"Error creating highlight backup: {e}")
+            return None
 
     def get_storage_info(self) -> dict:
         """Get information about the storage file."""
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Content-addressed cache for downloaded note images."""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from pathlib import Path
+
+from .atomic import atomic_write
+from .metrics import metrics
+from ..utils.debug import debug_log
+
+
+INDEX_VERSION = 1
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg')
+
+
+# Leading bytes of each image format we can display, and its extension
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+)
+
+# Bytes needed to recognise any supported format
+SNIFF_BYTES = 12
+
+
+def sniff_image_type(head: bytes) -> str:
+    """Extension for image data from its first bytes, or None if it is not an image."""
+    for signature, ext in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+
+def url_key(url: str) -> str:
+    """Stable key for a URL, the same in every process."""
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+
+def url_extension(url: str) -> str:
+    """File extension for an image URL; ``.jpg`` when the path has none."""
+    ext = os.path.splitext(urllib.parse.urlsplit(url).path)[1].lower()
+    return ext if ext in IMAGE_EXTENSIONS else '.jpg'
+
+
+class ImageCache:
+    """Keep downloaded images under ``objects/`` by the SHA-256 of their bytes.
+
+    ``index.json`` maps URL keys (see ``url_key``) to content digests, so
+    two URLs serving the same image share one file, and records each
+    file's size in least-recently-used order. When the files outgrow
+    ``max_bytes`` the least recently used are deleted along with the URLs
+    that pointed at them. Lookups only reorder the index in memory; it is
+    written after ``flush_every`` of them, on every insert, and on close.
+    ``on_forget(digest)`` is called when an image leaves the cache.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024, flush_every: int = 32,
+                 on_forget=None):
+        self.on_forget = on_forget
+        self.cache_dir = Path(cache_dir)
+        self.objects_dir = self.cache_dir / "objects"
+        self.index_path = self.cache_dir / "index.json"
+        self.max_bytes = max_bytes
+        self.flush_every = flush_every
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+
+        self.urls = {}  # {url key: content digest}
+        self.objects = OrderedDict()  # {digest: {'size', 'ext', 'used'}}, least recently used first
+        self.total_bytes = 0
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _load_index(self) -> None:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') != INDEX_VERSION:
+                raise ValueError(f"unsupported image index version {index.get('version')}")
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            debug_log(f"Error loading image index, starting empty: {e}")
+            return
+        for digest, entry in sorted(index['objects'].items(), key=lambda item: item[1]['used']):
+            if self.object_path(digest, entry['ext']).exists():
+                self.objects[digest] = entry
+                self.total_bytes += entry['size']
+        self.urls = {key: digest for key, digest in index['urls'].items() if digest in self.objects}
+
+    def object_path(self, digest: str, ext: str) -> Path:
+        return self.objects_dir / digest[:2] / f"{digest}{ext}"
+
+    def lookup(self, url: str) -> str:
+        """Path of the cached image for a URL, or None."""
+        with self._lock:
+            digest = self.urls.get(url_key(url))
+            entry = self.objects.get(digest)
+            if entry is None:
+                return None
+            path = self.object_path(digest, entry['ext'])
+            if not path.exists():
+                # Deleted behind our back; forget it so it is fetched again
+                self._forget(digest)
+                self._save()
+                return None
+            entry['used'] = time.time()
+            self.objects.move_to_end(digest)
+            self._unsaved += 1
+            if self._unsaved >= self.flush_every:
+                self._save()
+            metrics.increment('images.cache_hits')
+            return str(path)
+
+    def put(self, url: str, data: bytes, ext: str = None) -> str:
+        """Store an image downloaded from a URL and return its path."""
+        digest = hashlib.sha256(data).hexdigest()
+        ext = ext or sniff_image_type(data) or url_extension(url)
+        return self._add(url, digest, len(data), ext,
+                         lambda path: atomic_write(path, data))
+
+    def temp_file(self) -> tuple:
+        """Open a temp file for a download next to the objects, return (file, path).
+
+        Write the image to it, then hand the path to ``put_file``.
+        """
+        fd, temp_path = tempfile.mkstemp(prefix=".download-", suffix=".tmp", dir=self.objects_dir)
+        return os.fdopen(fd, 'wb'), temp_path
+
+    def put_file(self, url: str, temp_path: str, digest: str, size: int, ext: str) -> str:
+        """Move a downloaded temp file into the cache and return its path.
+
+        ``digest`` is the SHA-256 of the file. If the cache already holds
+        those bytes the temp file is deleted instead.
+        """
+        def store(path):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temp_path, path)
+
+        try:
+            return self._add(url, digest, size, ext, store)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _add(self, url: str, digest: str, size: int, ext: str, store) -> str:
+        with self._lock:
+            entry = self.objects.get(digest)
+            if entry is None:
+                entry = {'size': size, 'ext': ext, 'used': time.time()}
+                store(self.object_path(digest, ext))
+                self.objects[digest] = entry
+                self.total_bytes += entry['size']
+            else:
+                metrics.increment('images.cache_dedup')
+                entry['used'] = time.time()
+                self.objects.move_to_end(digest)
+            self.urls[url_key(url)] = digest
+            self._evict(keep=digest)
+            self._save()
+            return str(self.object_path(digest, entry['ext']))
+
+    def _evict(self, keep: str = None) -> None:
+        """Delete least recently used images until the cache fits its budget."""
+        for digest in list(self.objects):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if digest != keep:
+                entry = self.objects[digest]
+                try:
+                    self.object_path(digest, entry['ext']).unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    debug_log(f"Error evicting cached image {digest}: {e}")
+                    continue
+                self._forget(digest)
+                metrics.increment('images.cache_evictions')
+
+    def _forget(self, digest: str) -> None:
+        entry = self.objects.pop(digest)
+        self.total_bytes -= entry['size']
+        if self.on_forget:
+            self.on_forget(digest)
+        self.urls = {key: value for key, value in self.urls.items() if value != digest}
+
+    def _save(self) -> None:
+        index = {'version': INDEX_VERSION, 'urls': self.urls, 'objects': self.objects}
+        try:
+            atomic_write(self.index_path, json.dumps(index, separators=(',', ':')).encode('utf-8'))
+            self._unsaved = 0
+        except OSError as e:
+            debug_log(f"Error saving image index: {e}")
+
+    def flush(self) -> None:
+        """Write the LRU order if lookups changed it."""
+        with self._lock:
+            if self._unsaved:
+                self._save()
+
+    def get_storage_info(self) -> dict:
+        with self._lock:
+            return {
+                'exists': True,
+                'count': len(self.objects),
+                'urls': len(self.urls),
+                'total_size': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'path': str(self.cache_dir),
+            }
@@ -3,161 +3,275 @@
 
 """Image download and management."""
 
+import functools
+import hashlib
 import os
 import re
-import urllib.parse
-import requests
+from collections import OrderedDict, namedtuple
 from pathlib import Path
 
+import requests
 
-def debug_log(message):
-    """Debug logging function."""
-    with open('data/log.txt', 'a') as f:
-        f.write(f"{message}\n")
-        f.flush()
+from .decoded_images import decoded_images
+from .fetcher import DownloadError, ImageFetcher, create_session, stream_download
+from .image_cache import ImageCache
+from .metrics import metrics
+from .negative_cache import NegativeCache
+from .thumbnails import ThumbnailCache, detect_cell_pixels, detect_protocol
+from ..utils.debug import debug_log
 
 
-class ImageManager:
-    """Manage image downloads and storage."""
+# Image URLs that are downloaded and shown above a note
+IMAGE_URL_PATTERN = re.compile(r'https?://[^\s]+\.(?:jpg|png)(?:\?[^\s]*)?', re.IGNORECASE)
 
-    def __init__(self, images_dir: str = None):
-        self.images_dir = Path(images_dir or "data/images")
-        self.images_dir.mkdir(parents=True, exist_ok=True)
+# Image references of every kind, found in one pass. Alternatives are tried
+# in order at each position, so a markdown image or <img> tag is taken whole
+# rather than also matching as a bare file name. Bare file names start at a
+# word boundary or after an opening bracket or quote.
+IMAGE_EXTENSION = r'\.(?:jpg|jpeg|png|gif|webp|svg)'
+IMAGE_REFERENCE_PATTERN = re.compile(rf"""
+    !\[[^\]]*\]\((?P<markdown>[^)]+{IMAGE_EXTENSION}(?:\?[^)]*)?)\)
+  | <img[^>]+src=["'](?P<html>[^"']+{IMAGE_EXTENSION}(?:\?[^"']*)?)["'][^>]*>
+  | (?P<url>https?://\S+{IMAGE_EXTENSION}(?:\?\S*)?)
+  | (?<![^\s(\[<"'=])(?P<file>[^\s()\[\]<>"']+{IMAGE_EXTENSION})
+""", re.IGNORECASE | re.VERBOSE)
 
-    def download_image(self, url: str) -> str:
-        """Download image from URL to images directory and return filepath."""
-        try:
-            # Get filename from URL
-            parsed_url = urllib.parse.urlparse(url)
-            filename = os.path.basename(parsed_url.path)
+# Every reference contains an image extension; most notes have none, and
+# finding that out is far cheaper than running the full scanner
+IMAGE_EXTENSION_PATTERN = re.compile(IMAGE_EXTENSION, re.IGNORECASE)
 
-            # If no filename, generate one
-            if not filename or '.' not in filename:
-                filename = f"image_{hash(url) % 10000}.jpg"
+# Notes whose analysis is kept
+NOTE_CACHE_SIZE = 4096
 
-            filepath = self.images_dir / filename
+# Most images queued by one call to prefetch_notes
+PREFETCH_LIMIT = 64
 
-            # Check if already downloaded
-            if filepath.exists():
-                return str(filepath)
-
-            # Download the image with proper headers
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Accept-Encoding': 'gzip, deflate',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            }
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-
-            # Save to file
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
 
-            debug_log(f"Downloaded image: {url} -> {filepath}")
-            return str(filepath)
+def scan_image_references(text: str) -> list:
+    """Image URLs, markdown images, <img> sources and file names in text.
 
-        except Exception as e:
-            debug_log(f"Image download failed: {e}")
-            return None
+    One regex pass; each reference is listed once, in order of first
+    appearance.
+    """
+    if not text or not IMAGE_EXTENSION_PATTERN.search(text):
+        return []
+    return list(dict.fromkeys(match.group(match.lastgroup)
+                              for match in IMAGE_REFERENCE_PATTERN.finditer(text)))
 
-    def process_note_for_images(self, note_text: str) -> tuple:
-        """Process note text to find and download image URLs, return (processed_text, image_data)."""
-        if not note_text:
-            return "", []
 
-        # Pattern to find URLs ending in .jpg or .png
-        image_pattern = r'https?://[^\s]+\.(?:jpg|png)(?:\?[^\s]*)?'
+class NoteAnalysis(namedtuple('NoteAnalysis', 'digest urls clean_text')):
+    """What the notes panel needs from a note: its image URLs and the text without them."""
 
-        image_urls = re.findall(image_pattern, note_text, re.IGNORECASE)
-        image_data = []  # List of (url, filepath) tuples
-        processed_text = note_text
+    __slots__ = ()
 
-        # Check if we're running in server mode (via environment variable)
-        is_server_mode = os.environ.get('GENREJINN_SERVER_MODE') == '1'
 
-        for url in image_urls:
-            filepath = self.download_image(url)
+class ImageManager:
+    """Manage image downloads and storage.
+
+    ``download_image`` blocks; the UI uses ``fetch_image`` instead, which
+    downloads on a background pool sharing one pooled HTTP session.
+    Downloads are kept in an ``ImageCache`` of at most ``max_bytes``, and
+    failures in a ``NegativeCache`` so dead links are not retried on every
+    refresh of the notes list. Each download is streamed to disk and
+    stopped at ``max_download_bytes`` or after ``download_timeout`` seconds.
+    The notes panel shows ``display_image`` thumbnails, scaled once to
+    ``display_width`` cells on the download thread.
+
+    ``analyze_note`` is memoized by a digest of the note text, and the
+    thumbnail shown for each URL is remembered once found, so rebuilding
+    the notes list repeats no regex or filesystem work for unchanged notes.
+    ``prefetch_notes`` downloads and thumbnails the images of notes the
+    reader has not reached yet, behind any image the panel is waiting for.
+    """
+
+    def __init__(self, images_dir: str = None, max_workers: int = 4, per_host: int = 2,
+                 max_bytes: int = 256 * 1024 * 1024, max_download_bytes: int = 20 * 1024 * 1024,
+                 download_timeout: float = 60):
+        self.max_download_bytes = max_download_bytes
+        self.download_timeout = download_timeout
+        self.images_dir = Path(images_dir or "data/images")
+        self.images_dir.mkdir(parents=True, exist_ok=True)
+        self.thumbnails = ThumbnailCache(self.images_dir / "thumbs", detect_cell_pixels())
+        self.cache = ImageCache(self.images_dir, max_bytes, on_forget=self._image_forgotten)
+        self._display_width = 40
+        self._protocol = None
+        self._notes = OrderedDict()  # {note digest: NoteAnalysis}, least recently used first
+        self._shown = {}  # {(url, width, protocol): thumbnail path}
+        self.failures = NegativeCache(self.images_dir / "failures.json")
+        self.session = create_session(per_host=per_host)
+        self.fetcher = ImageFetcher(self.prepare_image, max_workers=max_workers, per_host=per_host,
+                                    prefetch=functools.partial(self.prepare_image, decode=False))
+
+    @property
+    def protocol(self) -> str:
+        """How images are drawn (see ``detect_protocol``), looked up on first use."""
+        if self._protocol is None:
+            self._protocol = detect_protocol()
+        return self._protocol
+
+    @property
+    def display_width(self) -> int:
+        """Width of note images in cells; the UI sets it to the panel width."""
+        return self._display_width
+
+    @display_width.setter
+    def display_width(self, width: int) -> None:
+        if width != self._display_width:
+            self._display_width = width
+            self._shown = {}
+
+    def _image_forgotten(self, digest: str) -> None:
+        """An image left the cache: drop its thumbnails and the remembered paths."""
+        self.thumbnails.discard(digest)
+        self._shown = {}
+
+    def analyze_note(self, note_text: str) -> NoteAnalysis:
+        """Image URLs and cleaned text of a note, computed once per distinct text."""
+        if not note_text:
+            return NoteAnalysis('', (), '')
+        digest = hashlib.sha1(note_text.encode('utf-8')).hexdigest()
+        analysis = self._notes.get(digest)
+        if analysis is not None:
+            self._notes.move_to_end(digest)
+            return analysis
+        metrics.increment('images.note_scans')
+        urls = tuple(IMAGE_URL_PATTERN.findall(note_text))
+        clean_text = re.sub(r'\s+', ' ', IMAGE_URL_PATTERN.sub('', note_text) if urls else note_text).strip()
+        analysis = NoteAnalysis(digest, urls, clean_text)
+        self._notes[digest] = analysis
+        if len(self._notes) > NOTE_CACHE_SIZE:
+            self._notes.popitem(last=False)
+        return analysis
+
+    def cached_image(self, url: str) -> str:
+        """Path of an already downloaded image, or None."""
+        return self.cache.lookup(url)
+
+    def display_image(self, url: str) -> str:
+        """Path of the thumbnail to show for a URL, or None if it still has to be made."""
+        key = (url, self.display_width, self.protocol)
+        shown = self._shown.get(key)
+        if shown:
+            return shown
+        image_path = self.cache.lookup(url)
+        if not image_path:
+            return None
+        shown = self.thumbnails.lookup(image_path, key[1], key[2])
+        if shown:
+            self._shown[key] = shown
+        return shown
+
+    def prepare_image(self, url: str, decode: bool = True) -> str:
+        """Download an image if needed and return its thumbnail's path (blocking).
+
+        With ``decode`` the thumbnail is also decoded into ``decoded_images``;
+        prefetches skip that so they do not push out images on screen.
+        """
+        key = (url, self.display_width, self.protocol)
+        image_path = self.download_image(url)
+        if not image_path:
+            return None
+        shown = self.thumbnails.thumbnail(image_path, key[1], key[2])
+        self._shown[key] = shown
+        # Decode here on the download thread, so the widget does not have to
+        if decode:
+            decoded_images.get(shown)
+        return shown
+
+    def fetch_image(self, url: str, callback=None):
+        """Prepare an image in the background; see ``ImageFetcher.submit``."""
+        return self.fetcher.submit(url, callback)
+
+    def prefetch_notes(self, note_texts) -> int:
+        """Prefetch the images of ``note_texts``, nearest first; return how many were queued.
+
+        Prefetches queued by an earlier call that have not started are
+        dropped first, so only the latest neighbourhood is fetched.
+        """
+        self.fetcher.cancel_background()
+        queued = set()
+        for note_text in note_texts:
+            for url in self.analyze_note(note_text).urls:
+                if url in queued or self.display_image(url):
+                    continue
+                self.fetcher.submit(url, background=True)
+                queued.add(url)
+                if len(queued) >= PREFETCH_LIMIT:
+                    return len(queued)
+        return len(queued)
+
+    @metrics.instrument('images.download')
+    def download_image(self, url: str) -> str:
+        """Download image from URL to images directory and return filepath."""
+        try:
+            # Check if already downloaded
+            filepath = self.cache.lookup(url)
             if filepath:
-                image_data.append((url, filepath))
+                return filepath
+
+            # Skip URLs and hosts that failed recently
+            reason = self.failures.blocked(url)
+            if reason:
+                metrics.increment('images.download.skipped')
+                debug_log(f"Not downloading {url}: {reason}")
+                return None
+
+            # Stream the image over the shared connection pool into a temp file
+            out, temp_path = self.cache.temp_file()
+            try:
+                with out:
+                    digest, size, ext = stream_download(self.session, url, out, self.max_download_bytes,
+                                                        self.download_timeout)
+                    out.flush()
+                    os.fsync(out.fileno())
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+            filepath = self.cache.put_file(url, temp_path, digest, size, ext)
+            metrics.add_bytes('images', size)
+            self.failures.record_success(url)
+
+            debug_log(f"Downloaded image: {url} -> {filepath}")
+            return str(filepath)
 
-                # Hide URLs in both local and server mode now
-                debug_log(f"Hiding URL {url}")
-                processed_text = processed_text.replace(url, "")
+        except Exception as e:
+            metrics.increment('images.download.errors')
+            debug_log(f"Image download failed: {e}")
+            if isinstance(e, DownloadError):
+                metrics.increment('images.download.rejected')
+                self.failures.record_failure(url, str(e), permanent=True)
+            elif isinstance(e, requests.RequestException):
+                response = getattr(e, 'response', None)
+                self.failures.record_failure(url, str(e) or type(e).__name__,
+                                             response.status_code if response is not None else None)
+            return None
 
-        # Clean up extra whitespace after removing URLs
-        processed_text = re.sub(r'\s+', ' ', processed_text).strip()
+    def find_image_urls(self, text: str) -> list:
+        """Image URLs in a note, in order."""
+        return self.analyze_note(text).urls
 
-        return processed_text, image_data
+    def strip_image_urls(self, text: str) -> str:
+        """Note text with its image URLs removed, without downloading anything."""
+        return self.analyze_note(text).clean_text
 
     def parse_image_references(self, text: str) -> list:
         """Parse text for image URLs or references and return list of found images."""
-        image_references = []
-
-        # Regex patterns for different image reference formats
-        patterns = [
-            # URL patterns (http/https)
-            r'https?://[^\s]+\.(?:jpg|jpeg|png|gif|webp|svg)(?:\?[^\s]*)?',
-            # Markdown image syntax ![alt](url)
-            r'!\[[^\]]*\]\(([^\)]+\.(?:jpg|jpeg|png|gif|webp|svg)(?:\?[^\)]*)?)\)',
-            # HTML image tags <img src="url">
-            r'<img[^>]+src=["\']([^"\']+\.(?:jpg|jpeg|png|gif|webp|svg)(?:\?[^"\']*)?)["\'][^>]*>',
-            # Simple file references (local files)
-            r'[^\s]+\.(?:jpg|jpeg|png|gif|webp|svg)'
-        ]
-
-        for pattern in patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
-                if match.groups():
-                    # Extract URL from capturing group (for markdown/html)
-                    url = match.group(1)
-                else:
-                    # Use the full match (for direct URLs)
-                    url = match.group(0)
-
-                if url not in image_references:
-                    image_references.append(url)
-                    debug_log(f"Found image reference: {url}")
-
+        image_references = scan_image_references(text)
+        if image_references:
+            debug_log(f"Found {len(image_references)} image references")
         return image_references
 
     def get_storage_info(self) -> dict:
-        """Get information about the images directory."""
-        if self.images_dir.exists():
-            # Count files in the directory
-            image_files = list(self.images_dir.glob("*"))
-            total_size = sum(f.stat().st_size for f in image_files if f.is_file())
-            return {
-                'exists': True,
-                'count': len(image_files),
-                'total_size': total_size,
-                'path': str(self.images_dir)
-            }
-        else:
-            return {
-                'exists': False,
-                'count': 0,
-                'total_size': 0,
-                'path': str(self.images_dir)
-            }
-
-    def cleanup_unused_images(self, referenced_images: set) -> int:
-        """Remove unused images from storage, return count of removed files."""
-        if not self.images_dir.exists():
-            return 0
-
-        removed_count = 0
-        for image_file in self.images_dir.glob("*"):
-            if image_file.is_file() and str(image_file) not in referenced_images:
-                try:
-                    image_file.unlink()
-                    removed_count += 1
-                    debug_log(f"Removed unused image: {image_file}")
-                except Exception as e:
-                    debug_log(f"Error removing image {image_file}: {e}")
-
-        return removed_count
\ No newline at end of file
+        """Get information about the image cache."""
+        info = self.cache.get_storage_info()
+        info.update(self.failures.get_storage_info())
+        info.update(self.thumbnails.get_storage_info())
+        info.update(decoded_images.get_storage_info())
+        return info
+
+    def close(self) -> None:
+        """Drop queued downloads and release pooled connections."""
+        self.fetcher.close()
+        self.session.close()
+        self.cache.flush()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Append-only write-ahead journal for annotation changes."""
+
+import json
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+
+from ..utils.debug import debug_log
+
+
+# Each record is <payload length><crc32 of payload><payload>
+RECORD_HEADER = struct.Struct("<II")
+
+
+class AnnotationJournal:
+    """Append small change records to a log file and replay them on startup.
+
+    Records are written immediately but only fsynced once ``fsync_batch``
+    records are pending or ``fsync_interval`` seconds have passed, so a burst
+    of edits costs one fsync. A torn or corrupt tail left by a crash is
+    dropped on replay. Records are JSON lists.
+    """
+
+    def __init__(self, path: str, fsync_batch: int = 32, fsync_interval: float = 1.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._pending = 0
+        self._size = self.path.stat().st_size if self.path.exists() else 0
+        self._last_sync = time.monotonic()
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+        return self._file
+
+    def append(self, record: list) -> None:
+        """Append one change record."""
+        payload = json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        f = self._open()
+        f.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._size += RECORD_HEADER.size + len(payload)
+        self._pending += 1
+        if (self._pending >= self.fsync_batch or
+                time.monotonic() - self._last_sync >= self.fsync_interval):
+            self.sync()
+
+    def sync(self) -> None:
+        """Flush pending records and fsync the journal."""
+        if self._file is None:
+            return
+        self._file.flush()
+        if self._pending:
+            os.fsync(self._file.fileno())
+            self._pending = 0
+        self._last_sync = time.monotonic()
+
+    @property
+    def pending(self) -> int:
+        """Number of records written but not yet fsynced."""
+        return self._pending
+
+    def size(self) -> int:
+        """Current size of the journal in bytes, including unflushed records."""
+        return self._size
+
+    def rotate(self, rotated_path: str) -> None:
+        """Sync and move the journal aside so a fresh one can be started.
+
+        If an earlier rotation was never cleaned up, the journal is appended to
+        it instead so no unsnapshotted records are lost.
+        """
+        self.close()
+        if self.path.exists():
+            if os.path.exists(rotated_path):
+                with open(rotated_path, 'ab') as dest, open(self.path, 'rb') as src:
+                    dest.write(src.read())
+                    dest.flush()
+                    os.fsync(dest.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, rotated_path)
+        self._size = 0
+
+    def close(self) -> None:
+        """Sync and close the journal file."""
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def replay(path: str, loads=json.loads):
+        """Yield the records in a journal file, truncating any corrupt tail.
+
+        ``loads`` decodes one payload; journals from older versions pass
+        their own.
+        """
+        if not os.path.exists(path):
+            return
+
+        with open(path, 'r+b') as f:
+            good_offset = 0
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if not header:
+                    break
+                if len(header) < RECORD_HEADER.size:
+                    break
+                length, crc = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                try:
+                    record = loads(payload)
+                except Exception:
+                    break
+                good_offset = f.tell()
+                yield record
+
+            if good_offset < os.path.getsize(path):
+                debug_log(f"Truncating corrupt journal tail in {path} at byte {good_offset}")
+                f.truncate(good_offset)
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Snapshot plus write-ahead journal storage backend."""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+from .atomic import atomic_json_dump
+from .backend import StorageBackend, highlight_key, mark_key
+from .journal import AnnotationJournal
+from .legacy import legacy_pickle_allowed, load_legacy_pickle, loads_legacy_pickle
+from .locking import FileLock, LockTimeout
+from .metrics import metrics
+from .protocol import decode_highlight, decode_highlights, decode_mark, encode_highlight, encode_highlights
+from ..utils.debug import debug_log
+
+
+class JournalBackend(StorageBackend):
+    """Keep annotations in memory, journal every change, compact in the background.
+
+    Saving a change appends one small record to ``annotations.wal``. Once
+    the journal grows past ``compact_bytes`` a background thread folds it into
+    ``annotations.snapshot.json``. Startup loads the snapshot and replays the
+    journal; every record is idempotent, so replaying records that already
+    reached the snapshot is harmless. Both files hold JSON.
+
+    Earlier versions pickled the snapshot and records into
+    ``annotations.snapshot`` and ``annotations.journal``. Those are read once
+    (never in server mode), compacted into the new files and removed.
+
+    The state lives in this process's memory, so only one process may
+    open a data directory at a time; a second one gets LockTimeout.
+    """
+
+    name = "journal"
+
+    def __init__(self, data_dir: str = "data", compact_bytes: int = 1024 * 1024,
+                 fsync_batch: int = 32, fsync_interval: float = 1.0):
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.snapshot_path = self.data_dir / "annotations.snapshot.json"
+        self.journal_path = self.data_dir / "annotations.wal"
+        self.compacting_path = self.data_dir / "annotations.wal.compacting"
+        self.legacy_snapshot_path = self.data_dir / "annotations.snapshot"
+        self.legacy_journal_paths = (self.data_dir / "annotations.journal.compacting",
+                                     self.data_dir / "annotations.journal")
+        self.compact_bytes = compact_bytes
+        self._process_lock = FileLock(self.data_dir / ".journal.lock")
+        try:
+            self._process_lock.acquire(timeout=0)
+        except LockTimeout:
+            raise LockTimeout(f"Another process has the annotation journal in {self.data_dir} open")
+
+        self.highlights = {}
+        self.marks = []
+        self.current_page = 0
+
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+        converted = self._recover()
+
+        self.journal = AnnotationJournal(self.journal_path, fsync_batch, fsync_interval)
+        if converted:
+            self._drop_legacy()
+        self._thread = threading.Thread(target=self._maintenance_loop,
+                                        name="journal-maintenance", daemon=True)
+        self._thread.start()
+
+    # Recovery and compaction
+
+    def _recover(self) -> bool:
+        """Rebuild state from the snapshot and any journals left on disk.
+
+        Returns True if the state came from the old pickle files.
+        """
+        converted = False
+        if self.snapshot_path.exists():
+            try:
+                with open(self.snapshot_path, 'rb') as f:
+                    state = json.load(f)
+                self.highlights = decode_highlights(state.get('highlights', []))
+                self.marks = [decode_mark(m) for m in state.get('marks', [])]
+                self.current_page = state.get('current_page', 0)
+            except Exception as e:
+                debug_log(f"Error loading annotation snapshot: {e}")
+        else:
+            converted = self._recover_legacy()
+
+        replayed = 0
+        for path in (self.compacting_path, self.journal_path):
+            for record in AnnotationJournal.replay(str(path)):
+                self._apply(_decode_record(record))
+                replayed += 1
+        debug_log(f"Recovered annotations: {len(self.highlights)} pages, "
+                  f"{len(self.marks)} marks, {replayed} journal records replayed")
+        return converted
+
+    def _recover_legacy(self) -> bool:
+        """Load the pickled snapshot and journals written by earlier versions."""
+        paths = [self.legacy_snapshot_path, *self.legacy_journal_paths]
+        if not any(path.exists() for path in paths):
+            return False
+        if not legacy_pickle_allowed():
+            debug_log(f"Refusing to unpickle the old annotation journal in {self.data_dir} "
+                      f"in server mode; open it once outside server mode to convert it")
+            return False
+        try:
+            state = load_legacy_pickle(str(self.legacy_snapshot_path))
+            if state is not None:
+                self.highlights = state.get('highlights', {})
+                self.marks = state.get('marks', [])
+                self.current_page = state.get('current_page', 0)
+            for path in self.legacy_journal_paths:
+                for record in AnnotationJournal.replay(str(path), loads_legacy_pickle):
+                    self._apply(record)
+        except Exception as e:
+            debug_log(f"Error loading old annotation journal: {e}")
+            return False
+        return True
+
+    def _drop_legacy(self) -> None:
+        """Write the converted state in the new format, then remove the pickle files."""
+        self.compact()
+        if not self.snapshot_path.exists():
+            return
+        for path in (self.legacy_snapshot_path, *self.legacy_journal_paths):
+            if path.exists():
+                os.remove(path)
+        debug_log(f"Converted the old annotation journal in {self.data_dir}")
+
+    def _apply(self, record: tuple) -> bool:
+        """Apply one change record to the in-memory state."""
+        op = record[0]
+        if op == 'put_highlight':
+            _, page_num, highlight = record
+            key = highlight_key(page_num, highlight)
+            page_highlights = [
+                h for h in self.highlights.get(page_num, []) if highlight_key(page_num, h) != key
+            ]
+            page_highlights.append(highlight)
+            self.highlights[page_num] = page_highlights
+        elif op == 'del_highlight':
+            _, page_num, start_pos = record
+            page_highlights = self.highlights.get(page_num, [])
+            remaining = [h for h in page_highlights if tuple(h[0]) != tuple(start_pos)]
+            if len(remaining) == len(page_highlights):
+                return False
+            if remaining:
+                self.highlights[page_num] = remaining
+            else:
+                del self.highlights[page_num]
+        elif op == 'set_highlights':
+            self.highlights = {page: list(items) for page, items in record[1].items()}
+        elif op == 'put_mark':
+            key = mark_key(record[1])
+            self.marks = [m for m in self.marks if mark_key(m) != key] + [record[1]]
+        elif op == 'del_mark':
+            remaining = [m for m in self.marks if mark_key(m) != record[1]]
+            if len(remaining) == len(self.marks):
+                return False
+            self.marks = remaining
+        elif op == 'set_marks':
+            self.marks = list(record[1])
+        elif op == 'page':
+            self.current_page = record[1]
+        return True
+
+    def _record(self, record: tuple) -> bool:
+        """Apply a change and append it to the journal."""
+        with self._lock:
+            changed = self._apply(record)
+            if changed:
+                size = self.journal.size()
+                self.journal.append(_encode_record(record))
+                metrics.add_bytes('journal', self.journal.size() - size)
+                if self.journal.size() >= self.compact_bytes:
+                    self._wake.notify()
+            return changed
+
+    @metrics.instrument('journal.compact')
+    def compact(self) -> None:
+        """Fold the journal into a new snapshot."""
+        with self._compact_lock:
+            with self._lock:
+                self.journal.rotate(str(self.compacting_path))
+                highlights = {page: list(items) for page, items in self.highlights.items()}
+                marks = list(self.marks)
+                current_page = self.current_page
+
+            # The expensive part runs without the state lock so edits keep flowing
+            try:
+                state = {
+                    'highlights': encode_highlights(highlights),
+                    'marks': [list(mark) for mark in marks],
+                    'current_page': current_page,
+                }
+                metrics.add_bytes('journal', atomic_json_dump(state, self.snapshot_path))
+                os.remove(self.compacting_path)
+                debug_log(f"Compacted annotation journal into {self.snapshot_path}")
+            except Exception as e:
+                metrics.increment('journal.compact.errors')
+                debug_log(f"Error compacting annotation journal: {e}")
+
+    def _maintenance_loop(self) -> None:
+        """Background thread: fsync batched records and compact when needed."""
+        while True:
+            with self._lock:
+                self._wake.wait(timeout=self.journal.fsync_interval)
+                if self._closed:
+                    return
+                self.journal.sync()
+                needs_compaction = self.journal.size() >= self.compact_bytes
+            if needs_compaction:
+                self.compact()
+
+    # StorageBackend interface
+
+    def load_highlights(self) -> dict:
+        with self._lock:
+            return {page: list(items) for page, items in self.highlights.items()}
+
+    def load_page_highlights(self, page_num: int) -> list:
+        with self._lock:
+            return list(self.highlights.get(page_num, []))
+
+    def iter_highlights(self):
+        highlights = self.load_highlights()
+        for page_num in sorted(highlights):
+            for highlight in sorted(highlights[page_num], key=lambda h: h[0]):
+                yield page_num, highlight
+
+    def save_highlights(self, highlights: dict) -> None:
+        self._record(('set_highlights', {page: list(items) for page, items in highlights.items()}))
+
+    def upsert_highlight(self, page_num: int, highlight: tuple) -> None:
+        self._record(('put_highlight', page_num, highlight))
+
+    def delete_highlight(self, page_num: int, start_pos: tuple) -> bool:
+        return self._record(('del_highlight', page_num, tuple(start_pos)))
+
+    def load_marks(self) -> list:
+        with self._lock:
+            return list(self.marks)
+
+    def save_marks(self, marks: list) -> None:
+        self._record(('set_marks', list(marks)))
+
+    def upsert_mark(self, mark: tuple) -> None:
+        self._record(('put_mark', mark))
+
+    def delete_mark(self, mark: tuple) -> bool:
+        return self._record(('del_mark', mark_key(mark)))
+
+    def load_current_page(self, total_pages: int) -> int:
+        with self._lock:
+            saved_page = self.current_page
+        if 0 <= saved_page < total_pages:
+            return saved_page
+        debug_log(f"Saved page {saved_page} out of bounds, starting at page 0")
+        return 0
+
+    def save_current_page(self, current_page: int) -> None:
+        with self._lock:
+            if current_page == self.current_page:
+                return
+        self._record(('page', current_page))
+
+    def get_storage_info(self) -> dict:
+        def file_info(path):
+            exists = path.exists()
+            return {
+                'exists': exists,
+                'size': path.stat().st_size if exists else 0,
+                'modified': path.stat().st_mtime if exists else None,
+                'path': str(path),
+            }
+
+        with self._lock:
+            return {
+                'backend': self.name,
+                'snapshot': file_info(self.snapshot_path),
+                'journal': file_info(self.journal_path),
+                'pending_fsync': self.journal.pending,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wake.notify()
+        self._thread.join()
+        with self._lock:
+            self.journal.close()
+        self._process_lock.release()
+
+
+# Journal records are tuples in memory and JSON lists on disk
+
+def _encode_record(record: tuple) -> list:
+    op = record[0]
+    if op == 'put_highlight':
+        return [op, record[1], encode_highlight(record[2])]
+    if op == 'set_highlights':
+        return [op, encode_highlights(record[1])]
+    if op == 'set_marks':
+        return [op, [list(mark) for mark in record[1]]]
+    return [op] + [list(value) if isinstance(value, tuple) else value for value in record[1:]]
+
+
+def _decode_record(data: list) -> tuple:
+    op = data[0]
+    if op == 'put_highlight':
+        return (op, data[1], decode_highlight(data[2]))
+    if op == 'del_highlight':
+        return (op, data[1], tuple(data[2]))
+    if op == 'set_highlights':
+        return (op, decode_highlights(data[1]))
+    if op == 'set_marks':
+        return (op, [decode_mark(mark) for mark in data[1]])
+    if op in ('put_mark', 'del_mark'):
+        return (op, decode_mark(data[1]))
+    return tuple(data)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Reading the pickle files written by earlier versions."""
+
+import os
+import pickle
+
+from ..utils.debug import debug_log
+
+
+def legacy_pickle_allowed() -> bool:
+    """Whether old pickle stores may be read implicitly.
+
+    Unpickling can run arbitrary code, so server mode never does it; those
+    data directories have to be converted with ``genrejinn-convert`` first.
+    """
+    return os.environ.get('GENREJINN_SERVER_MODE') != '1'
+
+
+def load_legacy_pickle(path: str, force: bool = False):
+    """Load an old pickle store, or return None if it is missing or not allowed."""
+    if not os.path.exists(path):
+        return None
+    if not (force or legacy_pickle_allowed()):
+        debug_log(f"Refusing to unpickle {path} in server mode; run genrejinn-convert first")
+        return None
+    with open(path, 'rb') as f:
+        data = pickle.load(f)
+    debug_log(f"Loaded legacy pickle store {path}")
+    return data
+
+
+def loads_legacy_pickle(data: bytes):
+    """Unpickle one record of an old store; check legacy_pickle_allowed() first."""
+    return pickle.loads(data)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Inter-process locks and change detection for file stores."""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+from ..utils.debug import debug_log
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+
+CONFLICT_POLICIES = ('merge', 'reject')
+
+
+class ConflictError(Exception):
+    """A record was changed by another process since this one last read it."""
+
+    def __init__(self, store: str, keys: list):
+        self.store = store
+        self.keys = list(keys)
+        super().__init__(f"{len(self.keys)} {store} record(s) changed by another process: "
+                         f"{', '.join(map(str, self.keys[:5]))}")
+
+
+class LockTimeout(TimeoutError):
+    """Another process held a store lock for too long."""
+
+
+def file_version(path) -> tuple:
+    """Identity of a file's current contents, or None if it does not exist.
+
+    Stores are replaced by rename on every write, so the inode changes
+    even when two writes land in the same mtime tick.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class FileLock:
+    """Exclusive advisory lock on a lock file, shared by threads of one process.
+
+    Uses ``fcntl.flock``, so it only guards against processes that take the
+    same lock; every GenreJinn writer does. Where fcntl is missing the lock
+    only covers threads of this process. Re-entering from the thread that
+    holds it is allowed.
+    """
+
+    def __init__(self, path, timeout: float = 30.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self, timeout: float = None) -> None:
+        timeout = self.timeout if timeout is None else timeout
+        if not self._thread_lock.acquire(timeout=timeout if timeout >= 0 else -1):
+            raise LockTimeout(f"Timed out waiting for {self.path}")
+        if self._depth:
+            self._depth += 1
+            return
+        try:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if FCNTL_AVAILABLE:
+                self._flock(timeout)
+        except BaseException:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._thread_lock.release()
+            raise
+        self._depth = 1
+
+    def _flock(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(f"Timed out waiting for {self.path}")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+
+    def release(self) -> None:
+        self._depth -= 1
+        if not self._depth:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
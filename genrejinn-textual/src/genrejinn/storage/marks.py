@@ -3,47 +3,67 @@
 
 """Mark persistence and storage management."""
 
-import pickle
 import os
 import time
 from pathlib import Path
-
-
-def debug_log(message):
-    """Debug logging function."""
-    with open('data/log.txt', 'a') as f:
-        f.write(f"{message}\n")
-        f.flush()
+from . import binary
+from .atomic import atomic_write
+from .legacy import load_legacy_pickle
+from .metrics import metrics
+from .schema import LEGACY_VERSION, format_report, migrate, needs_upgrade
+from .snapshots import SnapshotStore
+from ..utils.debug import debug_log
 
 
 class MarkStorage:
     """Manage saving and loading of marks."""
 
     def __init__(self, storage_path: str = None):
-        self.storage_path = storage_path or "data/marks.pkl"
+        self.storage_path = storage_path or "data/marks.gjb"
+        self.legacy_path = str(Path(self.storage_path).with_suffix('.pkl'))
         self.storage_dir = Path(self.storage_path).parent
         self.storage_dir.mkdir(parents=True, exist_ok=True)
 
+    @metrics.instrument('marks.save')
     def save_marks(self, marks: list) -> None:
-        """Save marks to a pickle file."""
+        """Save marks to a binary store."""
         try:
-            with open(self.storage_path, 'wb') as f:
-                pickle.dump(marks, f)
+            data = binary.dumps(binary.write_marks, marks)
+            atomic_write(self.storage_path, data)
+            metrics.add_bytes('marks', len(data))
             debug_log(f"Saved {len(marks)} marks")
         except Exception as e:
+            metrics.increment('marks.save.errors')
             debug_log(f"Error saving marks: {e}")
 
+    @metrics.instrument('marks.load')
     def load_marks(self) -> list:
-        """Load marks from a pickle file."""
+        """Load marks from the binary store, or from an old pickle file.
+
+        Stores in an older schema are upgraded once and written back.
+        """
         marks = []
         try:
+            version = None
             if os.path.exists(self.storage_path):
                 with open(self.storage_path, 'rb') as f:
-                    marks = pickle.load(f)
+                    marks, version = binary.read_marks_with_schema(f)
                 debug_log(f"Loaded {len(marks)} marks")
             else:
-                debug_log("No marks file found, starting fresh")
+                legacy = load_legacy_pickle(self.legacy_path)
+                if legacy is not None:
+                    marks, version = legacy, LEGACY_VERSION
+                    debug_log(f"Loaded {len(marks)} marks from {self.legacy_path}")
+                else:
+                    debug_log("No marks file found, starting fresh")
+
+            if version is not None and (needs_upgrade('marks', version)
+                                        or not os.path.exists(self.storage_path)):
+                marks, steps = migrate('marks', marks, version)
+                debug_log(format_report(steps))
+                self.save_marks(marks)
         except Exception as e:
+            metrics.increment('marks.load.errors')
             debug_log(f"Error loading marks: {e}")
 
         return marks
@@ -71,20 +91,21 @@ class MarkStorage:
         sanitized_id = '-'.join(filter(None, sanitized_id.split('-')))
         return sanitized_id
 
-    def backup_marks(self, marks: list, backup_name: str = None) -> None:
-        """Create a backup of current marks."""
-        if backup_name is None:
-            backup_name = f"marks_backup_{int(time.time())}.pkl"
-
-        backup_path = self.storage_dir / "backups" / backup_name
-        backup_path.parent.mkdir(parents=True, exist_ok=True)
+    def backup_marks(self, marks: list, backup_name: str = None) -> dict:
+        """Snapshot marks into the deduplicated backup store, return the manifest.
 
+        Only batches of marks that changed since an earlier snapshot take new
+        space; see SnapshotStore for listing, restoring and pruning.
+        """
         try:
-            with open(backup_path, 'wb') as f:
-                pickle.dump(marks, f)
-            debug_log(f"Created mark backup: {backup_path}")
+            manifest = SnapshotStore(self.storage_dir / "backups").create_snapshot(
+                marks=marks, label=backup_name
+            )
+            debug_log(f"Created mark backup: {manifest['id']}")
+            return manifest
         except Exception as e:
             debug_log(f"Error creating mark backup: {e}")
+            return None
 
     def get_storage_info(self) -> dict:
         """Get information about the storage file."""
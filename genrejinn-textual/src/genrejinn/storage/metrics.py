@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Counters and latency histograms for the storage layer."""
+
+import bisect
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from .atomic import atomic_write
+
+
+# Upper bounds of the latency buckets, in milliseconds; slower calls land in
+# a final overflow bucket
+BUCKET_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LatencyHistogram:
+    """Call count, total, extremes and fixed-bucket counts for one operation."""
+
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+
+    def observe(self, seconds: float) -> None:
+        ms = seconds * 1000
+        self.count += 1
+        self.total += ms
+        self.min = ms if self.min is None else min(self.min, ms)
+        self.max = max(self.max, ms)
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of calls, in ms."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return BUCKET_BOUNDS_MS[index] if index < len(BUCKET_BOUNDS_MS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'total_ms': round(self.total, 3),
+            'mean_ms': round(self.total / self.count, 3) if self.count else 0.0,
+            'min_ms': round(self.min or 0.0, 3),
+            'max_ms': round(self.max, 3),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': dict(zip([str(bound) for bound in BUCKET_BOUNDS_MS] + ['inf'], self.buckets)),
+        }
+
+
+class StorageMetrics:
+    """Process-wide registry of storage counters and latencies.
+
+    Operations are named ``<store>.<operation>``, e.g. ``highlights.load``
+    or ``sqlite.upsert_highlights``; bytes go to ``<store>.bytes_written``
+    and swallowed failures to ``<store>.<operation>.errors``. Recording is
+    a dict update under a lock, cheap enough to leave on everywhere.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._latencies = {}
+        self.started = time.time()
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def add_bytes(self, store: str, count: int) -> None:
+        self.increment(f"{store}.bytes_written", count)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._latencies.get(name)
+            if histogram is None:
+                histogram = self._latencies[name] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timed(self, name: str):
+        """Time the body of a with block as one call of the named operation."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.increment(f"{name}.errors")
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def instrument(self, name: str):
+        """Decorator that times every call of a function."""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timed(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def snapshot(self) -> dict:
+        """All counters and latency summaries as plain JSON-ready data."""
+        with self._lock:
+            return {
+                'started': self.started,
+                'uptime': round(time.time() - self.started, 3),
+                'counters': dict(sorted(self._counters.items())),
+                'latency': {name: histogram.to_dict()
+                            for name, histogram in sorted(self._latencies.items())},
+            }
+
+    def dump_json(self, path: str) -> dict:
+        """Write a snapshot to path as JSON, return it."""
+        snapshot = self.snapshot()
+        atomic_write(path, json.dumps(snapshot, indent=2).encode('utf-8'))
+        return snapshot
+
+    def format_table(self) -> str:
+        """Render a snapshot as the text shown in the stats panel."""
+        snapshot = self.snapshot()
+        lines = [f"{'operation':<34}{'calls':>8}{'mean':>10}{'p95':>10}{'max':>10}"]
+        for name, latency in snapshot['latency'].items():
+            lines.append(f"{name:<34}{latency['count']:>8}{latency['mean_ms']:>8.2f}ms"
+                         f"{latency['p95_ms']:>8.2f}ms{latency['max_ms']:>8.1f}ms")
+        if not snapshot['latency']:
+            lines.append("(no storage calls yet)")
+        if snapshot['counters']:
+            lines.append("")
+            for name, value in snapshot['counters'].items():
+                lines.append(f"{name:<34}{value:>12}")
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._latencies.clear()
+            self.started = time.time()
+
+
+metrics = StorageMetrics()
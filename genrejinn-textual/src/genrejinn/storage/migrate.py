@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Copy annotations from one storage backend to another."""
+
+import argparse
+import sys
+
+from .config import BACKENDS, create_backend, get_storage_config
+
+
+def migrate_backend(source, target) -> dict:
+    """Copy highlights, marks and reading position from source to target."""
+    highlights = {}
+    for page_num, highlight in source.iter_highlights():
+        highlights.setdefault(page_num, []).append(source.resolve_highlight(highlight))
+    target.save_highlights(highlights)
+
+    marks = source.load_marks()
+    target.save_marks(marks)
+
+    current_page = source.load_current_page(sys.maxsize)
+    target.save_current_page(current_page)
+
+    return {
+        'pages': len(highlights),
+        'highlights': sum(len(items) for items in highlights.values()),
+        'marks': len(marks),
+        'current_page': current_page,
+    }
+
+
+def parse_migrate_arguments(argv: list = None) -> argparse.Namespace:
+    """Parse command line arguments for backend migration."""
+    config = get_storage_config()
+    parser = argparse.ArgumentParser(description='Migrate GenreJinn annotations between backends')
+    parser.add_argument('--from', dest='source', choices=sorted(BACKENDS), default='binary',
+                        help='Backend to read from (default: binary)')
+    parser.add_argument('--to', dest='target', choices=sorted(BACKENDS), default='sqlite',
+                        help='Backend to write to (default: sqlite)')
+    parser.add_argument('--data-dir', default=config['data_dir'],
+                        help=f"Data directory (default: {config['data_dir']})")
+    parser.add_argument('--book-id', default=config['book_id'],
+                        help=f"Book identifier (default: {config['book_id']})")
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> int:
+    """Run a backend migration from the command line."""
+    args = parse_migrate_arguments(argv)
+    if args.source == args.target:
+        print("Error: source and target backends are the same")
+        return 1
+
+    shared = {'data_dir': args.data_dir, 'book_id': args.book_id}
+    source = create_backend(dict(shared, backend=args.source))
+    target = create_backend(dict(shared, backend=args.target))
+    try:
+        summary = migrate_backend(source, target)
+    finally:
+        source.close()
+        target.close()
+
+    print(f"Migrated {summary['highlights']} highlights on {summary['pages']} pages, "
+          f"{summary['marks']} marks and the current page ({summary['current_page']}) "
+          f"from {args.source} to {args.target}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Per-book and per-reader storage directories."""
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+from .atomic import atomic_write
+from ..utils.debug import debug_log
+
+
+# Bump when the shape of anything kept in the book cache changes
+CACHE_VERSION = 1
+
+_SAFE_ID = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$')
+
+
+def book_id_for(epub_path: str) -> str:
+    """Identify a book by the SHA-256 of its EPUB file, so renamed copies share data."""
+    digest = hashlib.sha256()
+    with open(epub_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def safe_id(value: str) -> str:
+    """Make a user or book id safe to use as a single path component."""
+    value = str(value)
+    if _SAFE_ID.match(value) and value not in ('.', '..'):
+        return value
+    return "id-" + hashlib.sha256(value.encode('utf-8')).hexdigest()[:16]
+
+
+class StorageNamespace:
+    """Directories for one reader of one book.
+
+    Layout under the data root::
+
+        books/<book_id>/cache/            shared, derived from the EPUB alone
+        books/<book_id>/users/<user_id>/  this reader's annotations and images
+
+    Everything a reader writes lives in their own directory, so concurrent
+    sessions never rewrite each other's stores. The cache holds data any
+    reader could rebuild from the book (parsed paragraphs, indexes); it is
+    written once with an atomic rename and only read after that.
+    """
+
+    def __init__(self, root: str = "data", book_id: str = "default", user_id: str = "local"):
+        self.root = Path(root)
+        self.book_id = safe_id(book_id)
+        self.user_id = safe_id(user_id)
+        self.book_dir = self.root / "books" / self.book_id
+        self.cache_dir = self.book_dir / "cache"
+        self.user_dir = self.book_dir / "users" / self.user_id
+        self.images_dir = self.user_dir / "images"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.user_dir.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: dict, epub_path: str = None) -> "StorageNamespace":
+        """Namespace for a storage config; the book id comes from the EPUB unless set."""
+        book_id = config.get('book_id', 'default')
+        if book_id == 'default' and epub_path and os.path.exists(epub_path):
+            book_id = book_id_for(epub_path)
+        return cls(config['data_dir'], book_id, config.get('user_id', 'local'))
+
+    def backend_config(self, config: dict) -> dict:
+        """Storage config pointing a backend at this reader's directory."""
+        return dict(config, data_dir=str(self.user_dir), book_id=self.book_id, namespaced=False)
+
+    # Shared book cache
+
+    def cache_path(self, name: str) -> Path:
+        return self.cache_dir / f"{safe_id(name)}.v{CACHE_VERSION}.json"
+
+    def load_cached(self, name: str):
+        """Read an entry from the book cache, or None if it is not there."""
+        path = self.cache_path(name)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            debug_log(f"Error reading book cache {path}: {e}")
+            return None
+
+    def store_cached(self, name: str, data) -> None:
+        """Add an entry to the book cache; readers racing to build it write the same bytes."""
+        path = self.cache_path(name)
+        try:
+            atomic_write(path, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+            os.chmod(path, 0o444)
+        except Exception as e:
+            debug_log(f"Error writing book cache {path}: {e}")
+
+    def cached(self, name: str, build):
+        """Return a cache entry, building and storing it on first use."""
+        data = self.load_cached(name)
+        if data is None:
+            data = build()
+            self.store_cached(name, data)
+            debug_log(f"Built book cache entry {name} for {self.book_id}")
+        return data
+
+    def get_storage_info(self) -> dict:
+        return {
+            'book_id': self.book_id,
+            'user_id': self.user_id,
+            'cache': str(self.cache_dir),
+            'user': str(self.user_dir),
+        }
+
+
+def open_namespace(config: dict, epub_path: str = None):
+    """StorageNamespace for the config if namespacing is on, else None."""
+    if not config.get('namespaced'):
+        return None
+    return StorageNamespace.from_config(config, epub_path)
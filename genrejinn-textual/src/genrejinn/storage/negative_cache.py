@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Remember failed image downloads so they are not retried on every refresh."""
+
+import json
+import threading
+import time
+from pathlib import Path
+
+from .atomic import atomic_write
+from .fetcher import host_of
+from .image_cache import url_key
+from ..utils.debug import debug_log
+
+
+# Responses that mean the image is gone rather than the host being down
+MISSING_STATUSES = (404, 410)
+
+
+class NegativeCache:
+    """Failed URLs with a retry time, and a circuit breaker per host.
+
+    A URL that fails is skipped until its retry time; each further failure
+    doubles the wait, from ``retry_base`` (``missing_base`` for 404 and 410)
+    up to ``retry_max``. A host whose downloads fail ``host_threshold``
+    times in a row without a success (timeouts, refused connections, 5xx, 429)
+    is skipped entirely for ``host_cooldown``. When the cooldown ends one
+    download is let through: a success closes the breaker, a failure opens
+    it again for twice as long, up to ``retry_max``. Everything is kept in
+    one JSON file so restarts do not retry dead links straight away.
+    """
+
+    def __init__(self, path: str, retry_base: float = 60, missing_base: float = 3600,
+                 retry_max: float = 86400, host_threshold: int = 3, host_cooldown: float = 300):
+        self.path = Path(path)
+        self.retry_base = retry_base
+        self.missing_base = missing_base
+        self.retry_max = retry_max
+        self.host_threshold = host_threshold
+        self.host_cooldown = host_cooldown
+        self.urls = {}  # {url key: {'url', 'failures', 'retry_at', 'error'}}
+        self.hosts = {}  # {host: {'failures', 'trips', 'open_until'}}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.urls = data.get('urls', {})
+            self.hosts = data.get('hosts', {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            debug_log(f"Error loading failed downloads from {self.path}, starting empty: {e}")
+
+    def _save(self) -> None:
+        try:
+            atomic_write(self.path, json.dumps({'urls': self.urls, 'hosts': self.hosts},
+                                               separators=(',', ':')).encode('utf-8'))
+        except OSError as e:
+            debug_log(f"Error saving failed downloads: {e}")
+
+    def blocked(self, url: str) -> str:
+        """Why a URL should not be fetched now, or None if it may be."""
+        now = time.time()
+        with self._lock:
+            host = self.hosts.get(host_of(url))
+            if host and host['open_until'] > now:
+                return f"host {host_of(url)} is failing, retry in {host['open_until'] - now:.0f}s"
+            entry = self.urls.get(url_key(url))
+            if entry and entry['retry_at'] > now:
+                return f"{entry['error']}, retry in {entry['retry_at'] - now:.0f}s"
+        return None
+
+    def record_failure(self, url: str, error: str, status: int = None, permanent: bool = None) -> None:
+        """Note a failed download.
+
+        ``permanent`` failures (by default 404 and 410) wait from
+        ``missing_base`` and do not count against the host.
+        """
+        now = time.time()
+        if permanent is None:
+            permanent = status in MISSING_STATUSES
+        with self._lock:
+            entry = self.urls.setdefault(url_key(url), {'url': url, 'failures': 0})
+            entry['failures'] += 1
+            base = self.missing_base if permanent else self.retry_base
+            entry['retry_at'] = now + min(self.retry_max, base * 2 ** (entry['failures'] - 1))
+            entry['error'] = error
+
+            if not permanent and (status is None or status >= 500 or status == 429):
+                host = self.hosts.setdefault(host_of(url), {'failures': 0, 'trips': 0, 'open_until': 0})
+                host['failures'] += 1
+                if host['failures'] >= self.host_threshold:
+                    host['trips'] += 1
+                    cooldown = min(self.retry_max, self.host_cooldown * 2 ** (host['trips'] - 1))
+                    host['open_until'] = now + cooldown
+                    debug_log(f"Skipping downloads from {host_of(url)} for {cooldown:.0f}s")
+            self._save()
+
+    def record_success(self, url: str) -> None:
+        with self._lock:
+            changed = self.urls.pop(url_key(url), None) is not None
+            changed = self.hosts.pop(host_of(url), None) is not None or changed
+            if changed:
+                self._save()
+
+    def get_storage_info(self) -> dict:
+        now = time.time()
+        with self._lock:
+            return {
+                'failed_urls': len(self.urls),
+                'open_hosts': sorted(h for h, state in self.hosts.items() if state['open_until'] > now),
+            }
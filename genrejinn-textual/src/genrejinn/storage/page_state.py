@@ -3,41 +3,51 @@
 
 """Page state persistence for current reading position."""
 
-import pickle
 import os
 from pathlib import Path
-
-
-def debug_log(message):
-    """Debug logging function."""
-    with open('data/log.txt', 'a') as f:
-        f.write(f"{message}\n")
-        f.flush()
+from . import binary
+from .atomic import atomic_write
+from .legacy import load_legacy_pickle
+from .metrics import metrics
+from .schema import LEGACY_VERSION, migrate
+from ..utils.debug import debug_log
 
 
 class PageStateManager:
     """Manage current page state persistence."""
 
     def __init__(self, storage_path: str = None):
-        self.storage_path = storage_path or "data/current_page.pkl"
+        self.storage_path = storage_path or "data/current_page.gjb"
+        self.legacy_path = str(Path(self.storage_path).with_suffix('.pkl'))
         self.storage_dir = Path(self.storage_path).parent
         self.storage_dir.mkdir(parents=True, exist_ok=True)
 
+    @metrics.instrument('page_state.save')
     def save_current_page(self, current_page: int) -> None:
         """Save the current page number to a file."""
         try:
-            with open(self.storage_path, 'wb') as f:
-                pickle.dump(current_page, f)
+            data = binary.dumps(binary.write_page_state, current_page)
+            atomic_write(self.storage_path, data)
+            metrics.add_bytes('page_state', len(data))
             debug_log(f"Saved current page: {current_page}")
         except Exception as e:
+            metrics.increment('page_state.save.errors')
             debug_log(f"Error saving current page: {e}")
 
+    @metrics.instrument('page_state.load')
     def load_current_page(self, total_pages: int) -> int:
         """Get the saved page number from a file."""
         try:
             if os.path.exists(self.storage_path):
                 with open(self.storage_path, 'rb') as f:
-                    saved_page = pickle.load(f)
+                    saved_page = binary.read_page_state(f)
+            else:
+                saved_page = load_legacy_pickle(self.legacy_path)
+                if saved_page is not None:
+                    saved_page, _ = migrate('current_page', saved_page, LEGACY_VERSION)
+                    # Write back so the pickle is never read again
+                    self.save_current_page(saved_page)
+            if saved_page is not None:
                 # Ensure the saved page is within valid bounds
                 if 0 <= saved_page < total_pages:
                     debug_log(f"Found saved page: {saved_page}")
@@ -49,6 +59,7 @@ class PageStateManager:
                 debug_log("No current page file found, starting at page 0")
                 return 0
         except Exception as e:
+            metrics.increment('page_state.load.errors')
             debug_log(f"Error loading current page: {e}")
             return 0
 
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Exact reading position kept in a small memory-mapped record."""
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+from pathlib import Path
+
+from .metrics import metrics
+from ..utils.debug import debug_log
+
+
+MAGIC = b'GJPS'
+RECORD_VERSION = 1
+
+# magic, version, sequence, page, total_pages, paragraph, offset,
+# paragraph_count, scroll, saved_at; followed by a CRC32 of those bytes
+RECORD_BODY = struct.Struct("<4sB3xQIIIIIId")
+RECORD_CRC = struct.Struct("<I")
+SLOT_SIZE = 64
+SLOTS = 2
+FILE_SIZE = SLOT_SIZE * SLOTS
+
+ReadingAnchor = namedtuple(
+    'ReadingAnchor', 'page total_pages paragraph offset paragraph_count scroll saved_at'
+)
+ReadingAnchor.__new__.__defaults__ = (0, 0, 0, 0.0)
+
+
+class PositionStore:
+    """Keep the reader's exact place in a fixed-size, memory-mapped file.
+
+    An anchor is a paragraph index and character offset, which stay valid
+    when the book is paginated differently, plus the page and scroll
+    offset for restoring the view when it is not. Saving packs one
+    64-byte record into the map, so it can run on every cursor move.
+
+    The file has two slots written in turn, each carrying a sequence
+    number and CRC32; a record torn by a crash fails its check and the
+    other slot is used. Pages reach disk when the kernel writes them back,
+    or at ``flush``/``close``.
+    """
+
+    def __init__(self, path: str = "data/position.anchor"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < FILE_SIZE:
+                os.ftruncate(fd, FILE_SIZE)
+            self._map = mmap.mmap(fd, FILE_SIZE)
+        finally:
+            # The map keeps its own reference to the file
+            os.close(fd)
+        self._sequence, self._anchor = self._read_latest()
+
+    def _read_slot(self, slot: int):
+        start = slot * SLOT_SIZE
+        body = self._map[start:start + RECORD_BODY.size]
+        crc, = RECORD_CRC.unpack_from(self._map, start + RECORD_BODY.size)
+        if zlib.crc32(body) != crc:
+            return None
+        magic, version, sequence, *fields = RECORD_BODY.unpack(body)
+        if magic != MAGIC or version != RECORD_VERSION:
+            return None
+        return sequence, ReadingAnchor(*fields)
+
+    def _read_latest(self) -> tuple:
+        records = [record for record in map(self._read_slot, range(SLOTS)) if record]
+        if not records:
+            return 0, None
+        return max(records, key=lambda record: record[0])
+
+    def load(self) -> ReadingAnchor:
+        """The last saved anchor, or None if nothing was ever saved."""
+        with self._lock:
+            return self._anchor
+
+    @metrics.instrument('position.save')
+    def save(self, anchor: ReadingAnchor) -> None:
+        """Record the reading position."""
+        anchor = anchor._replace(saved_at=anchor.saved_at or time.time())
+        with self._lock:
+            if anchor[:6] == (self._anchor or ())[:6]:
+                return
+            self._sequence += 1
+            body = RECORD_BODY.pack(MAGIC, RECORD_VERSION, self._sequence, *anchor)
+            start = (self._sequence % SLOTS) * SLOT_SIZE
+            self._map[start:start + RECORD_BODY.size + RECORD_CRC.size] = (
+                body + RECORD_CRC.pack(zlib.crc32(body))
+            )
+            self._anchor = anchor
+
+    def flush(self) -> None:
+        """Push the mapped record to disk."""
+        with self._lock:
+            if not self._map.closed:
+                self._map.flush()
+
+    def get_storage_info(self) -> dict:
+        return {
+            'exists': self.path.exists(),
+            'size': FILE_SIZE,
+            'sequence': self._sequence,
+            'anchor': self._anchor._asdict() if self._anchor else None,
+            'path': str(self.path),
+        }
+
+    def close(self) -> None:
+        try:
+            self.flush()
+            with self._lock:
+                self._map.close()
+        except Exception as e:
+            debug_log(f"Error closing position store: {e}")
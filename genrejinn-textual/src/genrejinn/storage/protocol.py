@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Wire format shared by the annotation daemon and its clients.
+
+Every message is a 4-byte big-endian length followed by that many bytes of
+compact JSON. Requests look like ``{"id": 7, "op": "get_page", "page": 12}``;
+replies echo the id with ``"ok": true, "result": ...`` or ``"ok": false,
+"error": ..., "type": ...``. A connection that sent ``subscribe`` receives
+``{"event": ...}`` messages from then on. JSON rather than pickle, so a
+client can never make the daemon run code.
+"""
+
+import json
+import struct
+
+
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME = 64 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    """A malformed or oversized message."""
+
+
+class DaemonError(Exception):
+    """The daemon could not carry out a request."""
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            raise EOFError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_message(sock, message: dict) -> None:
+    payload = json.dumps(message, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def recv_message(sock) -> dict:
+    """Read one message; raises EOFError when the peer has closed the connection.
+
+    A frame that is not a UTF-8 JSON object raises ProtocolError.
+    """
+    length, = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    if length > MAX_FRAME:
+        raise ProtocolError(f"Message of {length} bytes is too large")
+    payload = _recv_exact(sock, length)
+    try:
+        message = json.loads(payload.decode('utf-8'))
+    except ValueError as e:
+        # JSONDecodeError and UnicodeDecodeError are both ValueErrors
+        raise ProtocolError(f"Message is not valid JSON: {e}") from e
+    if not isinstance(message, dict):
+        raise ProtocolError("Message is not an object")
+    return message
+
+
+# Records travel as JSON lists; positions and records are tuples in memory
+
+def encode_highlight(highlight: tuple) -> list:
+    return [list(highlight[0]), list(highlight[1])] + list(highlight[2:])
+
+
+def decode_highlight(data: list) -> tuple:
+    return (tuple(data[0]), tuple(data[1])) + tuple(data[2:])
+
+
+def encode_highlights(highlights: dict) -> list:
+    return [[page_num, [encode_highlight(h) for h in items]]
+            for page_num, items in highlights.items()]
+
+
+def decode_highlights(data: list) -> dict:
+    return {page_num: [decode_highlight(h) for h in items] for page_num, items in data}
+
+
+def decode_mark(data: list) -> tuple:
+    return tuple(data)
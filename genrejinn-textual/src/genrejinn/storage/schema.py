@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Schema versions and one-time upgraders for stored annotations.
+
+Every store is stamped with the schema version of the data it holds. A
+store older than ``CURRENT_VERSIONS`` is passed through the registered
+upgraders once, and the caller writes the result back, so loading
+current data never walks the records.
+"""
+
+import time
+from collections import namedtuple
+
+
+# Highlights: 1 may hold (start_pos, end_pos, text, note) tuples without a
+# color; 2 always holds (start_pos, end_pos, text, note, color).
+CURRENT_VERSIONS = {'highlights': 2, 'marks': 1, 'current_page': 1}
+
+# Pickle stores were never stamped
+LEGACY_VERSION = 1
+
+# Binary stores written before the header carried a schema byte (read as 0)
+# only ever held data in these versions
+PRE_STAMP_VERSIONS = {'highlights': 2, 'marks': 1, 'current_page': 1}
+
+BRACKET_CHARS = '[]{}()<>«»⟨⟩|'
+
+MigrationStep = namedtuple('MigrationStep', 'kind from_version to_version records seconds')
+
+_UPGRADERS = {}  # {(kind, from_version): func}
+
+
+def upgrader(kind: str, from_version: int):
+    """Register a function that upgrades a store from one version to the next."""
+    def register(func):
+        _UPGRADERS[(kind, from_version)] = func
+        return func
+    return register
+
+
+def stamped_version(kind: str, stamp: int) -> int:
+    """Schema version of a binary store given the byte in its header."""
+    return stamp or PRE_STAMP_VERSIONS[kind]
+
+
+def needs_upgrade(kind: str, version: int) -> bool:
+    return version < CURRENT_VERSIONS[kind]
+
+
+def _record_count(data) -> int:
+    if isinstance(data, dict):
+        return sum(len(items) for items in data.values())
+    if isinstance(data, list):
+        return len(data)
+    return 1
+
+
+def migrate(kind: str, data, version: int, **options) -> tuple:
+    """Run upgraders until data reaches the current version.
+
+    Returns (data, steps), with one MigrationStep per upgrader run. Options
+    are passed to every upgrader.
+    """
+    target = CURRENT_VERSIONS[kind]
+    if version > target:
+        raise ValueError(f"{kind} store has schema version {version}, newer than {target}")
+
+    steps = []
+    while version < target:
+        func = _UPGRADERS.get((kind, version))
+        if func is None:
+            raise ValueError(f"No upgrader for {kind} schema version {version}")
+        start = time.perf_counter()
+        data = func(data, **options)
+        steps.append(MigrationStep(kind, version, version + 1, _record_count(data),
+                                   time.perf_counter() - start))
+        version += 1
+    return data, steps
+
+
+def format_report(steps: list) -> str:
+    """Describe the migration steps that ran and how long each took."""
+    if not steps:
+        return "No migrations needed"
+    lines = [
+        f"{step.kind}: schema {step.from_version} -> {step.to_version}, "
+        f"{step.records} records in {step.seconds * 1000:.1f} ms"
+        for step in steps
+    ]
+    total = sum(step.seconds for step in steps)
+    lines.append(f"{len(steps)} migration(s) in {total * 1000:.1f} ms")
+    return "\n".join(lines)
+
+
+# Upgraders
+
+def _wrap_yellow(text: str, yellow_brackets: tuple) -> str:
+    """Make sure highlight text carries the yellow brackets."""
+    open_bracket, close_bracket = yellow_brackets
+    if text.startswith(open_bracket) and text.endswith(close_bracket):
+        return text
+    if text.startswith('[') and text.endswith(']'):
+        # Single yellow brackets where double ones are expected
+        clean_text = text[1:-1]
+    else:
+        clean_text = text.strip(BRACKET_CHARS)
+    return f"{open_bracket}{clean_text}{close_bracket}"
+
+
+@upgrader('highlights', 1)
+def add_highlight_colors(highlights: dict, yellow_brackets: tuple = ('[', ']'), **options) -> dict:
+    """Give 4-field highlights the default yellow color and brackets.
+
+    The package marks yellow with ``[ ]``; ``epub_parser.py`` passes
+    ``yellow_brackets=('[[', ']]')``.
+    """
+    for page_num, page_highlights in highlights.items():
+        updated_highlights = []
+        for highlight in page_highlights:
+            if len(highlight) == 4:
+                start_pos, end_pos, text, note = highlight
+                highlight = (start_pos, end_pos, _wrap_yellow(text, yellow_brackets), note, "yellow")
+            updated_highlights.append(highlight)
+        highlights[page_num] = updated_highlights
+    return highlights
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Highlights stored as one small JSON file per page or group of pages."""
+
+import json
+import os
+from pathlib import Path
+
+from .atomic import atomic_json_dump
+from .backend import highlight_key
+from .binary_backend import BinaryBackend
+from .blobs import NoteBlobStore, NoteRef
+from .legacy import legacy_pickle_allowed, load_legacy_pickle
+from .locking import file_version
+from .metrics import metrics
+from .protocol import decode_highlight, encode_highlight
+from ..utils.debug import debug_log
+
+
+MANIFEST_VERSION = 2
+
+
+class ShardedBackend(BinaryBackend):
+    """Split highlights into per-page shards under ``data/highlights/``.
+
+    ``manifest.json`` records which shards exist and how many highlights each
+    holds. Only the manifest is read at startup; a shard is read the first
+    time one of its pages is needed, and an edit rewrites just that shard
+    plus the manifest. Marks and the reading position stay in their usual
+    binary files.
+
+    With ``lazy_notes`` the shards hold a ``NoteRef`` (length and flags) in
+    place of each note, and the bodies live in ``notes.blob``; they are read
+    through ``resolve_note`` when a note is shown or edited.
+
+    Other processes are noticed through the manifest, which every write
+    replaces: a changed manifest drops the loaded shards and makes the
+    note store pick up appended bodies.
+
+    Earlier versions pickled the manifest and shards (``*.pkl``); those are
+    rewritten as JSON on first open, except in server mode, which never
+    unpickles.
+    """
+
+    name = "sharded"
+
+    def __init__(self, data_dir: str = "data", pages_per_shard: int = 1,
+                 lazy_notes: bool = True, conflict_policy: str = "merge"):
+        super().__init__(data_dir, conflict_policy)
+        self.shard_dir = Path(data_dir) / "highlights"
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.shard_dir / "manifest.json"
+        self.pages_per_shard = pages_per_shard
+        self.notes = NoteBlobStore(self.shard_dir / "notes.blob") if lazy_notes else None
+
+        self._shards = {}  # {shard_id: {page: [highlight, ...]}} for shards read so far
+        self.manifest = self._load_manifest()
+        self._convert_legacy()
+
+    def _load_manifest(self) -> dict:
+        manifest = {'version': MANIFEST_VERSION, 'pages_per_shard': self.pages_per_shard,
+                    'shards': {}}
+        self._versions['highlights'] = file_version(self.manifest_path)
+        if self.manifest_path.exists():
+            try:
+                with open(self.manifest_path, 'rb') as f:
+                    manifest = _decode_manifest(json.load(f))
+                # Keep the layout the shards were written with
+                self.pages_per_shard = manifest.get('pages_per_shard', self.pages_per_shard)
+                debug_log(f"Loaded highlight manifest with {len(manifest['shards'])} shards")
+            except Exception as e:
+                debug_log(f"Error loading highlight manifest: {e}")
+        return manifest
+
+    def _convert_legacy(self) -> None:
+        """Rewrite a pickled manifest and shards from an earlier version as JSON."""
+        legacy_manifest = self.shard_dir / "manifest.pkl"
+        if self.manifest_path.exists() or not legacy_manifest.exists():
+            return
+        if not legacy_pickle_allowed():
+            debug_log(f"Refusing to unpickle the old highlight shards in {self.shard_dir} "
+                      f"in server mode; open them once outside server mode to convert them")
+            return
+        with self._writing('highlights'):
+            if self.manifest_path.exists():
+                # Another process converted them first
+                self.manifest = self._load_manifest()
+                return
+            try:
+                manifest = load_legacy_pickle(str(legacy_manifest))
+                self.pages_per_shard = manifest.get('pages_per_shard', self.pages_per_shard)
+                self.manifest['pages_per_shard'] = self.pages_per_shard
+                self._shards = {
+                    shard_id: load_legacy_pickle(str(self.shard_dir / f"shard_{shard_id:05d}.pkl")) or {}
+                    for shard_id in manifest['shards']
+                }
+            except Exception as e:
+                debug_log(f"Error loading old highlight shards: {e}")
+                self._shards = {}
+                return
+            self._write_shards(list(self._shards))
+            if not self.manifest_path.exists():
+                return
+            for path in self.shard_dir.glob("*.pkl"):
+                os.remove(path)
+            debug_log(f"Converted {len(self._shards)} old highlight shards to JSON")
+
+    # Cross-process consistency
+
+    def _store_path(self, store: str) -> str:
+        if store == 'highlights':
+            return str(self.manifest_path)
+        return super()._store_path(store)
+
+    def _forget(self, store: str):
+        if store != 'highlights':
+            return super()._forget(store)
+        old, self._shards = self._shards, {}
+        self.manifest = self._load_manifest()
+        if self.notes is not None:
+            self.notes.refresh()
+        return old
+
+    def _old_page(self, view, page_num: int):
+        if view is None or self._shard_id(page_num) not in view:
+            return None
+        return view[self._shard_id(page_num)].get(page_num, [])
+
+    def _shard_id(self, page_num: int) -> int:
+        return page_num // self.pages_per_shard
+
+    def _shard_path(self, shard_id: int) -> Path:
+        return self.shard_dir / f"shard_{shard_id:05d}.json"
+
+    def _shard(self, shard_id: int) -> dict:
+        """Return a shard, reading it from disk on first use."""
+        if shard_id not in self._shards:
+            pages = {}
+            if shard_id in self.manifest['shards']:
+                try:
+                    with open(self._shard_path(shard_id), 'rb') as f:
+                        pages = _decode_shard(json.load(f))
+                except Exception as e:
+                    debug_log(f"Error loading highlight shard {shard_id}: {e}")
+            self._shards[shard_id] = pages
+        return self._shards[shard_id]
+
+    def _write_shards(self, shard_ids) -> None:
+        """Rewrite the given shards, then the manifest."""
+        try:
+            for shard_id in shard_ids:
+                pages = self._shards.get(shard_id, {})
+                path = self._shard_path(shard_id)
+                if pages:
+                    size = atomic_json_dump(_encode_shard(pages), path)
+                    metrics.add_bytes('sharded', size)
+                    self.manifest['shards'][shard_id] = {
+                        'pages': sorted(pages),
+                        'count': sum(len(items) for items in pages.values()),
+                        'size': size,
+                    }
+                else:
+                    self.manifest['shards'].pop(shard_id, None)
+                    if path.exists():
+                        os.remove(path)
+            metrics.add_bytes('sharded', atomic_json_dump(_encode_manifest(self.manifest),
+                                                          self.manifest_path))
+        except Exception as e:
+            metrics.increment('sharded.write_shards.errors')
+            debug_log(f"Error saving highlight shards: {e}")
+
+    @staticmethod
+    def _note_key(page_num: int, highlight: tuple) -> str:
+        row, col = highlight[0]
+        return f"{page_num}:{row}:{col}"
+
+    def _detach_note(self, page_num: int, highlight: tuple) -> tuple:
+        """Move a highlight's note body into the blob store, leaving a NoteRef."""
+        if self.notes is None:
+            return self.resolve_highlight(highlight)
+        note = highlight[3] if len(highlight) > 3 else ""
+        if isinstance(note, NoteRef):
+            return highlight
+        key = self._note_key(page_num, highlight)
+        if note:
+            ref = self.notes.put(key, note)
+        else:
+            self.notes.delete(key)
+            ref = NoteRef(key, 0, 0)
+        return tuple(highlight[:3]) + (ref,) + tuple(highlight[4:])
+
+    def resolve_note(self, note) -> str:
+        if isinstance(note, NoteRef):
+            return self.notes.get(note.key) if note and self.notes is not None else ""
+        return note or ""
+
+    def load_highlights(self) -> dict:
+        with self._lock:
+            self._refresh('highlights')
+            highlights = {}
+            for shard_id in sorted(self.manifest['shards']):
+                for page_num, items in self._shard(shard_id).items():
+                    highlights[page_num] = list(items)
+            return highlights
+
+    def load_page_highlights(self, page_num: int) -> list:
+        with self._lock:
+            self._refresh('highlights')
+            return list(self._shard(self._shard_id(page_num)).get(page_num, []))
+
+    def save_highlights(self, highlights: dict) -> None:
+        with self._writing('highlights') as stale:
+            if stale is not None:
+                self._check_conflicts('highlights', [('all', 'seen', 'replaced')])
+            old_ids = set(self.manifest['shards'])
+            self._shards = {}
+            for page_num, items in highlights.items():
+                if items:
+                    shard = self._shards.setdefault(self._shard_id(page_num), {})
+                    shard[page_num] = [self._detach_note(page_num, h) for h in items]
+            if self.notes is not None:
+                live = {self._note_key(page_num, h)
+                        for shard in self._shards.values()
+                        for page_num, items in shard.items() for h in items}
+                for key in set(self.notes.index) - live:
+                    self.notes.delete(key)
+                self.notes.compact()
+            self._write_shards(old_ids | set(self._shards))
+            debug_log(f"Saved {len(highlights)} pages of highlights into {len(self._shards)} shards")
+
+    def upsert_highlights(self, items) -> None:
+        items = list(items)
+        with self._writing('highlights') as stale:
+            self._check_conflicts('highlights', self._shard_changes(
+                stale, [(page_num, highlight[0]) for page_num, highlight in items]))
+            touched = set()
+            for page_num, highlight in items:
+                shard_id = self._shard_id(page_num)
+                shard = self._shard(shard_id)
+                key = highlight_key(page_num, highlight)
+                page_highlights = [
+                    h for h in shard.get(page_num, []) if highlight_key(page_num, h) != key
+                ]
+                page_highlights.append(self._detach_note(page_num, highlight))
+                shard[page_num] = page_highlights
+                touched.add(shard_id)
+            self._write_shards(touched)
+
+    def delete_highlight(self, page_num: int, start_pos: tuple) -> bool:
+        with self._writing('highlights') as stale:
+            self._check_conflicts('highlights', self._shard_changes(stale, [(page_num, start_pos)]))
+            shard_id = self._shard_id(page_num)
+            shard = self._shard(shard_id)
+            page_highlights = shard.get(page_num, [])
+            remaining = [h for h in page_highlights if tuple(h[0]) != tuple(start_pos)]
+            if len(remaining) == len(page_highlights):
+                return False
+            if remaining:
+                shard[page_num] = remaining
+            else:
+                del shard[page_num]
+            self._write_shards([shard_id])
+            if self.notes is not None:
+                self.notes.delete(self._note_key(page_num, (start_pos,)))
+            return True
+
+    def _shard_changes(self, stale, items) -> list:
+        current = {page_num: self._shard(self._shard_id(page_num)).get(page_num, [])
+                   for page_num, _ in items if stale is not None}
+        return self._highlight_changes(stale, items, current)
+
+    def get_storage_info(self) -> dict:
+        info = super().get_storage_info()
+        with self._lock:
+            shards = self.manifest['shards'].values()
+            info['highlights'] = {
+                'exists': self.manifest_path.exists(),
+                'shards': len(self.manifest['shards']),
+                'loaded_shards': len(self._shards),
+                'count': sum(shard['count'] for shard in shards),
+                'size': sum(shard['size'] for shard in shards),
+                'path': str(self.shard_dir),
+            }
+            if self.notes is not None:
+                info['notes'] = self.notes.get_storage_info()
+        return info
+
+    def close(self) -> None:
+        with self._lock:
+            if self.notes is not None:
+                self.notes.close()
+
+
+# Shards and the manifest as JSON. A note kept in the blob store is a
+# NoteRef, which encodes as a [key, length, flags] list where a note body
+# would be a string.
+
+def _encode_shard(pages: dict) -> list:
+    return [[page_num, [encode_highlight(h) for h in items]] for page_num, items in pages.items()]
+
+
+def _decode_shard_highlight(data: list) -> tuple:
+    highlight = decode_highlight(data)
+    if len(highlight) > 3 and isinstance(highlight[3], list):
+        highlight = highlight[:3] + (NoteRef(*highlight[3]),) + highlight[4:]
+    return highlight
+
+
+def _decode_shard(data: list) -> dict:
+    return {page_num: [_decode_shard_highlight(h) for h in items] for page_num, items in data}
+
+
+def _encode_manifest(manifest: dict) -> dict:
+    return dict(manifest, version=MANIFEST_VERSION,
+                shards=[[shard_id, info] for shard_id, info in manifest['shards'].items()])
+
+
+def _decode_manifest(data: dict) -> dict:
+    return dict(data, shards={shard_id: info for shard_id, info in data['shards']})
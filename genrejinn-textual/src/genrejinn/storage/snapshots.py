@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Deduplicated snapshots of the annotation stores."""
+
+import hashlib
+import io
+import json
+import os
+import secrets
+import struct
+import time
+import zlib
+from pathlib import Path
+
+from . import binary
+from .atomic import atomic_write
+from .backend import mark_key
+from .metrics import metrics
+from ..utils.debug import debug_log
+
+
+MANIFEST_VERSION = 1
+
+# Average marks per block (a power of two). Marks are sorted by position and a
+# block ends after a mark whose key hashes to a multiple of this, so boundaries
+# move with the marks and adding or deleting one rewrites only its own block
+MARKS_PER_BLOCK = 256
+MAX_MARKS_PER_BLOCK = 4 * MARKS_PER_BLOCK
+
+# Average block digests per list block in a manifest, cut the same way on the digests
+DIGESTS_PER_LIST = 512
+MAX_DIGESTS_PER_LIST = 4 * DIGESTS_PER_LIST
+
+MARK_KEY = struct.Struct("<iiid")
+
+
+def _mark_boundary(mark: tuple) -> bool:
+    """Whether a block of sorted marks ends after this mark; the same in every process."""
+    page_num, row, col, timestamp = mark_key(mark)
+    return not zlib.crc32(MARK_KEY.pack(page_num, row, col, float(timestamp))) & (MARKS_PER_BLOCK - 1)
+
+
+def _digest_boundary(digest: str) -> bool:
+    return not int(digest[:8], 16) & (DIGESTS_PER_LIST - 1)
+
+
+def _content_chunks(items, is_boundary, limit: int):
+    """Split items into lists that end where ``is_boundary`` holds, or at ``limit`` items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if is_boundary(item) or len(chunk) >= limit:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class SnapshotStore:
+    """Keep snapshots as manifests over content-addressed blocks.
+
+    Stores are cut into blocks along record boundaries: one block per page
+    of highlights, sorted marks in batches of about ``MARKS_PER_BLOCK`` that
+    end at marks chosen by a hash of their key, and the reading position on
+    its own. Blocks are identified by the SHA-256 of their contents and
+    stored once. The blocks a snapshot adds go into one compressed pack
+    file in ``packs/``, with a small JSON index beside it. A snapshot is a
+    JSON manifest in ``snapshots/``. The digest list of each store is
+    itself kept as list blocks of about ``DIGESTS_PER_LIST`` digests, cut
+    the same way, so the manifest stays small and a new snapshot only
+    costs the pages, mark batches and list blocks that changed.
+    """
+
+    def __init__(self, root: str = "data/backups"):
+        self.root = Path(root)
+        self.pack_dir = self.root / "packs"
+        self.snapshot_dir = self.root / "snapshots"
+        self.pack_dir.mkdir(parents=True, exist_ok=True)
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        self._index = self._load_index()  # {digest: (pack_id, offset, length)}
+
+    # Blocks
+
+    def _load_index(self) -> dict:
+        index = {}
+        for path in self.pack_dir.glob("*.idx"):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for digest, offset, length in json.load(f):
+                        index[digest] = (path.stem, offset, length)
+            except Exception as e:
+                debug_log(f"Error reading pack index {path}: {e}")
+        return index
+
+    def _write_pack(self, blocks: dict) -> int:
+        """Write {digest: data} as a new pack, return its size on disk."""
+        if not blocks:
+            return 0
+        pack_id = secrets.token_hex(8)
+        buffer = io.BytesIO()
+        entries = []
+        for digest, data in blocks.items():
+            compressed = zlib.compress(data)
+            entries.append((digest, buffer.tell(), len(compressed)))
+            buffer.write(compressed)
+        # Pack first, then its index, so an index never points at missing data
+        atomic_write(self.pack_dir / f"{pack_id}.pack", buffer.getvalue())
+        atomic_write(self.pack_dir / f"{pack_id}.idx", json.dumps(entries).encode('utf-8'))
+        for digest, offset, length in entries:
+            self._index[digest] = (pack_id, offset, length)
+        return buffer.tell()
+
+    def _get_block(self, digest: str, packs: dict = None) -> bytes:
+        pack_id, offset, length = self._index[digest]
+        if packs is not None and pack_id in packs:
+            f = packs[pack_id]
+        else:
+            f = open(self.pack_dir / f"{pack_id}.pack", 'rb')
+            if packs is not None:
+                packs[pack_id] = f
+        try:
+            f.seek(offset)
+            data = zlib.decompress(f.read(length))
+        finally:
+            if packs is None:
+                f.close()
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Snapshot block {digest} is corrupt")
+        return data
+
+    # Record-aware chunking
+
+    @staticmethod
+    def _highlight_blocks(highlights: dict):
+        for page_num in sorted(highlights):
+            if highlights[page_num]:
+                yield binary.dumps(binary.write_highlights, {page_num: highlights[page_num]})
+
+    @staticmethod
+    def _mark_blocks(marks: list):
+        for chunk in _content_chunks(sorted(marks, key=mark_key), _mark_boundary, MAX_MARKS_PER_BLOCK):
+            yield binary.dumps(binary.write_marks, chunk)
+
+    # Snapshots
+
+    @metrics.instrument('snapshots.create')
+    def create_snapshot(self, highlights: dict = None, marks: list = None,
+                        current_page: int = None, label: str = None) -> dict:
+        """Snapshot whichever stores are given, return the manifest."""
+        start = time.perf_counter()
+        sources = {
+            'highlights': self._highlight_blocks(highlights) if highlights is not None else None,
+            'marks': self._mark_blocks(marks) if marks is not None else None,
+            'current_page': (iter([binary.dumps(binary.write_page_state, current_page)])
+                             if current_page is not None else None),
+        }
+
+        stores = {}
+        new_blocks = {}
+
+        def add_block(data: bytes) -> str:
+            digest = hashlib.sha256(data).hexdigest()
+            if digest not in self._index:
+                new_blocks[digest] = data
+            return digest
+
+        for name, blocks in sources.items():
+            if blocks is None:
+                continue
+            digests, size = [], 0
+            for data in blocks:
+                digests.append(add_block(data))
+                size += len(data)
+            lists = [
+                add_block(bytes.fromhex("".join(chunk)))
+                for chunk in _content_chunks(digests, _digest_boundary, MAX_DIGESTS_PER_LIST)
+            ]
+            stores[name] = {'lists': lists, 'blocks': len(digests), 'size': size}
+        written = self._write_pack(new_blocks)
+        metrics.add_bytes('snapshots', written)
+
+        created = time.time()
+        snapshot_id = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(created))}-{secrets.token_hex(3)}"
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'id': snapshot_id,
+            'created': created,
+            'label': label,
+            'stores': stores,
+            'written': written,
+        }
+        atomic_write(self.snapshot_dir / f"{snapshot_id}.json",
+                     json.dumps(manifest, indent=1).encode('utf-8'))
+        debug_log(f"Created snapshot {snapshot_id}: {written} new bytes "
+                  f"in {time.perf_counter() - start:.3f}s")
+        return manifest
+
+    def load_manifest(self, snapshot_id: str) -> dict:
+        with open(self.snapshot_dir / f"{snapshot_id}.json", 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def list_snapshots(self) -> list:
+        """Manifests of every snapshot, oldest first."""
+        manifests = []
+        for path in sorted(self.snapshot_dir.glob("*.json")):
+            try:
+                manifests.append(self.load_manifest(path.stem))
+            except Exception as e:
+                debug_log(f"Error reading snapshot manifest {path}: {e}")
+        return sorted(manifests, key=lambda manifest: manifest['created'])
+
+    def _expand(self, store: dict, packs: dict = None) -> list:
+        """Block digests of a store in a manifest, read from its list blocks."""
+        digests = []
+        for list_digest in store['lists']:
+            data = self._get_block(list_digest, packs)
+            digests.extend(data[start:start + 32].hex() for start in range(0, len(data), 32))
+        return digests
+
+    @metrics.instrument('snapshots.restore')
+    def restore_snapshot(self, snapshot_id: str) -> dict:
+        """Rebuild the stores saved in a snapshot.
+
+        Returns a dict with whichever of 'highlights', 'marks' and
+        'current_page' the snapshot holds.
+        """
+        stores = self.load_manifest(snapshot_id)['stores']
+        restored = {}
+        packs = {}
+        try:
+            if 'highlights' in stores:
+                highlights = {}
+                for digest in self._expand(stores['highlights'], packs):
+                    block = self._get_block(digest, packs)
+                    highlights.update(binary.read_highlights(io.BytesIO(block)))
+                restored['highlights'] = highlights
+            if 'marks' in stores:
+                marks = []
+                for digest in self._expand(stores['marks'], packs):
+                    marks.extend(binary.read_marks(io.BytesIO(self._get_block(digest, packs))))
+                restored['marks'] = marks
+            if 'current_page' in stores:
+                digest, = self._expand(stores['current_page'], packs)
+                block = self._get_block(digest, packs)
+                restored['current_page'] = binary.read_page_state(io.BytesIO(block))
+        finally:
+            for f in packs.values():
+                f.close()
+        return restored
+
+    def prune(self, keep_last: int = None, older_than: float = None,
+              repack_below: float = 0.5) -> dict:
+        """Delete snapshots, then any blocks no remaining snapshot uses.
+
+        Snapshots are removed if they fall outside the newest ``keep_last``
+        or were created more than ``older_than`` seconds ago. The newest
+        snapshot is always kept. Packs with no live blocks are deleted, and
+        packs whose live share drops below ``repack_below`` are rewritten.
+        Pruning must not run while a snapshot is being created.
+        """
+        manifests = self.list_snapshots()
+        now = time.time()
+        removed = []
+        for index, manifest in enumerate(manifests[:-1]):
+            too_many = keep_last is not None and index < len(manifests) - max(keep_last, 1)
+            too_old = older_than is not None and now - manifest['created'] > older_than
+            if too_many or too_old:
+                os.remove(self.snapshot_dir / f"{manifest['id']}.json")
+                removed.append(manifest['id'])
+
+        live = set()
+        for manifest in self.list_snapshots():
+            for store in manifest['stores'].values():
+                live.update(store['lists'])
+                live.update(self._expand(store))
+        freed = self._sweep(live, repack_below)
+
+        debug_log(f"Pruned {len(removed)} snapshots, freed {freed} bytes")
+        return {'removed': removed, 'freed': freed}
+
+    def _sweep(self, live: set, repack_below: float) -> int:
+        """Drop or repack packs holding dead blocks, return bytes freed."""
+        packs = {}
+        for digest, (pack_id, _, length) in self._index.items():
+            pack = packs.setdefault(pack_id, {'live': [], 'live_bytes': 0, 'bytes': 0})
+            pack['bytes'] += length
+            if digest in live:
+                pack['live'].append(digest)
+                pack['live_bytes'] += length
+
+        freed = 0
+        for pack_id, pack in packs.items():
+            if pack['live_bytes'] == pack['bytes']:
+                continue
+            if pack['live'] and pack['live_bytes'] >= pack['bytes'] * repack_below:
+                continue
+            pack_path = self.pack_dir / f"{pack_id}.pack"
+            size = pack_path.stat().st_size
+            survivors = {digest: self._get_block(digest) for digest in pack['live']}
+            new_size = self._write_pack(survivors)
+            for digest, (owner, _, _) in list(self._index.items()):
+                if owner == pack_id:
+                    del self._index[digest]
+            (self.pack_dir / f"{pack_id}.idx").unlink()
+            pack_path.unlink()
+            freed += size - new_size
+        return freed
+
+    def get_storage_info(self) -> dict:
+        packs = list(self.pack_dir.glob("*.pack"))
+        return {
+            'snapshots': len(list(self.snapshot_dir.glob("*.json"))),
+            'blocks': len(self._index),
+            'packs': len(packs),
+            'size': sum(path.stat().st_size for path in packs),
+            'path': str(self.root),
+        }
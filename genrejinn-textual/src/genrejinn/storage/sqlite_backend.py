@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""SQLite storage backend with per-record upserts."""
+
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from .backend import StorageBackend, mark_key
+from ..utils.debug import debug_log
+
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS highlights (
+    book_id   TEXT    NOT NULL,
+    page      INTEGER NOT NULL,
+    start_row INTEGER NOT NULL,
+    start_col INTEGER NOT NULL,
+    end_row   INTEGER NOT NULL,
+    end_col   INTEGER NOT NULL,
+    text      TEXT    NOT NULL,
+    note      TEXT    NOT NULL DEFAULT '',
+    color     TEXT    NOT NULL DEFAULT 'yellow',
+    PRIMARY KEY (book_id, page, start_row, start_col)
+);
+CREATE INDEX IF NOT EXISTS idx_highlights_color ON highlights (book_id, color);
+
+CREATE TABLE IF NOT EXISTS marks (
+    book_id   TEXT    NOT NULL,
+    page      INTEGER NOT NULL,
+    start_row INTEGER NOT NULL,
+    start_col INTEGER NOT NULL,
+    timestamp REAL    NOT NULL DEFAULT 0,
+    text      TEXT    NOT NULL,
+    name      TEXT    NOT NULL,
+    PRIMARY KEY (book_id, page, start_row, start_col, timestamp)
+);
+
+CREATE TABLE IF NOT EXISTS reading_state (
+    book_id TEXT PRIMARY KEY,
+    page    INTEGER NOT NULL
+);
+"""
+
+HIGHLIGHT_COLUMNS = "page, start_row, start_col, end_row, end_col, text, note, color"
+
+
+def _highlight_row(book_id: str, page_num: int, highlight: tuple) -> tuple:
+    """Flatten a highlight tuple into a table row."""
+    if len(highlight) == 4:
+        start_pos, end_pos, text, note = highlight
+        color = "yellow"
+    else:
+        start_pos, end_pos, text, note, color = highlight
+    return (book_id, page_num, start_pos[0], start_pos[1], end_pos[0], end_pos[1],
+            text, note or "", color)
+
+
+def _row_highlight(row: tuple) -> tuple:
+    """Rebuild the (page, highlight) pair from a table row."""
+    page, start_row, start_col, end_row, end_col, text, note, color = row
+    return page, ((start_row, start_col), (end_row, end_col), text, note, color)
+
+
+def _mark_row(book_id: str, mark: tuple) -> tuple:
+    """Flatten a mark tuple into a table row."""
+    page_num, start_row, start_col, selected_text, mark_name = mark[:5]
+    timestamp = mark[5] if len(mark) >= 6 else 0
+    return (book_id, page_num, start_row, start_col, timestamp, selected_text, str(mark_name))
+
+
+class SQLiteBackend(StorageBackend):
+    """Store annotations as indexed rows in a WAL-mode SQLite database.
+
+    Every edit touches a single row, and pages can be loaded on their own.
+    Each thread gets its own connection, so background saves and UI reads
+    can run side by side under WAL.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str = None, book_id: str = "default"):
+        self.db_path = db_path or "data/annotations.db"
+        self.book_id = book_id
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        debug_log(f"Opened SQLite annotation store: {self.db_path}")
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The calling thread's connection, opened on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Wait for other processes' write transactions instead of failing
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def load_highlights(self) -> dict:
+        highlights = {}
+        for page_num, highlight in self.iter_highlights():
+            highlights.setdefault(page_num, []).append(highlight)
+        return highlights
+
+    def load_page_highlights(self, page_num: int) -> list:
+        rows = self.conn.execute(
+            f"SELECT {HIGHLIGHT_COLUMNS} FROM highlights "
+            "WHERE book_id = ? AND page = ? ORDER BY start_row, start_col",
+            (self.book_id, page_num)
+        )
+        return [_row_highlight(row)[1] for row in rows]
+
+    def iter_highlights(self):
+        rows = self.conn.execute(
+            f"SELECT {HIGHLIGHT_COLUMNS} FROM highlights "
+            "WHERE book_id = ? ORDER BY page, start_row, start_col",
+            (self.book_id,)
+        )
+        for row in rows:
+            yield _row_highlight(row)
+
+    def save_highlights(self, highlights: dict) -> None:
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM highlights WHERE book_id = ?", (self.book_id,))
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO highlights VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (_highlight_row(self.book_id, page_num, highlight)
+                     for page_num, page_highlights in highlights.items()
+                     for highlight in page_highlights)
+                )
+            debug_log(f"Saved {len(highlights)} pages of highlights to SQLite")
+        except sqlite3.Error as e:
+            debug_log(f"Error saving highlights: {e}")
+
+    def upsert_highlight(self, page_num: int, highlight: tuple) -> None:
+        try:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO highlights VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    _highlight_row(self.book_id, page_num, highlight)
+                )
+        except sqlite3.Error as e:
+            debug_log(f"Error saving highlight: {e}")
+
+    def upsert_highlights(self, items) -> None:
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO highlights VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (_highlight_row(self.book_id, page_num, highlight)
+                     for page_num, highlight in items)
+                )
+        except sqlite3.Error as e:
+            debug_log(f"Error saving highlights: {e}")
+
+    def delete_highlight(self, page_num: int, start_pos: tuple) -> bool:
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM highlights "
+                "WHERE book_id = ? AND page = ? AND start_row = ? AND start_col = ?",
+                (self.book_id, page_num, start_pos[0], start_pos[1])
+            )
+        return cursor.rowcount > 0
+
+    def load_marks(self) -> list:
+        rows = self.conn.execute(
+            "SELECT page, start_row, start_col, text, name, timestamp FROM marks "
+            "WHERE book_id = ? ORDER BY page, start_row, start_col, timestamp",
+            (self.book_id,)
+        )
+        return [tuple(row) for row in rows]
+
+    def save_marks(self, marks: list) -> None:
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM marks WHERE book_id = ?", (self.book_id,))
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO marks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (_mark_row(self.book_id, mark) for mark in marks)
+                )
+            debug_log(f"Saved {len(marks)} marks to SQLite")
+        except sqlite3.Error as e:
+            debug_log(f"Error saving marks: {e}")
+
+    def upsert_mark(self, mark: tuple) -> None:
+        try:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO marks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    _mark_row(self.book_id, mark)
+                )
+        except sqlite3.Error as e:
+            debug_log(f"Error saving mark: {e}")
+
+    def delete_mark(self, mark: tuple) -> bool:
+        page_num, start_row, start_col, timestamp = mark_key(mark)
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM marks WHERE book_id = ? AND page = ? AND start_row = ? "
+                "AND start_col = ? AND timestamp = ?",
+                (self.book_id, page_num, start_row, start_col, timestamp)
+            )
+        return cursor.rowcount > 0
+
+    def load_current_page(self, total_pages: int) -> int:
+        row = self.conn.execute(
+            "SELECT page FROM reading_state WHERE book_id = ?", (self.book_id,)
+        ).fetchone()
+        if row is None:
+            debug_log("No saved page found, starting at page 0")
+            return 0
+        saved_page = row[0]
+        if 0 <= saved_page < total_pages:
+            debug_log(f"Found saved page: {saved_page}")
+            return saved_page
+        debug_log(f"Saved page {saved_page} out of bounds, starting at page 0")
+        return 0
+
+    def save_current_page(self, current_page: int) -> None:
+        try:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO reading_state VALUES (?, ?)",
+                    (self.book_id, current_page)
+                )
+        except sqlite3.Error as e:
+            debug_log(f"Error saving current page: {e}")
+
+    def get_storage_info(self) -> dict:
+        exists = os.path.exists(self.db_path)
+        info = {
+            'backend': self.name,
+            'exists': exists,
+            'size': os.path.getsize(self.db_path) if exists else 0,
+            'modified': os.path.getmtime(self.db_path) if exists else None,
+            'path': self.db_path,
+        }
+        for table in ("highlights", "marks"):
+            info[table] = self.conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE book_id = ?", (self.book_id,)
+            ).fetchone()[0]
+        return info
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
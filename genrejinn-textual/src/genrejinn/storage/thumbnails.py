@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Note image thumbnails sized for the notes panel."""
+
+import hashlib
+import io
+import os
+from pathlib import Path
+
+from .atomic import atomic_write
+from .metrics import metrics
+from ..utils.debug import debug_log
+
+# Pillow is optional; without it images are shown at full size
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+# Terminal cell size in pixels when the terminal cannot tell us
+DEFAULT_CELL_PIXELS = (10, 20)
+
+# Image pixels drawn per terminal cell by the text-based renderers
+TEXT_PROTOCOL_PIXELS = {
+    'halfcell': (1, 2),
+    'unicode': (2, 4),
+}
+
+# Rows a note image may take up (max-height of .note-image)
+MAX_IMAGE_ROWS = 25
+
+
+def detect_protocol() -> str:
+    """How note images will be drawn: 'sixel', 'tgp', 'halfcell', 'unicode', 'viewer' or 'text'."""
+    try:
+        from textual_image.renderable import Image as Renderable
+        return Renderable.__module__.rsplit('.', 1)[-1]
+    except ImportError:
+        pass
+    try:
+        import textual_imageview  # noqa: F401
+        return 'viewer'
+    except ImportError:
+        return 'text'
+
+
+def detect_cell_pixels() -> tuple:
+    """(width, height) of a terminal cell in pixels."""
+    try:
+        from textual_image._terminal import get_cell_size
+        size = get_cell_size()
+        if size.width > 0 and size.height > 0:
+            return (size.width, size.height)
+    except Exception as e:
+        debug_log(f"Could not read terminal cell size: {e}")
+    return DEFAULT_CELL_PIXELS
+
+
+class ThumbnailCache:
+    """Downscale each image once per (image, width, protocol) and keep the result.
+
+    The notes panel shows images ``width`` cells wide and at most
+    ``MAX_IMAGE_ROWS`` tall. ``thumbnail`` scales an image to the pixels
+    that fill that box for the protocol in use (a cell is a block of real
+    pixels for sixel and the terminal graphics protocol, but only a couple
+    of pixels for the half-cell and unicode renderers) and saves it as a
+    PNG under ``thumbs/``, so redrawing a note reads a small file instead
+    of decoding and resizing the original. Without Pillow the original is
+    used as it is.
+    """
+
+    def __init__(self, thumbs_dir: str, cell_pixels: tuple = None):
+        self.thumbs_dir = Path(thumbs_dir)
+        self.thumbs_dir.mkdir(parents=True, exist_ok=True)
+        self.cell_pixels = cell_pixels or DEFAULT_CELL_PIXELS
+
+    def box(self, width: int, protocol: str) -> tuple:
+        """Largest thumbnail size in pixels for a panel ``width`` cells wide."""
+        cell_width, cell_height = TEXT_PROTOCOL_PIXELS.get(protocol, self.cell_pixels)
+        return (max(1, width) * cell_width, MAX_IMAGE_ROWS * cell_height)
+
+    @staticmethod
+    def image_id(image_path: str) -> str:
+        """Id of an image: its content digest for cached objects, else path, size and mtime."""
+        stem = Path(image_path).stem
+        if len(stem) == 64 and all(c in '0123456789abcdef' for c in stem):
+            return stem
+        stat = os.stat(image_path)
+        return hashlib.sha256(f"{os.path.abspath(image_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+                              .encode('utf-8')).hexdigest()
+
+    def path_for(self, image_path: str, width: int, protocol: str) -> Path:
+        return self.thumbs_dir / f"{self.image_id(image_path)}-{width}-{protocol}.png"
+
+    def lookup(self, image_path: str, width: int, protocol: str) -> str:
+        """Path of an existing thumbnail, or None."""
+        if not PIL_AVAILABLE or protocol == 'text':
+            return image_path
+        path = self.path_for(image_path, width, protocol)
+        return str(path) if path.exists() else None
+
+    @metrics.instrument('images.thumbnail')
+    def thumbnail(self, image_path: str, width: int, protocol: str) -> str:
+        """Path of a thumbnail of ``image_path``, making it if needed."""
+        cached = self.lookup(image_path, width, protocol)
+        if cached:
+            return cached
+        path = self.path_for(image_path, width, protocol)
+        try:
+            with Image.open(image_path) as image:
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail(self.box(width, protocol), Image.LANCZOS)
+                if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                    image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+                buffer = io.BytesIO()
+                image.save(buffer, 'PNG')
+            atomic_write(path, buffer.getvalue())
+            return str(path)
+        except Exception as e:
+            debug_log(f"Could not make thumbnail of {image_path}: {e}")
+            return image_path
+
+    def discard(self, digest: str) -> None:
+        """Delete every thumbnail of an image."""
+        for path in self.thumbs_dir.glob(f"{digest}-*.png"):
+            try:
+                path.unlink()
+            except OSError as e:
+                debug_log(f"Error removing thumbnail {path}: {e}")
+
+    def get_storage_info(self) -> dict:
+        thumbs = list(self.thumbs_dir.glob("*.png"))
+        return {
+            'thumbnails': len(thumbs),
+            'thumbnail_size': sum(p.stat().st_size for p in thumbs),
+        }
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Background persistence worker that coalesces repeated saves."""
+
+import atexit
+import threading
+import time
+
+from ..utils.debug import debug_log
+
+
+class PersistenceWorker:
+    """Run save callbacks off the UI thread, at most once per window per store.
+
+    ``schedule(key, func, *args)`` marks a store dirty. The save runs on the
+    worker thread ``window`` seconds after the store first became dirty; any
+    further schedules for the same key before then just replace the pending
+    call, so a burst of edits becomes one write of the latest state.
+    """
+
+    def __init__(self, window: float = 0.5):
+        self.window = window
+        self._pending = {}  # {key: (deadline, func, args)}
+        self._condition = threading.Condition()
+        self._running = True
+        self._busy = False
+        self._thread = threading.Thread(target=self._run, name="persistence-worker", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def schedule(self, key: str, func, *args) -> None:
+        """Mark a store dirty and queue its save."""
+        with self._condition:
+            if not self._running:
+                # Worker already stopped (e.g. during shutdown): save inline
+                self._call(key, func, args)
+                return
+            deadline = self._pending[key][0] if key in self._pending else (
+                time.monotonic() + self.window
+            )
+            self._pending[key] = (deadline, func, args)
+            self._condition.notify()
+
+    def is_dirty(self, key: str) -> bool:
+        """Whether a save is queued for the given store."""
+        with self._condition:
+            return key in self._pending
+
+    def _call(self, key: str, func, args: tuple) -> None:
+        try:
+            func(*args)
+        except Exception as e:
+            debug_log(f"Error in background save of {key}: {e}")
+
+    def _take_due(self, force: bool = False) -> list:
+        """Remove and return pending saves whose window has passed."""
+        now = time.monotonic()
+        due = [key for key, (deadline, _, _) in self._pending.items() if force or deadline <= now]
+        return [(key,) + self._pending.pop(key)[1:] for key in due]
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                next_deadline = min(deadline for deadline, _, _ in self._pending.values())
+                timeout = next_deadline - time.monotonic()
+                if timeout > 0:
+                    self._condition.wait(timeout)
+                    continue
+                due = self._take_due()
+                self._busy = True
+
+            for key, func, args in due:
+                self._call(key, func, args)
+
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+
+    def flush(self) -> None:
+        """Run every pending save now, on the calling thread."""
+        with self._condition:
+            while self._busy:
+                self._condition.wait()
+            due = self._take_due(force=True)
+        for key, func, args in due:
+            self._call(key, func, args)
+
+    def stop(self) -> None:
+        """Flush pending saves and stop the worker thread."""
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
+        self.flush()
+        debug_log("Persistence worker stopped and flushed")
@@ -0,0 +1,6 @@
+"""Incremental sync between the Textual and React readers' annotation stores."""
+
+from .engine import SyncEngine, record_digest
+from .react import ReactStore
+
+__all__ = ["SyncEngine", "ReactStore", "record_digest"]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Command line entry point for syncing with the React reader."""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+from ..epub.cfi import load_cfi_index
+from ..epub.pagination import EPUBPaginator
+from ..epub.parser import EPUBParser
+from ..storage.config import BACKENDS, create_backend, get_storage_config
+from ..storage.namespace import StorageNamespace
+from ..storage.position import PositionStore
+from .engine import PREFERENCES, SyncEngine
+from .react import ReactStore
+
+
+def default_epub_path() -> str:
+    """First EPUB in the current directory, as the reader picks it, else the parser default."""
+    epub_files = sorted(Path(".").glob("*.epub"))
+    return str(epub_files[0]) if epub_files else EPUBParser().epub_path
+
+
+def parse_sync_arguments(argv: list = None) -> argparse.Namespace:
+    """Parse command line arguments for sync."""
+    config = get_storage_config()
+    react_default = os.environ.get('GENREJINN_REACT_DATA_DIR', '../genrejinn-react/data')
+    parser = argparse.ArgumentParser(description='Sync GenreJinn annotations with the React reader')
+    parser.add_argument('--react-data', default=react_default,
+                        help=f"React reader data directory (default: {react_default})")
+    parser.add_argument('--epub', help='EPUB both readers are reading (default: first *.epub here)')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default=config['backend'],
+                        help=f"Storage backend (default: {config['backend']})")
+    parser.add_argument('--data-dir', default=config['data_dir'],
+                        help=f"Data directory (default: {config['data_dir']})")
+    parser.add_argument('--book-id', default=config['book_id'],
+                        help=f"Book identifier (default: {config['book_id']})")
+    parser.add_argument('--prefer', choices=PREFERENCES, default='textual',
+                        help='Side that wins when both edited a record (default: textual)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Report what would change without writing')
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> int:
+    """Run one incremental sync in both directions."""
+    args = parse_sync_arguments(argv)
+    epub_path = args.epub or default_epub_path()
+    if not os.path.exists(epub_path):
+        print(f"EPUB file not found: {epub_path}", file=sys.stderr)
+        return 1
+
+    config = dict(get_storage_config(), backend=args.backend, data_dir=args.data_dir,
+                  book_id=args.book_id)
+    # The parsed paragraphs and CFI index come from the shared book cache,
+    # built on the first run; annotations stay in the reader's directory
+    namespace = StorageNamespace.from_config(config, epub_path)
+    if config['namespaced']:
+        config = namespace.backend_config(config)
+
+    parser = EPUBParser(epub_path)
+    paragraphs = namespace.cached('paragraphs', parser.load_paragraphs)
+    cfi_index = load_cfi_index(epub_path, namespace)
+    if len(paragraphs) != cfi_index.paragraph_count:
+        print(f"CFI index does not match {epub_path}", file=sys.stderr)
+        return 1
+    paginator = EPUBPaginator()
+    paginator.create_pages(paragraphs)
+
+    backend = create_backend(config)
+    position_store = PositionStore(os.path.join(config['data_dir'], "position.anchor"))
+    try:
+        engine = SyncEngine(backend, ReactStore(args.react_data), cfi_index, paginator,
+                            os.path.join(config['data_dir'], "sync-state.json"),
+                            position_store=position_store, prefer=args.prefer,
+                            dry_run=args.dry_run)
+        report = engine.run()
+    finally:
+        backend.close()
+        position_store.close()
+
+    prefix = "Would sync" if args.dry_run else "Synced"
+    if not report:
+        print("Already in sync")
+    for name, count in sorted(report.items()):
+        print(f"{prefix} {name}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Incremental two-way sync between the Textual stores and the React reader's stores."""
+
+import bisect
+import hashlib
+import json
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from ..export.annotations import clean_highlight_text
+from ..highlighting.colors import ColorManager, parse_highlight_tuple
+from ..storage.atomic import atomic_write
+from ..storage.backend import mark_key
+from ..storage.position import ReadingAnchor
+from ..utils.debug import debug_log
+
+
+SYNC_STATE_VERSION = 1
+PREFERENCES = ('textual', 'react')
+
+# React stores hex colors; the Textual reader stores names
+COLOR_NAMES = {hex_value: name for name, hex_value in ColorManager.COLOR_HEX.items()}
+
+
+def record_digest(record) -> str:
+    """Stable digest of a record's content, for telling whether it changed."""
+    data = json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=list)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:32]
+
+
+def _iso(milliseconds: int) -> str:
+    moment = datetime.fromtimestamp(milliseconds / 1000, tz=timezone.utc)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f"{moment.microsecond // 1000:03d}Z"
+
+
+def _unique_id(prefix: str, milliseconds: int, taken) -> str:
+    while f"{prefix}-{milliseconds}" in taken:
+        milliseconds += 1
+    return f"{prefix}-{milliseconds}"
+
+
+class _HighlightAdapter:
+    """Textual highlights <-> React notes."""
+
+    kind = 'highlights'
+    store = 'notes'
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def key(self, record: tuple) -> tuple:
+        page_num, highlight = record
+        return (page_num,) + tuple(highlight[0])
+
+    def textual_digest(self, record: tuple) -> str:
+        return record_digest(record)
+
+    def to_react(self, record: tuple, existing: dict, record_id: str) -> dict:
+        engine = self.engine
+        page_num, highlight = record
+        start_pos, end_pos, text, note, color = parse_highlight_tuple(highlight)
+        start = engine.paginator.locate(page_num, *start_pos)
+        end = engine.paginator.locate(page_num, *end_pos)
+        now = engine.now_ms()
+        react = dict(existing or {
+            'id': record_id,
+            'type': 'highlight',
+            'markId': engine.parent_mark(start),
+            'timestamp': now,
+            'createdAt': _iso(now),
+        })
+        react.update(text=clean_highlight_text(text, color),
+                     cfiRange=engine.cfi_index.to_range_cfi(start, end),
+                     color=ColorManager.get_hex(color),
+                     noteText=note or "")
+        return react
+
+    def to_textual(self, react: dict, existing: tuple) -> tuple:
+        engine = self.engine
+        start, end = engine.cfi_index.range_positions(react['cfiRange'])
+        page_num, start_row, start_col = engine.paginator.position_of(*start)
+        if engine.paginator.paragraph_to_page(end[0]) != page_num:
+            # A Textual highlight lives on one page
+            end = engine.paginator.page_end(page_num)
+        _, end_row, end_col = engine.paginator.position_of(*end)
+        color = COLOR_NAMES.get(str(react.get('color', '')).lower(), 'yellow')
+        text = ColorManager.wrap_text_with_color(react.get('text', ''), color)
+        return page_num, ((start_row, start_col), (end_row, end_col), text,
+                          react.get('noteText', ''), color)
+
+    def new_id(self, record: tuple, taken) -> str:
+        return _unique_id('note', self.engine.next_id_ms(), taken)
+
+    def write(self, backend, upserts: list, deletes: list) -> None:
+        for page_num, highlight in deletes:
+            backend.delete_highlight(page_num, highlight[0])
+        if upserts:
+            backend.upsert_highlights(upserts)
+
+
+class _MarkAdapter:
+    """Textual marks <-> React marks."""
+
+    kind = 'marks'
+    store = 'marks'
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def key(self, mark: tuple) -> tuple:
+        return mark_key(mark)
+
+    def textual_digest(self, mark: tuple) -> str:
+        return record_digest(mark)
+
+    def to_react(self, mark: tuple, existing: dict, record_id: str) -> dict:
+        engine = self.engine
+        page_num, start_row, start_col, selected_text, mark_name = mark[:5]
+        timestamp = mark[5] if len(mark) >= 6 else 0
+        start = engine.paginator.locate(page_num, start_row, start_col)
+        paragraph_length = engine.cfi_index.paragraph_lengths[start[0]]
+        end = (start[0], min(start[1] + len(selected_text), paragraph_length))
+        milliseconds = int(round(timestamp * 1000))
+        react = dict(existing or {
+            'id': record_id,
+            'markText': '',
+            'timestamp': milliseconds,
+            'createdAt': _iso(milliseconds),
+        })
+        react.update(cfiRange=engine.cfi_index.to_range_cfi(start, end),
+                     text=selected_text, name=mark_name)
+        return react
+
+    def to_textual(self, react: dict, existing: tuple) -> tuple:
+        engine = self.engine
+        start, _ = engine.cfi_index.range_positions(react['cfiRange'])
+        page_num, start_row, start_col = engine.paginator.position_of(*start)
+        timestamp = existing[5] if existing else react.get('timestamp', 0) / 1000
+        return (page_num, start_row, start_col, react.get('text', ''),
+                react.get('name') or "Unnamed Mark", timestamp)
+
+    def new_id(self, mark: tuple, taken) -> str:
+        timestamp = mark[5] if len(mark) >= 6 else 0
+        return _unique_id('mark', int(round(timestamp * 1000)), taken)
+
+    def write(self, backend, upserts: list, deletes: list) -> None:
+        for mark in deletes:
+            backend.delete_mark(mark)
+        for mark in upserts:
+            backend.upsert_mark(mark)
+
+
+class SyncEngine:
+    """Exchange changes between a Textual storage backend and a React data directory.
+
+    Every synced record is remembered in a state file with its React id,
+    its Textual key, a digest of each side's copy and the change id of the
+    run that last wrote it. A run compares current digests with the
+    remembered ones and only writes records that changed on one side:
+    React files are rewritten only when a record in them changed, Textual
+    records are upserted or deleted one by one.
+
+    Conflicts are settled the same way whichever side runs first: an edit
+    beats a deletion, the newer reading position wins, and when both sides
+    edited the same highlight or mark the ``prefer`` side wins.
+    """
+
+    def __init__(self, backend, react_store, cfi_index, paginator, state_path: str,
+                 position_store=None, prefer: str = 'textual', dry_run: bool = False):
+        if prefer not in PREFERENCES:
+            raise ValueError(f"prefer must be one of {', '.join(PREFERENCES)}")
+        self.backend = backend
+        self.react = react_store
+        self.cfi_index = cfi_index
+        self.paginator = paginator
+        self.state_path = Path(state_path)
+        self.position_store = position_store
+        self.prefer = prefer
+        self.dry_run = dry_run
+        self.report = Counter()
+        self._mark_positions = None
+        self._react_marks = []
+        self._last_id_ms = 0
+
+    def now_ms(self) -> int:
+        return int(time.time() * 1000)
+
+    def next_id_ms(self) -> int:
+        """Millisecond stamp for a new React id, increasing within a run like Date.now() ids."""
+        self._last_id_ms = max(self.now_ms(), self._last_id_ms + 1)
+        return self._last_id_ms
+
+    # State
+
+    def load_state(self) -> dict:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('version') == SYNC_STATE_VERSION:
+                return state
+            debug_log(f"Ignoring sync state version {state.get('version')}")
+        except FileNotFoundError:
+            pass
+        return {'version': SYNC_STATE_VERSION, 'change_id': 0,
+                'highlights': {}, 'marks': {}, 'progress': None}
+
+    def save_state(self, state: dict) -> None:
+        atomic_write(self.state_path, json.dumps(state, separators=(',', ':')).encode('utf-8'))
+
+    # Notes belong to the nearest mark before them, as in the React reader
+
+    def parent_mark(self, position: tuple):
+        if self._mark_positions is None:
+            positions = []
+            for mark in self._react_marks:
+                try:
+                    positions.append((self.cfi_index.to_position(mark['cfiRange']), mark['id']))
+                except Exception as e:
+                    debug_log(f"Skipping mark {mark.get('id')} without a position: {e}")
+            positions.sort()
+            self._mark_positions = positions
+        index = bisect.bisect_right(self._mark_positions, (tuple(position), '\uffff')) - 1
+        return self._mark_positions[index][1] if index >= 0 else None
+
+    # Records
+
+    def _reconcile(self, adapter, entries: dict, textual: dict, react: list, change_id: int) -> tuple:
+        """Work out one kind of record; return (new entries, react list, textual writes, changed)."""
+        kind = adapter.kind
+        by_id = {record['id']: record for record in react if 'id' in record}
+        order = [record['id'] for record in react if 'id' in record]
+        # Records without an id cannot be tracked; they are passed through untouched
+        untracked = [record for record in react if 'id' not in record]
+        upserts, deletes = [], []
+        react_changed = False
+        new_entries = {}
+        claimed = set()
+
+        def remember(record_id, record, react_record):
+            new_entries[record_id] = {
+                'textual': list(adapter.key(record)),
+                'textual_digest': adapter.textual_digest(record),
+                'react_digest': record_digest(react_record),
+                'change': change_id,
+            }
+            claimed.add(adapter.key(record))
+
+        def put_textual(record, old=None):
+            if old is not None and adapter.key(old) != adapter.key(record):
+                deletes.append(old)
+            upserts.append(record)
+            self.report[f"{kind}.to_textual"] += 1
+
+        def put_react(record_id, react_record):
+            nonlocal react_changed
+            if record_id not in by_id:
+                order.append(record_id)
+            by_id[record_id] = react_record
+            react_changed = True
+            self.report[f"{kind}.to_react"] += 1
+
+        for record_id, entry in entries.items():
+            key = tuple(entry['textual'])
+            record = textual.get(key)
+            react_record = by_id.get(record_id)
+            textual_changed = record is not None and adapter.textual_digest(record) != entry['textual_digest']
+            react_changed_here = react_record is not None and record_digest(react_record) != entry['react_digest']
+
+            if record is None and react_record is None:
+                continue
+            if record is None:
+                if not react_changed_here:
+                    del by_id[record_id]
+                    react_changed = True
+                    self.report[f"{kind}.deleted_from_react"] += 1
+                    continue
+                # Edited in React after being deleted here: the edit wins
+                record = adapter.to_textual(react_record, None)
+                put_textual(record)
+            elif react_record is None:
+                if not textual_changed:
+                    deletes.append(record)
+                    claimed.add(key)
+                    self.report[f"{kind}.deleted_from_textual"] += 1
+                    continue
+                react_record = adapter.to_react(record, None, record_id)
+                put_react(record_id, react_record)
+            elif textual_changed or react_changed_here:
+                if textual_changed and react_changed_here:
+                    self.report[f"{kind}.conflicts"] += 1
+                    debug_log(f"Sync conflict on {kind} {record_id}; {self.prefer} wins")
+                if textual_changed and (not react_changed_here or self.prefer == 'textual'):
+                    react_record = adapter.to_react(record, react_record, record_id)
+                    put_react(record_id, react_record)
+                else:
+                    new_record = adapter.to_textual(react_record, record)
+                    put_textual(new_record, record)
+                    record = new_record
+            else:
+                new_entries[record_id] = entry
+                claimed.add(key)
+                continue
+            remember(record_id, record, react_record)
+
+        # Records new in React, then records new here
+        for record_id in list(order):
+            if record_id in entries or record_id in new_entries or record_id not in by_id:
+                continue
+            try:
+                record = adapter.to_textual(by_id[record_id], None)
+            except Exception as e:
+                self.report[f"{kind}.skipped"] += 1
+                debug_log(f"Cannot place {kind} {record_id} in this book: {e}")
+                continue
+            key = adapter.key(record)
+            if key in claimed:
+                self.report[f"{kind}.skipped"] += 1
+                debug_log(f"{kind} {record_id} lands on an already synced record {key}")
+                continue
+            existing = textual.get(key)
+            if existing is not None:
+                # The same record made on both sides before they were ever synced
+                if self.prefer == 'textual':
+                    put_react(record_id, adapter.to_react(existing, by_id[record_id], record_id))
+                    record = existing
+                else:
+                    put_textual(record, existing)
+            else:
+                put_textual(record)
+            remember(record_id, record, by_id[record_id])
+
+        for key, record in textual.items():
+            if key in claimed:
+                continue
+            record_id = adapter.new_id(record, by_id)
+            react_record = adapter.to_react(record, None, record_id)
+            put_react(record_id, react_record)
+            remember(record_id, record, react_record)
+
+        react = [by_id[record_id] for record_id in order if record_id in by_id] + untracked
+        return new_entries, react, (upserts, deletes), react_changed
+
+    def _textual_highlights(self) -> dict:
+        records = {}
+        for page_num, highlight in self.backend.iter_highlights():
+            record = (page_num, tuple(self.backend.resolve_highlight(highlight)))
+            records[(page_num,) + tuple(highlight[0])] = record
+        return records
+
+    # Reading position
+
+    def _textual_progress(self):
+        if self.position_store is None:
+            return None
+        anchor = self.position_store.load()
+        if anchor is None or anchor.paragraph_count != self.cfi_index.paragraph_count:
+            return None
+        return anchor
+
+    def _sync_progress(self, state: dict, change_id: int) -> None:
+        entry = state.get('progress') or {}
+        anchor = self._textual_progress()
+        react = self.react.load('progress')
+        textual_digest = record_digest([anchor.paragraph, anchor.offset]) if anchor else None
+        react_digest = record_digest(react.get('location')) if react else None
+        textual_changed = anchor is not None and textual_digest != entry.get('textual_digest')
+        react_changed = react is not None and react_digest != entry.get('react_digest')
+        if not (textual_changed or react_changed):
+            return
+
+        textual_ms = int(anchor.saved_at * 1000) if anchor else -1
+        react_ms = int(react.get('timestamp', 0)) if react_changed else -1
+        if not react_changed:
+            use_textual = True
+        elif not textual_changed:
+            use_textual = False
+        else:
+            use_textual = textual_ms > react_ms or (textual_ms == react_ms and self.prefer == 'textual')
+
+        if use_textual:
+            react = {'location': self.cfi_index.to_cfi(anchor.paragraph, anchor.offset),
+                     'timestamp': textual_ms, 'savedAt': _iso(textual_ms)}
+            if not self.dry_run:
+                self.react.save('progress', react)
+            self.report['progress.to_react'] += 1
+        else:
+            paragraph, offset = self.cfi_index.to_position(react['location'])
+            page_num = self.paginator.paragraph_to_page(paragraph)
+            anchor = ReadingAnchor(page_num, len(self.paginator.page_starts), paragraph, offset,
+                                   self.cfi_index.paragraph_count, 0, react_ms / 1000)
+            if not self.dry_run:
+                if self.position_store is not None:
+                    self.position_store.save(anchor)
+                self.backend.save_current_page(page_num)
+            self.report['progress.to_textual'] += 1
+        state['progress'] = {
+            'textual_digest': record_digest([anchor.paragraph, anchor.offset]) if anchor else None,
+            'react_digest': record_digest(react.get('location')),
+            'change': change_id,
+        }
+
+    # Running
+
+    def run(self) -> Counter:
+        """Sync once; return counts of what moved in each direction."""
+        state = self.load_state()
+        change_id = state['change_id'] + 1
+        self.report = Counter()
+
+        # Marks first: new notes are filed under the mark before them
+        react_marks = self.react.load('marks')
+        marks = {mark_key(mark): tuple(mark) for mark in self.backend.load_marks()}
+        mark_entries, react_marks, mark_writes, marks_changed = self._reconcile(
+            _MarkAdapter(self), state['marks'], marks, react_marks, change_id)
+        self._react_marks = react_marks
+        self._mark_positions = None
+
+        react_notes = self.react.load('notes')
+        highlight_entries, react_notes, highlight_writes, notes_changed = self._reconcile(
+            _HighlightAdapter(self), state['highlights'], self._textual_highlights(),
+            react_notes, change_id)
+
+        if not self.dry_run:
+            _MarkAdapter(self).write(self.backend, *mark_writes)
+            _HighlightAdapter(self).write(self.backend, *highlight_writes)
+            if marks_changed:
+                self.react.save('marks', react_marks)
+            if notes_changed:
+                self.react.save('notes', react_notes)
+
+        progress_before = state.get('progress')
+        self._sync_progress(state, change_id)
+
+        changed = (marks_changed or notes_changed or any(mark_writes) or any(highlight_writes)
+                   or state.get('progress') != progress_before
+                   or mark_entries != state['marks'] or highlight_entries != state['highlights'])
+        if changed and not self.dry_run:
+            state.update(change_id=change_id, marks=mark_entries, highlights=highlight_entries,
+                         synced_at=self.now_ms())
+            self.save_state(state)
+        debug_log(f"Sync run {change_id}: {dict(self.report) or 'nothing to do'}")
+        return self.report
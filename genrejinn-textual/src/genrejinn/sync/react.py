@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""The React reader's JSON stores."""
+
+import json
+import os
+from pathlib import Path
+
+from ..storage.atomic import atomic_write
+from ..storage.locking import ConflictError, file_version
+from ..utils.debug import debug_log
+
+
+STORE_FILES = {
+    'notes': 'notes.json',
+    'marks': 'marks.json',
+    'progress': 'reading-progress.json',
+}
+
+
+class ReactStore:
+    """Read and write ``notes.json``, ``marks.json`` and ``reading-progress.json``.
+
+    Files are written the way the React server writes them (two-space
+    indented JSON), but through a temp file and rename. A file that changed
+    since it was read is not overwritten; ``ConflictError`` is raised and
+    the sync can be run again.
+    """
+
+    def __init__(self, data_dir: str):
+        self.data_dir = Path(data_dir)
+        self._versions = {}
+
+    def path(self, store: str) -> Path:
+        return self.data_dir / STORE_FILES[store]
+
+    def load(self, store: str):
+        """Contents of a store; an empty list (or None for progress) if missing."""
+        path = self.path(store)
+        self._versions[store] = file_version(path)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None if store == 'progress' else []
+
+    def save(self, store: str, data) -> None:
+        path = self.path(store)
+        if file_version(path) != self._versions.get(store):
+            raise ConflictError(store, [STORE_FILES[store]])
+        mode = os.stat(path).st_mode & 0o777 if path.exists() else None
+        atomic_write(path, json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'))
+        if mode is not None:
+            # Keep the React server's permissions rather than the temp file's
+            os.chmod(path, mode)
+        self._versions[store] = file_version(path)
+        debug_log(f"Wrote {path}")
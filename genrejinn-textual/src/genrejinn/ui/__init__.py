@@ -3,5 +3,6 @@
 from .widgets import ClickableImage
 from .themes import AkiraTheme
 from .layout import MainLayout
+from .stats import StorageStatsScreen
 
-__all__ = ["ClickableImage", "AkiraTheme", "MainLayout"]
\ No newline at end of file
+__all__ = ["ClickableImage", "AkiraTheme", "MainLayout", "StorageStatsScreen"]
\ No newline at end of file
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Storage statistics panel."""
+
+from textual.app import ComposeResult
+from textual.containers import Vertical
+from textual.screen import ModalScreen
+from textual.widgets import Static
+
+from .themes import AkiraTheme
+from ..storage.metrics import metrics
+from ..utils.debug import debug_log
+
+
+class StorageStatsScreen(ModalScreen):
+    """Live view of storage call counts, latencies and bytes written."""
+
+    BINDINGS = [
+        ("escape", "dismiss", "Close"),
+        ("d", "dump", "Dump JSON"),
+        ("r", "reset", "Reset"),
+    ]
+
+    DEFAULT_CSS = f"""
+    StorageStatsScreen {{
+        align: center middle;
+    }}
+
+    #stats-panel {{
+        width: 90;
+        height: auto;
+        max-height: 90%;
+        padding: 1 2;
+        border: solid {AkiraTheme.COLORS['foreground']};
+        background: {AkiraTheme.COLORS['background']};
+        color: {AkiraTheme.COLORS['foreground']};
+    }}
+
+    #stats-help {{
+        color: {AkiraTheme.COLORS['blue']};
+        margin-top: 1;
+    }}
+    """
+
+    def __init__(self, dump_path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.dump_path = dump_path
+
+    def compose(self) -> ComposeResult:
+        with Vertical(id="stats-panel"):
+            yield Static("Storage statistics", id="stats-title")
+            yield Static(metrics.format_table(), id="stats-table")
+            yield Static(f"d: dump to {self.dump_path}   r: reset   esc: close", id="stats-help")
+
+    def on_mount(self) -> None:
+        self.set_interval(1.0, self._refresh_table)
+
+    def _refresh_table(self) -> None:
+        self.query_one("#stats-table", Static).update(metrics.format_table())
+
+    def action_dump(self) -> None:
+        try:
+            metrics.dump_json(self.dump_path)
+            self.query_one("#stats-help", Static).update(f"Wrote {self.dump_path}")
+        except Exception as e:
+            debug_log(f"Error dumping storage metrics: {e}")
+            self.query_one("#stats-help", Static).update(f"Dump failed: {e}")
+
+    def action_reset(self) -> None:
+        metrics.reset()
+        self._refresh_table()
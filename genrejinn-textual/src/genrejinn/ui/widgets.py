@@ -9,6 +9,9 @@ from textual.containers import Vertical
 from textual.widgets import Static
 from textual.events import Click
 
+from ..storage.decoded_images import decoded_images
+from ..utils.debug import debug_log
+
 # Try to import image widgets
 try:
     from textual_image.widget import Image as TextualImage
@@ -23,13 +26,6 @@ except ImportError:
     IMAGEVIEW_AVAILABLE = False
 
 
-def debug_log(message):
-    """Debug logging function."""
-    with open('data/log.txt', 'a') as f:
-        f.write(f"{message}\n")
-        f.flush()
-
-
 class ClickableImage(Vertical):
     """A clickable image widget that opens URL when clicked."""
 
@@ -38,9 +34,9 @@ class ClickableImage(Vertical):
         self.image_url = image_url
         self.image_path = image_path
 
-        # Create the actual image widget
+        # Create the actual image widget, from pixels decoded once per process
         if TEXTUAL_IMAGE_AVAILABLE:
-            self.image_widget = TextualImage(image_path)
+            self.image_widget = TextualImage(decoded_images.get(image_path) or image_path)
         elif IMAGEVIEW_AVAILABLE:
             self.image_widget = ImageViewer(image_path)
         else:
@@ -11,15 +11,17 @@ class DebugLogger:
     """Centralized debug logging for GenreJinn."""
 
     def __init__(self, log_path: str = None):
-        self.log_path = log_path or "data/log.txt"
+        self.log_path = log_path or os.path.join(os.environ.get('GENREJINN_DATA_DIR', 'data'), "log.txt")
         self.log_dir = Path(self.log_path).parent
         self.log_dir.mkdir(parents=True, exist_ok=True)
+        # Server sessions share one log; tag their lines with the process id
+        self.prefix = f"[{os.getpid()}] " if os.environ.get('GENREJINN_SERVER_MODE') == '1' else ""
 
     def log(self, message: str) -> None:
         """Write a debug message to the log file."""
         try:
             with open(self.log_path, 'a') as f:
-                f.write(f"{message}\n")
+                f.write(f"{self.prefix}{message}\n")
                 f.flush()
         except Exception as e:
             # Fallback to print if logging fails
@@ -3,12 +3,7 @@
 
 """Search functionality for GenreJinn."""
 
-
-def debug_log(message):
-    """Debug logging function."""
-    with open('data/log.txt', 'a') as f:
-        f.write(f"{message}\n")
-        f.flush()
+from .debug import debug_log
 
 
 class SearchEngine:
@@ -7,12 +7,7 @@ import os
 import sys
 import argparse
 
-
-def debug_log(message):
-    """Debug logging function."""
-    with open('data/log.txt', 'a') as f:
-        f.write(f"{message}\n")
-        f.flush()
+from .debug import debug_log
 
 
 class ServerManager:
@@ -29,6 +24,14 @@ class ServerManager:
         """Setup environment variables for server mode."""
         os.environ['GENREJINN_SERVER_MODE'] = '1'
 
+    def describe_readers(self) -> str:
+        """How server sessions map to annotation stores, for the startup banner."""
+        user_id = os.environ.get('GENREJINN_USER_ID')
+        if user_id:
+            return f"Every session reads and writes the annotations of reader '{user_id}'"
+        return ("Every session shares reader 'local' and sees the same annotations for each book; "
+                "set GENREJINN_USER_ID to serve a separate reader")
+
     def get_server_config(self) -> dict:
         """Get server configuration from environment or defaults."""
         return {
@@ -42,16 +45,36 @@ class ServerManager:
         """Parse command line arguments for server mode."""
         parser = argparse.ArgumentParser(description='GenreJinn EPUB Reader')
         parser.add_argument('--server', action='store_true',
-                          help='Run in server mode for web browser access')
+                          help='Run in server mode for web browser access; all sessions share one '
+                               "reader's annotations per book unless GENREJINN_USER_ID names another")
         parser.add_argument('--host', default='127.0.0.1',
                           help='Host address for server mode (default: 127.0.0.1)')
         parser.add_argument('--port', type=int, default=8000,
                           help='Port for server mode (default: 8000)')
         parser.add_argument('--public-url',
                           help='Public URL for server mode (e.g., https://blakelawyer.dev/genrejinn)')
+        parser.add_argument('--daemon', action='store_true',
+                          help='Share one annotation daemon between server sessions')
         return parser.parse_args()
 
-    def run_server_mode(self, host: str, port: int, public_url: str = None) -> None:
+    def start_annotation_daemon(self):
+        """Start an annotation daemon and point child sessions at it."""
+        from ..storage import get_storage_config
+        from ..storage.daemon import AnnotationDaemon
+
+        config = get_storage_config()
+        # The daemon writes with the configured backend; sessions talk to the daemon
+        backend = config['backend'] if config['backend'] != 'daemon' else 'binary'
+        daemon = AnnotationDaemon(config['data_dir'], config['daemon_socket'] or None,
+                                  backend, config['save_window'])
+        daemon.start()
+        os.environ['GENREJINN_STORAGE_BACKEND'] = 'daemon'
+        os.environ['GENREJINN_DAEMON_SOCKET'] = str(daemon.socket_path)
+        print(f"Annotation daemon on {daemon.socket_path} ({backend})")
+        return daemon
+
+    def run_server_mode(self, host: str, port: int, public_url: str = None,
+                        daemon: bool = False) -> None:
         """Run the application in server mode using textual-serve."""
         try:
             from textual_serve.server import Server
@@ -62,10 +85,19 @@ class ServerManager:
         print(f"Starting GenreJinn server on {host}:{port}")
         if public_url:
             print(f"Public URL: {public_url}")
+        print(self.describe_readers())
 
         # Set environment variable that the subprocess can detect
         self.setup_server_environment()
 
+        annotation_daemon = None
+        if daemon:
+            try:
+                annotation_daemon = self.start_annotation_daemon()
+            except Exception as e:
+                debug_log(f"Could not start annotation daemon: {e}")
+                print(f"Annotation daemon not started ({e}); sessions will use the stores directly")
+
         # Create server with current script as command
         server = Server(
             command=f'python {sys.argv[0]}',
@@ -73,7 +105,11 @@ class ServerManager:
             port=port,
             public_url=public_url
         )
-        server.serve()
+        try:
+            server.serve()
+        finally:
+            if annotation_daemon is not None:
+                annotation_daemon.stop()
 
     def should_enable_link_detection(self) -> bool:
         """Determine if link detection should be enabled (server mode)."""